@@ -0,0 +1,202 @@
+import asyncio
+import base64
+import binascii
+import contextlib
+import json
+import os
+
+from starlette.applications import Starlette
+from starlette.requests import Request
+from starlette.responses import JSONResponse, Response, StreamingResponse
+from starlette.routing import Route, Mount
+from a2wsgi import WSGIMiddleware
+
+#the Flask app and all of its in-memory state: model snapshots, dedup index, stats bus, accuracy cache
+from app import (app as flask_app, db, ingest, inference, validation_queue, learning_engine, stats_events, maintenance,
+                 text_model, image_model, ALLOWED_EXTENSIONS, INTERACTIVE, BULK, InferenceOverloaded)
+from utils.async_db import AsyncDBManager
+from utils.json_utils import pack_emotions, pack_faces
+from utils.validation_queue import LeaseError
+
+#asyncio JSON API for programmatic clients, with the Flask UI mounted under it in the same process
+#waiting for inference or SQLite costs a coroutine, not a thread, so one process can hold
+#thousands of in-flight requests while the scheduler keeps the actual forward passes bounded
+#run: uvicorn api_service:api --app-dir app --port 8001
+#this process serves everything and owns learning, promotion and maintenance; don't run app.py next to it
+#on the same data directory, a second process would keep its own (stale) models and index
+
+adb = AsyncDBManager(db)
+
+#threads serving the mounted Flask app, i.e. Flask requests in progress at once (a2wsgi's default is 10)
+WSGI_WORKERS = int(os.environ.get('WSGI_WORKERS', 32))
+
+CONTENT_TYPE_EXTENSIONS = {'image/jpeg': 'jpg', 'image/jpg': 'jpg', 'image/png': 'png'}
+
+def _priority(request, payload=None):
+    priority = request.headers.get('x-priority') or (payload or {}).get('priority') or ''
+    return BULK if str(priority).lower() == 'bulk' else INTERACTIVE
+
+class BodyTooLarge(Exception):
+    pass
+
+async def _read_body(request):
+    #request body up to the Flask app's MAX_CONTENT_LENGTH, BodyTooLarge past it
+    #Content-Length is checked first, the stream is still counted for chunked or lying clients
+    limit = flask_app.config['MAX_CONTENT_LENGTH']
+    declared = request.headers.get('content-length')
+    if declared is not None and declared.isdigit() and int(declared) > limit:
+        raise BodyTooLarge()
+    chunks = []
+    size = 0
+    async for chunk in request.stream():
+        size += len(chunk)
+        if size > limit:
+            raise BodyTooLarge()
+        chunks.append(chunk)
+    return b''.join(chunks)
+
+async def _json_body(request):
+    try:
+        payload = json.loads(await _read_body(request))
+    except ValueError:
+        return None
+    return payload if isinstance(payload, dict) else None
+
+def _error(message, status_code=400):
+    return JSONResponse({'error': message}, status_code=status_code)
+
+def _analysis_response(request, analysis_id, analysis, stored, media_type):
+    #JSON by default; with Accept: application/octet-stream the scores come packed (json_utils.pack_emotions for
+    #text, pack_faces for images) and the rest goes in headers, X-Emotion-Labels is the score order
+    emotions = json.loads(analysis['emotion_data'])
+    if 'application/octet-stream' not in request.headers.get('accept', ''):
+        return JSONResponse({
+            'analysis_id': analysis_id,
+            'model_version': analysis['model_version'],
+            'duplicate_of': stored.get('duplicate_of'),
+            'emotions': emotions
+        })
+
+    labels = text_model.emotions if media_type == 'text' else image_model.emotions
+    body = pack_emotions(emotions, labels) if media_type == 'text' else pack_faces(emotions, labels)
+    headers = {'X-Analysis-Id': str(analysis_id), 'X-Model-Version': analysis['model_version'],
+               'X-Emotion-Labels': ','.join(labels)}
+    if stored.get('duplicate_of') is not None:
+        headers['X-Duplicate-Of'] = str(stored['duplicate_of'])
+    return Response(body, media_type='application/octet-stream', headers=headers)
+
+async def analyze_text(request: Request):
+    #{"text": "..."} -> analysis id and emotions
+    payload = await _json_body(request)
+    text_content = (payload or {}).get('text')
+    if not isinstance(text_content, str) or not text_content.strip():
+        return _error('No text provided')
+
+    stored = await adb.run(ingest.store_text, text_content)
+    analysis_id = await adb.run(ingest.reuse_analysis, stored, 'text')
+    if analysis_id is None:
+        analyzed = await inference.run_async('text', ingest.analyze_text, text_content, priority=_priority(request, payload))
+        analysis_id = await adb.run(ingest.record_text, stored, analyzed)
+
+    analysis = await adb.get_analysis(analysis_id)
+    return _analysis_response(request, analysis_id, analysis, stored, 'text')
+
+async def analyze_image(request: Request):
+    #raw image body (Content-Type image/jpeg or image/png) or {"image_base64": "...", "extension": "jpg"}
+    content_type = request.headers.get('content-type', '').split(';')[0].strip().lower()
+    payload = None
+
+    if content_type in CONTENT_TYPE_EXTENSIONS:
+        image_bytes = await _read_body(request)
+        extension = CONTENT_TYPE_EXTENSIONS[content_type]
+    else:
+        payload = await _json_body(request)
+        if not payload or 'image_base64' not in payload:
+            return _error('No image provided')
+        try:
+            image_bytes = base64.b64decode(payload['image_base64'], validate=True)
+        except (binascii.Error, TypeError):
+            return _error('image_base64 is not valid base64')
+        extension = str(payload.get('extension', 'jpg')).lower()
+
+    if extension not in ALLOWED_EXTENSIONS['image']:
+        return _error('Invalid file type. Only JPG and PNG files are allowed.')
+    if not image_bytes:
+        return _error('Empty image')
+
+    stored = await adb.run(ingest.store_image, image_bytes, extension)
+    analysis_id = await adb.run(ingest.reuse_analysis, stored, 'image')
+    if analysis_id is None:
+        raw_results = await inference.run_async('image', ingest.analyze_image, stored, priority=_priority(request, payload))
+        analysis_id = await adb.run(ingest.record_image, stored, raw_results)
+
+    analysis = await adb.get_analysis(analysis_id)
+    return _analysis_response(request, analysis_id, analysis, stored, 'image')
+
+async def validate(request: Request):
+    #{"validations": [{"analysis_id": 1, "emotions": {...} or [{...}, ...]}, ...]} in one transaction
+    payload = await _json_body(request)
+    validations = (payload or {}).get('validations')
+    if not isinstance(validations, list) or not validations:
+        return _error('No validations provided')
+
+    #same annotator identity as the Flask /api/validation/next that handed out the leases
+    annotator = payload.get('annotator') or (request.client.host if request.client else None)
+    try:
+        saved = await adb.run(validation_queue.submit, validations, annotator)
+    except LeaseError as e:
+        return _error(str(e), 409)
+    except (KeyError, TypeError, ValueError) as e:
+        return _error(f'Invalid validation: {e}')
+
+    #learn() lets one caller at a time through, Flask routes included
+    models_updated = False
+    if await adb.run(learning_engine.should_learn):
+        models_updated = await asyncio.get_running_loop().run_in_executor(None, learning_engine.learn)
+
+    return JSONResponse({'saved': saved, 'models_updated': bool(models_updated)})
+
+async def stats(request: Request):
+    snapshot, _ = await adb.run(stats_events.snapshot)
+    return JSONResponse(snapshot)
+
+async def stats_stream(request: Request):
+    #same SSE stream as the Flask /api/stats/stream, served here so an open dashboard is a coroutine:
+    #through the WSGI mount every connection would hold one of its worker threads for as long as it stays open
+    return StreamingResponse(stats_events.astream(), media_type='text/event-stream',
+                             headers={'Cache-Control': 'no-cache', 'X-Accel-Buffering': 'no'})
+
+async def body_too_large(request: Request, exc: BodyTooLarge):
+    limit = flask_app.config['MAX_CONTENT_LENGTH']
+    return _error(f'Request body larger than {limit // (1024 * 1024)}MB', 413)
+
+async def inference_overloaded(request: Request, exc: InferenceOverloaded):
+    return JSONResponse({'error': str(exc), 'retry_after': exc.retry_after}, status_code=503,
+                        headers={'Retry-After': str(exc.retry_after)})
+
+@contextlib.asynccontextmanager
+async def lifespan(app):
+    await adb.create_tables()
+    maintenance.start(flask_app.config['MAINTENANCE_INTERVAL'])
+    yield
+    adb.close()
+
+api = Starlette(
+    routes=[
+        Route('/api/v1/analyze/text', analyze_text, methods=['POST']),
+        Route('/api/v1/analyze/image', analyze_image, methods=['POST']),
+        Route('/api/v1/validations', validate, methods=['POST']),
+        Route('/api/v1/stats', stats, methods=['GET']),
+        #matched before the mount, long-lived streams must not sit on the WSGI worker threads
+        Route('/api/stats/stream', stats_stream, methods=['GET']),
+        #everything else (HTML UI, /api/* JSON routes) is the Flask app, run on WSGI_WORKERS threads;
+        #those are short requests, a thread is only held while one of them is being answered
+        Mount('/', app=WSGIMiddleware(flask_app, workers=WSGI_WORKERS))
+    ],
+    exception_handlers={InferenceOverloaded: inference_overloaded, BodyTooLarge: body_too_large},
+    lifespan=lifespan
+)
+
+if __name__ == '__main__':
+    import uvicorn
+    uvicorn.run(api, host='127.0.0.1', port=8001)
@@ -1,12 +1,25 @@
-from flask import Flask, render_template, request, redirect, url_for, jsonify, flash
+from flask import Flask, render_template, request, redirect, url_for, jsonify, flash, send_from_directory, send_file, abort, Response
+import io
 import os
-import uuid
+import mimetypes
 import json
+import click
 from datetime import datetime
 from werkzeug.utils import secure_filename
 
 from utils.db_manager import DBManager
 from utils.learning_engine import LearningEngine
+from utils.face_utils import build_face_payloads, parse_face_form
+from utils.storage import LocalObjectStore, UploadStorage
+from utils.thumbnails import ThumbnailCache
+from utils.validation_queue import ValidationQueue, LeaseError, check_validated_emotions
+from utils.stats_events import StatsEventBus
+from utils.accuracy_history import AccuracyHistory
+from utils.inference_scheduler import InferenceScheduler, InferenceOverloaded, INTERACTIVE, BULK
+from utils.ingest import IngestService
+from utils.tracing import TraceRecorder, image_dimensions
+from utils.dedup import DedupIndex
+from utils.maintenance import PackArchive, MaintenanceRunner
 
 from models.text_emotion_model import TextEmotionModel
 from models.image_emotion_model import ImageEmotionModel
@@ -16,13 +29,67 @@ app.secret_key = "emotion_dataset_creator_secret_key"
 app.config['UPLOAD_FOLDER'] = os.path.join('app', 'static', 'uploads')
 app.config['MAX_CONTENT_LENGTH'] = 16 * 1024 * 1024  # 16MB max upload size
 
+app.config['INLINE_TEXT_LIMIT'] = 64 * 1024  # texts up to 64KB are kept in SQLite
+
 db = DBManager('data/emotion_data.db')
 
+#accuracy timeline, cached until the next model version is recorded
+#registered first so the cache is dropped before dashboards hear about the new version
+accuracy_history = AccuracyHistory(db)
+db.add_listener(accuracy_history.on_db_event)
+
+#live dashboard stats, kept current from the write path and pushed over SSE
+stats_events = StatsEventBus(db.get_statistics)
+db.add_listener(stats_events.publish)
+
+#old validated uploads are moved into zip packs here, reads fall back to them
+app.config['ARCHIVE_FOLDER'] = os.path.join('data', 'archive')
+archive = PackArchive(db, app.config['ARCHIVE_FOLDER'])
+
+#content-addressed upload store, app/static/uploads/ab/cd/<sha256>.<ext>
+storage = UploadStorage(
+    LocalObjectStore(os.path.dirname(app.config['UPLOAD_FOLDER'])),
+    bucket=os.path.basename(app.config['UPLOAD_FOLDER']),
+    inline_text_limit=app.config['INLINE_TEXT_LIMIT'],
+    archive=archive
+)
+
+#validate page previews, app/static/thumbnails/<upload key>.webp
+app.config['THUMBNAIL_FOLDER'] = os.path.join('app', 'static', 'thumbnails')
+app.config['THUMBNAIL_MAX_AGE'] = 365 * 24 * 60 * 60
+thumbnails = ThumbnailCache(app.config['THUMBNAIL_FOLDER'], max_size=640)
+
 text_model = TextEmotionModel()
 image_model = ImageEmotionModel()
 
 learning_engine = LearningEngine(db, text_model, image_model)
 
+#caps concurrent forward passes per modality, queues the rest (interactive first) and sheds beyond that
+app.config['INFERENCE_LIMITS'] = {'text': 2, 'image': 1}
+app.config['INFERENCE_MAX_QUEUE'] = {'text': 32, 'image': 16}
+inference = InferenceScheduler(app.config['INFERENCE_LIMITS'], app.config['INFERENCE_MAX_QUEUE'])
+
+#near-duplicate uploads (pHash/dHash for images, MinHash for texts) reuse the earlier analysis
+dedup = DedupIndex(db)
+db.add_listener(dedup.on_db_event)
+
+#store -> analyze -> record, shared with the async API service
+ingest = IngestService(db, storage, thumbnails, text_model, image_model, dedup)
+
+#sanitized request traces for offline replay (benchmarks/replay_trace.py), off unless EMOTION_TRACE_FILE is set
+app.config['TRACE_FILE'] = os.environ.get('EMOTION_TRACE_FILE')
+tracer = TraceRecorder(app.config['TRACE_FILE'])
+
+#orphan/empty upload GC, superseded rows, archiving and incremental VACUUM, once a day
+app.config['MAINTENANCE_INTERVAL'] = 24 * 60 * 60
+app.config['ARCHIVE_AFTER_DAYS'] = 90
+maintenance = MaintenanceRunner(db, storage, thumbnails, archive,
+                                archive_after_days=app.config['ARCHIVE_AFTER_DAYS'])
+
+#annotator work queue, items are leased for 5 minutes
+app.config['VALIDATION_LEASE_SECONDS'] = 300
+validation_queue = ValidationQueue(db, storage, lease_seconds=app.config['VALIDATION_LEASE_SECONDS'])
+
 os.makedirs(app.config['UPLOAD_FOLDER'], exist_ok=True)
 
 ALLOWED_EXTENSIONS = {
@@ -33,14 +100,28 @@ ALLOWED_EXTENSIONS = {
 def allowed_file(filename, file_type):
     return '.' in filename and filename.rsplit('.', 1)[1].lower() in ALLOWED_EXTENSIONS[file_type]
 
+def request_priority():
+    #clients doing bulk ingestion mark themselves so interactive uploads go first
+    priority = request.headers.get('X-Priority') or request.form.get('priority', '')
+    return BULK if priority.lower() == 'bulk' else INTERACTIVE
+
+@app.errorhandler(InferenceOverloaded)
+def inference_overloaded(e):
+    #shed load: 503 with a Retry-After estimated from queue depth and recent inference times
+    if request.path.startswith('/api/'):
+        response = jsonify({'error': str(e), 'retry_after': e.retry_after})
+    else:
+        response = app.response_class(f"Server busy, please retry in {e.retry_after} seconds.", mimetype='text/plain')
+    response.status_code = 503
+    response.headers['Retry-After'] = str(e.retry_after)
+    return response
+
 @app.route('/')
 def index():
     return render_template('index.html')
 
 @app.route('/upload', methods=['POST'])
 def upload():
-    from utils.json_utils import json_serialize
-    
     content_type = request.form.get('content_type')
     
     if content_type not in ['text', 'image']:
@@ -53,18 +134,18 @@ def upload():
             flash('No text provided')
             return redirect(url_for('index'))
         
-        #generate a unique ID for this upload
-        unique_id = str(uuid.uuid4())
-        
-        filename = f"{unique_id}.txt"
-        filepath = os.path.join(app.config['UPLOAD_FOLDER'], filename)
-        with open(filepath, 'w', encoding='utf-8') as f:
-            f.write(text_content)
-        
-        emotions = text_model.analyze(text_content)
-        
-        media_id = db.add_media('text', filepath)
-        analysis_id = db.add_analysis(media_id, text_model.version, json_serialize(emotions))
+        priority = request_priority()
+        with tracer.request('upload_text', priority=priority) as event:
+            with tracer.stage('store'):
+                stored = ingest.store_text(text_content)
+            event.update(content_hash=stored['hash'], size=len(text_content.encode('utf-8')))
+            analysis_id = ingest.reuse_analysis(stored, 'text')
+            if analysis_id is None:
+                with tracer.stage('analyze'):
+                    analyzed = inference.run('text', ingest.analyze_text, text_content, priority=priority)
+                with tracer.stage('record'):
+                    analysis_id = ingest.record_text(stored, analyzed)
+            event.update(analysis_id=analysis_id, duplicate_of=stored.get('duplicate_of'))
         
         return redirect(url_for('validate', analysis_id=analysis_id))
     
@@ -83,22 +164,23 @@ def upload():
             flash('Invalid file type. Only JPG and PNG files are allowed.')
             return redirect(url_for('index'))
         
-        #generate a unique ID for this upload
-        unique_id = str(uuid.uuid4())
         extension = file.filename.rsplit('.', 1)[1].lower()
-        filename = f"{unique_id}.{extension}"
-        filepath = os.path.join(app.config['UPLOAD_FOLDER'], filename)
-        
-        file.save(filepath)
-        
-        print(f"Saved image to {filepath}")
-        
-        emotions = image_model.analyze(filepath)
-        
-        print(f"Image analysis complete, results: {type(emotions)}")
-        
-        media_id = db.add_media('image', filepath)
-        analysis_id = db.add_analysis(media_id, image_model.version, json_serialize(emotions))
+        priority = request_priority()
+        with tracer.request('upload_image', priority=priority, extension=extension) as event:
+            image_bytes = file.read()
+            with tracer.stage('store'):
+                stored = ingest.store_image(image_bytes, extension)
+            event.update(content_hash=stored['hash'], size=len(image_bytes))
+            if tracer.enabled:
+                event['width'], event['height'] = image_dimensions(image_bytes)
+            analysis_id = ingest.reuse_analysis(stored, 'image')
+            if analysis_id is None:
+                with tracer.stage('analyze'):
+                    raw_results = inference.run('image', ingest.analyze_image, stored, priority=priority)
+                with tracer.stage('record'):
+                    analysis_id = ingest.record_image(stored, raw_results)
+                event['faces'] = len(raw_results)
+            event.update(analysis_id=analysis_id, duplicate_of=stored.get('duplicate_of'))
         
         return redirect(url_for('validate', analysis_id=analysis_id))
 
@@ -115,63 +197,296 @@ def validate(analysis_id):
     text_content = None
     if media['type'] == 'text':
         try:
-            with open(media['path'], 'r', encoding='utf-8') as f:
-                text_content = f.read()
+            text_content = storage.read_text(media)
         except Exception as e:
             print(f"Error reading text file: {e}")
             text_content = "Error reading file content."
     
+    emotions = json.loads(analysis['emotion_data'])
+    
     data = {
         'analysis_id': analysis_id,
+        'duplicate_of': media.get('duplicate_of'),
         'media_type': media['type'],
-        'media_path': os.path.basename(media['path']),
+        'media_path': storage.key_from_path(media['path']),
         'text_content': text_content,
-        'emotions': json.loads(analysis['emotion_data'])
+        'emotions': emotions,
+        'faces': build_face_payloads(emotions) if media['type'] == 'image' else []
     }
     
     return render_template('validate.html', data=data)
 
 
+@app.route('/thumbnails/<path:key>')
+def thumbnail(key):
+    #cached preview for an upload, generated on first request for older uploads
+    try:
+        if not os.path.exists(thumbnails.path_for(key)):
+            thumbnails.create(key, storage.read(key))
+        relative_path = thumbnails.relative_path(key)
+    except Exception as e:
+        print(f"Error serving thumbnail for {key}: {e}")
+        abort(404)
+    
+    #conditional=True gives ETag/Last-Modified handling and range requests
+    response = send_from_directory(thumbnails.cache_dir, relative_path, mimetype=thumbnails.mimetype,
+                                   conditional=True, max_age=app.config['THUMBNAIL_MAX_AGE'])
+    #upload keys are content hashes, the preview behind a URL never changes
+    response.cache_control.public = True
+    response.cache_control.immutable = True
+    return response
+
+
+@app.route('/media/<path:key>')
+def media_file(key):
+    #original upload, from app/static/uploads or, once maintenance has archived it, from its pack
+    try:
+        data = storage.read(key)
+    except (OSError, ValueError, KeyError) as e:
+        print(f"Error serving upload {key}: {e}")
+        abort(404)
+    
+    response = send_file(io.BytesIO(data), mimetype=mimetypes.guess_type(key)[0] or 'application/octet-stream',
+                         conditional=True, etag=key.rsplit('/', 1)[-1], max_age=app.config['THUMBNAIL_MAX_AGE'])
+    #upload keys are content hashes, the bytes behind a URL never change
+    response.cache_control.public = True
+    response.cache_control.immutable = True
+    return response
+
+
 @app.route('/submit_validation', methods=['POST'])
 def submit_validation():
     from utils.json_utils import json_serialize
     
-    analysis_id = request.form.get('analysis_id')
+    analysis_id = request.form.get('analysis_id', type=int)
     validated_emotions = {}
     
-    #get all emotion sliders from the form
-    for key, value in request.form.items():
-        if key.startswith('emotion_'):
-            emotion = key.replace('emotion_', '')
-            validated_emotions[emotion] = float(value) / 100  
-    
-    #save validation to database using custom JSON serialization
-    db.add_validation(analysis_id, json_serialize(validated_emotions))
+    try:
+        #get all emotion sliders from the form
+        for key, value in request.form.items():
+            if key.startswith('emotion_'):
+                emotion = key.replace('emotion_', '')
+                validated_emotions[emotion] = float(value) / 100  
+        
+        #images send one set of sliders per face
+        face_emotions = parse_face_form(request.form)
+        if face_emotions:
+            validated_emotions = face_emotions
+        
+        media_type = db.get_analysis_types([analysis_id]).get(analysis_id)
+        if media_type is None:
+            raise ValueError(f"Unknown analysis {analysis_id}")
+        check_validated_emotions(media_type, validated_emotions, analysis_id)
+    except ValueError as e:
+        return f"Invalid validation: {e}", 400
     
-    #check if we have enough validations to trigger learning
-    if learning_engine.should_learn():
-        learning_engine.learn()
-        flash('Models have been updated with your feedback!')
+    with tracer.request('submit_validation', analysis_id=analysis_id, emotions=validated_emotions):
+        #save validation to database using custom JSON serialization
+        with tracer.stage('validate'):
+            db.add_validation(analysis_id, json_serialize(validated_emotions))
+        
+        #check if we have enough validations to trigger learning
+        with tracer.stage('learn'):
+            models_updated = learning_engine.should_learn() and learning_engine.learn()
+        if models_updated:
+            flash('Models have been updated with your feedback!')
     
     return redirect(url_for('dashboard'))
 
+@app.route('/api/validation/next')
+def api_validation_next():
+    #lease a batch of unvalidated analyses, most uncertain (smallest top-emotion margin) first
+    batch_size = request.args.get('batch', 10, type=int)
+    annotator = request.args.get('annotator') or request.remote_addr
+    
+    lease_token, items = validation_queue.next_batch(batch_size, annotator)
+    
+    prefetch = []
+    for item in items:
+        item['media_url'] = url_for('media_file', key=item['media_key'])
+        if item['media_type'] == 'image':
+            item['thumbnail_url'] = url_for('thumbnail', key=item['media_key'])
+            prefetch.append(item['thumbnail_url'])
+    
+    response = jsonify({
+        'lease_token': lease_token,
+        'lease_seconds': validation_queue.lease_seconds,
+        'items': items
+    })
+    #let the browser fetch the previews for the rest of the batch while the first item is shown
+    if prefetch:
+        response.headers['Link'] = ', '.join(f'<{url}>; rel=prefetch' for url in prefetch)
+    return response
+
+@app.route('/api/validation/submit', methods=['POST'])
+def api_validation_submit():
+    #write many validations in one transaction
+    payload = request.get_json(silent=True) or {}
+    validations = payload.get('validations', [])
+    
+    if not isinstance(validations, list) or not validations:
+        return jsonify({'error': 'No validations provided'}), 400
+    
+    #same annotator identity as /api/validation/next, the leases were taken out under it
+    annotator = payload.get('annotator') or request.remote_addr
+    try:
+        saved = validation_queue.submit(validations, annotator)
+    except LeaseError as e:
+        return jsonify({'error': str(e)}), 409
+    except (KeyError, TypeError, ValueError) as e:
+        return jsonify({'error': f'Invalid validation: {e}'}), 400
+    
+    #hand back anything else still leased under this token
+    if payload.get('lease_token') and payload.get('release', False):
+        validation_queue.release(payload['lease_token'])
+    
+    learned = learning_engine.should_learn() and learning_engine.learn()
+    
+    return jsonify({'saved': saved, 'models_updated': learned})
+
 @app.route('/dashboard')
 def dashboard():
-    #get stats for dashboard
-    stats = db.get_statistics()
+    #get stats for dashboard, the same cached, incrementally updated snapshot /api/stats and the SSE stream serve
+    stats, _ = stats_events.snapshot()
     
-    #get accuracy improvement data
-    accuracy_data = learning_engine.get_accuracy_data()
+    #get accuracy improvement data (downsampled, cached)
+    accuracy_data = accuracy_history.timeline()
     
     return render_template('dashboard.html', stats=stats, accuracy_data=accuracy_data)
 
 @app.route('/api/stats')
 def api_stats():
     # Get updated stats for AJAX calls
-    stats = db.get_statistics()
+    stats, _ = stats_events.snapshot()
     return jsonify(stats)
 
+@app.route('/api/accuracy/history')
+def api_accuracy_history():
+    #keyset-paginated model version history, pass next_after back as after for the next page
+    return jsonify(accuracy_history.page(
+        request.args.get('model_type'),
+        request.args.get('after', 0, type=int),
+        request.args.get('limit', 100, type=int)
+    ))
+
+@app.route('/api/accuracy/timeline')
+def api_accuracy_timeline():
+    #accuracy over time per model type, downsampled to at most `points` entries each
+    return jsonify(accuracy_history.timeline(request.args.get('points', type=int)))
+
+@app.route('/api/models/shadow')
+def api_models_shadow():
+    #live vs shadow candidate per model type, with per-version agreement against validations
+    return jsonify(learning_engine.get_shadow_status())
+
+@app.route('/api/models/sample')
+def api_models_sample():
+    #per-emotion rows seen / kept in the training samples the correction layers are fit on
+    return jsonify(learning_engine.get_sample_status())
+
+@app.route('/api/inference/metrics')
+def api_inference_metrics():
+    #active/queued inferences, queue wait times and shed counts per modality
+    return jsonify(inference.metrics())
+
+@app.route('/api/search')
+def api_search():
+    #sentence search over text uploads: ?q=keywords&dominant=fear&min_score=0.6&min_joy=0.2&before=<sentence id>&limit=50
+    #served from the sentence index (FTS5 + emotion vectors), no upload files are read
+    emotions = text_model.emotions
+    
+    dominant = request.args.get('dominant') or None
+    if dominant is not None and dominant not in emotions:
+        return jsonify({'error': f'Unknown emotion: {dominant}', 'emotions': emotions}), 400
+    
+    try:
+        min_score = request.args.get('min_score', 0.0, type=float)
+        thresholds = {emotion: float(request.args[f'min_{emotion}']) for emotion in emotions if f'min_{emotion}' in request.args}
+    except ValueError:
+        return jsonify({'error': 'Thresholds must be numbers between 0 and 1'}), 400
+    
+    limit = max(1, min(request.args.get('limit', 50, type=int), 200))
+    results, next_before = db.search_sentences(
+        emotions,
+        keywords=request.args.get('q'),
+        dominant=dominant,
+        min_dominant_score=min_score,
+        thresholds=thresholds,
+        before_id=request.args.get('before', type=int),
+        limit=limit
+    )
+    
+    for result in results:
+        if result['analysis_id'] is not None:
+            result['validate_url'] = url_for('validate', analysis_id=result['analysis_id'])
+    
+    return jsonify({'results': results, 'next_before': next_before})
+
+@app.route('/api/maintenance/report')
+def api_maintenance_report():
+    #what the last maintenance pass removed, archived and reclaimed
+    return jsonify(maintenance.last_report or {})
+
+@app.route('/api/stats/stream')
+def api_stats_stream():
+    #Server-Sent Events: one snapshot, then small coalesced deltas as data is written
+    response = Response(stats_events.stream(), mimetype='text/event-stream')
+    response.headers['Cache-Control'] = 'no-cache'
+    response.headers['X-Accel-Buffering'] = 'no'
+    return response
+
+@app.cli.command('rescore')
+def rescore_command():
+    #re-score all stored images with the latest image correction layer from cached face vectors
+    from utils.rescore import rescore_images
+    
+    db.create_tables()
+    #the live layer and its version, read together
+    snapshot = image_model.snapshot
+    if snapshot.correction_layer is None:
+        print("No image correction layer published yet, nothing to rescore")
+        return
+    
+    version = snapshot.version
+    total = rescore_images(db, image_model, snapshot.correction_layer, version)
+    print(f"Done: {total} images now scored with {version}")
+
+@app.cli.command('index-sentences')
+def index_sentences_command():
+    #build the sentence search index for text uploaded before it existed
+    db.create_tables()
+    total = 0
+    after_id = 0
+    while True:
+        pending = db.get_unindexed_text_media(after_id, limit=100)
+        if not pending:
+            break
+        for media in pending:
+            after_id = media['id']
+            try:
+                sentence_index = ingest.analyze_sentences(storage.read_text(media))
+            except Exception as e:
+                print(f"Skipping media {media['id']}: {e}")
+                continue
+            if sentence_index:
+                total += db.add_sentences(media['id'], media['analysis_id'], *sentence_index, text_model.emotions)
+        print(f"Indexed {total} sentences so far")
+    print(f"Done: {total} sentences indexed")
+
+@app.cli.command('maintenance')
+@click.option('--dry-run', is_flag=True, help='report what would be removed without changing anything')
+def maintenance_command(dry_run):
+    #one maintenance pass now, prints the report
+    db.create_tables()
+    report = maintenance.run(dry_run=dry_run)
+    print(json.dumps(report, indent=2))
+    print(f"Reclaimed {report['freed_bytes'] / (1024 * 1024):.2f} MB" + (" (dry run)" if dry_run else ""))
+
 if __name__ == '__main__':
+    #Flask only (no /api/v1); uvicorn api_service:api serves this app too, run one or the other, never both
     #create tables if they don't exist
     db.create_tables()
+    #only in the serving process, not the debug reloader's parent
+    if os.environ.get('WERKZEUG_RUN_MAIN') == 'true':
+        maintenance.start(app.config['MAINTENANCE_INTERVAL'])
     app.run(debug=True)
\ No newline at end of file
@@ -2,16 +2,16 @@ import sys
 import os
 import numpy as np
 import random
-from PIL import Image
 
 sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
-from utils.json_utils import convert_numpy_types
+from utils.shadow import predict_layers
+from utils.image_preprocess import image_dimensions
+from utils.model_snapshot import SnapshotModel
 
-class ImageEmotionModel:
+class ImageEmotionModel(SnapshotModel):
     def __init__(self):
-        self.version = "image_v1.0"
-        self.correction_layer = None
-        self.emotions = ["angry", "disgust", "fear", "happy", "sad", "surprise", "neutral"]
+        #live correction layer, version and shadow candidate live in self.snapshot (see utils.model_snapshot)
+        super().__init__("image_v1.0", ["angry", "disgust", "fear", "happy", "sad", "surprise", "neutral"])
         
         try:
             sys.path.append(os.path.dirname(os.path.dirname(os.path.dirname(os.path.abspath(__file__)))))
@@ -26,17 +26,20 @@ class ImageEmotionModel:
     
     def analyze(self, image_path):
         #Analyze emotions in image and apply correction if available.
+        analysis_results = self.analyze_raw(image_path)
+        return self.apply_correction(analysis_results)
+    
+    def analyze_raw(self, image_path):
+        #base model predictions for every face, no correction layer applied
         print(f"Analyzing image: {image_path}")
         
-        #get base model predictions
         try:
             if self.has_original_module:
                 print("Using og DeepFace module")
                 analysis_results = self.original_module.analyze_image_emotions(image_path)
                 print(f"analysis results type: {type(analysis_results)}")
                 
-                #i think fixes json issue (?!) converts numpy types to normal python types
-                analysis_results = convert_numpy_types(analysis_results)
+                #numpy types are left as is, json_serialize handles them when results are stored
                 
                 if not analysis_results:
                     print("no analysis results, using fallback")
@@ -46,37 +49,6 @@ class ImageEmotionModel:
                 print("using fallback analysis")
                 analysis_results = self._fallback_analyze(image_path)
             
-            #apply correction layer if available
-            if self.correction_layer is not None and isinstance(analysis_results, list) and len(analysis_results) > 0:
-                if 'emotion' in analysis_results[0]:
-                    base_predictions = analysis_results[0]['emotion']
-                    
-                    # percetange -> [0,1]
-                    normalized_predictions = {}
-                    for emotion in base_predictions:
-                        normalized_predictions[emotion] = base_predictions[emotion] / 100.0
-                    
-                    #convert to feature vector
-                    features = np.array([[normalized_predictions.get(emotion, 0) for emotion in self.emotions]])
-                    
-                    #apply correction
-                    corrected = self.correction_layer.predict(features)[0]
-                    
-                    #convert back to dict since text vers outputs dict
-                    corrected_predictions = {}
-                    for i, emotion in enumerate(self.emotions):
-                        corrected_predictions[emotion] = max(0, min(1, corrected[i]))
-                    
-                    #back to percentages
-                    for emotion in corrected_predictions:
-                        corrected_predictions[emotion] *= 100.0
-                    
-                    #replace emotion data in the og results
-                    analysis_results[0]['emotion'] = corrected_predictions
-                    
-                    #convert numpy types to normal Python types again
-                    analysis_results = convert_numpy_types(analysis_results)
-            
             return analysis_results
                 
         except Exception as e:
@@ -86,11 +58,79 @@ class ImageEmotionModel:
             #return fallback values
             return self._fallback_analyze(image_path)
     
+    def apply_correction(self, analysis_results, snapshot=None):
+        #apply correction layer to every face in one batched call
+        #returns a new list so raw results stay untouched
+        corrected_results, _ = self.apply_correction_with_shadow(analysis_results, shadow=False, snapshot=snapshot)
+        return corrected_results
+    
+    def apply_correction_with_shadow(self, analysis_results, shadow=True, snapshot=None):
+        #correct raw results with the live layer and, when a candidate is in shadow, with it too
+        #all faces and both layers share one feature matrix and one batched call
+        #snapshot: the model state to correct with, read once here if the caller didn't
+        #returns (live results, candidate results or None)
+        if snapshot is None:
+            snapshot = self.snapshot
+        layers = [snapshot.correction_layer, snapshot.candidate_layer if shadow else None]
+        active = [layer for layer in layers if layer is not None]
+        if not active or not isinstance(analysis_results, list) or len(analysis_results) == 0:
+            return analysis_results, None
+        
+        try:
+            #(n_faces, n_emotions) feature matrix
+            features = self.raw_vectors(analysis_results, snapshot.emotions)
+            
+            #apply correction(s), clipped and back to percentages
+            corrected = iter(predict_layers(active, features))
+            outputs = []
+            for layer in layers:
+                if layer is None:
+                    outputs.append(None)
+                else:
+                    outputs.append(self._with_scores(analysis_results, np.clip(next(corrected), 0, 1) * 100.0, snapshot.emotions))
+            
+            live = outputs[0] if outputs[0] is not None else analysis_results
+            return live, outputs[1]
+        
+        except Exception as e:
+            print(f"Error applying image correction: {e}")
+            return analysis_results, None
+    
+    def _with_scores(self, analysis_results, scores, emotions):
+        #copy of the results with each face's emotions replaced by a row of scores
+        results = [dict(face) for face in analysis_results]
+        
+        #convert back to dict since text vers outputs dict
+        for face, face_scores in zip(results, scores.tolist()):
+            if 'emotion' in face:
+                face['emotion'] = dict(zip(emotions, face_scores))
+        
+        return results
+    
+    def raw_vectors(self, analysis_results, emotions=None):
+        #stack per-face emotion scores into a (n_faces, n_emotions) matrix
+        #DeepFace gives percentages, correction layer works in [0,1]
+        emotions = emotions or self.snapshot.emotions
+        rows = []
+        for face in analysis_results:
+            face_emotions = face.get('emotion', {}) if isinstance(face, dict) else {}
+            rows.append([face_emotions.get(emotion, 0) / 100.0 for emotion in emotions])
+        return np.array(rows, dtype=np.float32).reshape(-1, len(emotions))
+    
+    def correct_vectors(self, features, correction_layer=None):
+        #apply a correction layer to a whole matrix of raw vectors in one call
+        #returns clipped percentages in self.emotions order
+        correction_layer = correction_layer if correction_layer is not None else self.correction_layer
+        if correction_layer is None:
+            return np.clip(features, 0, 1) * 100.0
+        corrected = correction_layer.predict(features)
+        return np.clip(corrected, 0, 1) * 100.0
+    
     def _fallback_analyze(self, image_path):
         #generate fallback face emotion predictions for testing
         try:
-            img = Image.open(image_path)
-            width, height = img.size
+            #header only, no decode
+            width, height = image_dimensions(image_path)
             
             #fake face region (center of the image)
             center_x = width // 2
@@ -134,9 +174,3 @@ class ImageEmotionModel:
             emotions = {emotion: 0.0 for emotion in self.emotions}
             emotions["neutral"] = 100.0  #default to neutral
             return [{"emotion": emotions}]
-    
-    def set_correction_layer(self, correction_layer):
-        self.correction_layer = correction_layer
-    
-    def update_version(self, new_version):
-        self.version = new_version
\ No newline at end of file
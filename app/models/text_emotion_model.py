@@ -5,45 +5,79 @@ import numpy as np
 sys.path.append(os.path.dirname(os.path.dirname(os.path.dirname(os.path.abspath(__file__)))))
 import text_to_emotions
 
-class TextEmotionModel:
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+from utils.shadow import predict_layers
+from utils.model_snapshot import SnapshotModel
+
+class TextEmotionModel(SnapshotModel):
     def __init__(self):
-        self.version = "text_v1.0"
-        self.correction_layer = None
-        self.emotions = ["sadness", "joy", "love", "anger", "fear", "surprise"]
+        #live correction layer, version and shadow candidate live in self.snapshot (see utils.model_snapshot)
+        super().__init__("text_v1.0", ["sadness", "joy", "love", "anger", "fear", "surprise"])
     
     def analyze(self, text):
         #Analyze emotions in text and apply correction if available
+        predictions, _ = self.analyze_with_shadow(text, shadow=False)
+        return predictions
+    
+    def analyze_with_shadow(self, text, shadow=True, snapshot=None):
+        #Analyze emotions in text with the live correction layer and, when a candidate is in shadow, with it too
+        #both layers run on the same base predictions in one batched call
+        #snapshot: the model state to score with, read once here if the caller didn't
+        #returns (live predictions, candidate predictions or None)
+        if snapshot is None:
+            snapshot = self.snapshot
+        
         #get base model predictions
         try:
             base_predictions = text_to_emotions.analyze_emotions(text)
             
-            if self.correction_layer is not None:
-                #convert to feature vector
-                features = np.array([[base_predictions.get(emotion, 0) for emotion in self.emotions]])
-                
-                #apply correction
-                corrected = self.correction_layer.predict(features)[0]
-                
-                #back to dict
-                corrected_predictions = {}
-                for i, emotion in enumerate(self.emotions):
-                    corrected_predictions[emotion] = max(0, min(1, corrected[i]))
-                
-                total = sum(corrected_predictions.values())
-                if total > 0:
-                    for emotion in corrected_predictions:
-                        corrected_predictions[emotion] /= total
-                
-                return corrected_predictions
-            else:
-                return base_predictions
+            layers = [snapshot.correction_layer, snapshot.candidate_layer if shadow else None]
+            active = [layer for layer in layers if layer is not None]
+            if not active:
+                return base_predictions, None
+            
+            #convert to feature vector
+            features = np.array([[base_predictions.get(emotion, 0) for emotion in snapshot.emotions]])
+            
+            #apply correction(s)
+            corrected = iter(predict_layers(active, features))
+            results = [self._to_predictions(next(corrected)[0], snapshot.emotions) if layer is not None else None for layer in layers]
+            
+            live = results[0] if results[0] is not None else base_predictions
+            return live, results[1]
         except Exception as e:
             print(f"Error analyzing text: {e}")
             #return defualt vals
-            return {emotion: 0.0 for emotion in self.emotions}
+            return {emotion: 0.0 for emotion in snapshot.emotions}, None
     
-    def set_correction_layer(self, correction_layer):
-        self.correction_layer = correction_layer
+    def analyze_sentences(self, sentences, snapshot=None):
+        #per-sentence predictions for the sentence index, all sentences in one batched pipeline call
+        #live correction applied to the whole matrix at once, rows renormalized like _to_predictions
+        #returns (n_sentences, n_emotions) float32 matrix in self.emotions order
+        if snapshot is None:
+            snapshot = self.snapshot
+        if not sentences:
+            return np.zeros((0, len(snapshot.emotions)), dtype=np.float32)
+        
+        base_predictions = text_to_emotions.analyze_emotions_batch(sentences)
+        features = np.array([[prediction.get(emotion, 0) for emotion in snapshot.emotions] for prediction in base_predictions])
+        
+        if snapshot.correction_layer is not None:
+            corrected = np.clip(predict_layers([snapshot.correction_layer], features)[0], 0, 1)
+            totals = corrected.sum(axis=1, keepdims=True)
+            features = np.divide(corrected, totals, out=np.zeros_like(corrected), where=totals > 0)
+        
+        return features.astype(np.float32)
     
-    def update_version(self, new_version):
-        self.version = new_version
\ No newline at end of file
+    def _to_predictions(self, corrected, emotions):
+        #back to dict
+        corrected_predictions = {}
+        for i, emotion in enumerate(emotions):
+            corrected_predictions[emotion] = max(0, min(1, float(corrected[i])))
+        
+        total = sum(corrected_predictions.values())
+        if total > 0:
+            for emotion in corrected_predictions:
+                corrected_predictions[emotion] /= total
+        
+        return corrected_predictions
@@ -62,84 +62,162 @@ document.addEventListener('DOMContentLoaded', function() {
     }
     
     //dashboard charts
-    const createAccuracyChart = () => {
-        const ctx = document.getElementById('accuracy-chart');
+    const buildAccuracyChart = (ctx, timeline) => {
+        //process data for chart (timeline is oldest first and already downsampled server side)
+        const textVersions = timeline.text;
+        const imageVersions = timeline.image;
         
-        if (!ctx) return;
+        const textDates = textVersions.map(v => new Date(v.date).toLocaleDateString());
+        const textAccuracy = textVersions.map(v => v.accuracy * 100); // Convert to percentage
         
-        //fetch accuracy data from API
-        fetch('/api/stats')
-            .then(response => response.json())
-            .then(data => {
-                //process data for chart
-                const textVersions = data.model_versions.filter(v => v.model_type === 'text');
-                const imageVersions = data.model_versions.filter(v => v.model_type === 'image');
-                
-                const textDates = textVersions.map(v => new Date(v.created_date).toLocaleDateString());
-                const textAccuracy = textVersions.map(v => v.accuracy * 100); // Convert to percentage
-                
-                const imageDates = imageVersions.map(v => new Date(v.created_date).toLocaleDateString());
-                const imageAccuracy = imageVersions.map(v => v.accuracy * 100); // Convert to percentage
-                
-                //create chart
-                const chart = new Chart(ctx, {
-                    type: 'line',
-                    data: {
-                        labels: textDates.length > imageDates.length ? textDates : imageDates,
-                        datasets: [
-                            {
-                                label: 'Text Emotion Accuracy',
-                                data: textAccuracy,
-                                borderColor: '#ff99cc',
-                                backgroundColor: 'rgba(255, 204, 230, 0.2)',
-                                tension: 0.4
-                            },
-                            {
-                                label: 'Image Emotion Accuracy',
-                                data: imageAccuracy,
-                                borderColor: '#17a2b8',
-                                backgroundColor: 'rgba(23, 162, 184, 0.2)',
-                                tension: 0.4
-                            }
-                        ]
+        const imageDates = imageVersions.map(v => new Date(v.date).toLocaleDateString());
+        const imageAccuracy = imageVersions.map(v => v.accuracy * 100); // Convert to percentage
+        
+        //create chart
+        return new Chart(ctx, {
+            type: 'line',
+            data: {
+                labels: textDates.length > imageDates.length ? textDates : imageDates,
+                datasets: [
+                    {
+                        label: 'Text Emotion Accuracy',
+                        data: textAccuracy,
+                        borderColor: '#ff99cc',
+                        backgroundColor: 'rgba(255, 204, 230, 0.2)',
+                        tension: 0.4
+                    },
+                    {
+                        label: 'Image Emotion Accuracy',
+                        data: imageAccuracy,
+                        borderColor: '#17a2b8',
+                        backgroundColor: 'rgba(23, 162, 184, 0.2)',
+                        tension: 0.4
+                    }
+                ]
+            },
+            options: {
+                responsive: true,
+                plugins: {
+                    title: {
+                        display: true,
+                        text: 'Model Accuracy Improvement Over Time',
+                        font: {
+                            size: 16
+                        }
+                    },
+                    tooltip: {
+                        mode: 'index',
+                        intersect: false
+                    }
+                },
+                scales: {
+                    y: {
+                        beginAtZero: true,
+                        max: 100,
+                        title: {
+                            display: true,
+                            text: 'Accuracy (%)'
+                        }
                     },
-                    options: {
-                        responsive: true,
-                        plugins: {
-                            title: {
-                                display: true,
-                                text: 'Model Accuracy Improvement Over Time',
-                                font: {
-                                    size: 16
-                                }
-                            },
-                            tooltip: {
-                                mode: 'index',
-                                intersect: false
-                            }
-                        },
-                        scales: {
-                            y: {
-                                beginAtZero: true,
-                                max: 100,
-                                title: {
-                                    display: true,
-                                    text: 'Accuracy (%)'
-                                }
-                            },
-                            x: {
-                                title: {
-                                    display: true,
-                                    text: 'Date'
-                                }
-                            }
+                    x: {
+                        title: {
+                            display: true,
+                            text: 'Date'
                         }
                     }
-                });
-            })
-            .catch(error => {
-                console.error('Error fetching chart data:', error);
+                }
+            }
+        });
+    };
+    
+    //stat cards and version table, updated in place from the live stream
+    const updateStatCards = (stats) => {
+        ['total_media', 'total_text', 'total_image', 'total_validations'].forEach(key => {
+            const el = document.getElementById('stat-' + key);
+            if (el && stats[key] !== undefined) el.textContent = stats[key];
+        });
+        
+        const accuracy = document.getElementById('stat-avg_accuracy');
+        if (accuracy && stats.avg_accuracy !== undefined) {
+            accuracy.textContent = (stats.avg_accuracy * 100).toFixed(1) + '%';
+        }
+        
+        const versions = document.getElementById('stat-model_versions');
+        if (versions && stats.total_model_versions !== undefined) versions.textContent = stats.total_model_versions;
+    };
+    
+    const prependVersionRows = (newVersions) => {
+        const tbody = document.getElementById('model-versions-body');
+        if (!tbody) return;
+        
+        //newest first, same order as the server renders
+        newVersions.slice().reverse().forEach(v => {
+            const row = document.createElement('tr');
+            [v.model_type, v.version, v.created_date, ((v.accuracy || 0) * 100).toFixed(1) + '%'].forEach(value => {
+                const cell = document.createElement('td');
+                cell.style.padding = '8px';
+                cell.style.borderBottom = '1px solid #ddd';
+                cell.textContent = value;
+                row.appendChild(cell);
             });
+            tbody.insertBefore(row, tbody.firstChild);
+        });
+    };
+    
+    const createAccuracyChart = () => {
+        const ctx = document.getElementById('accuracy-chart');
+        
+        if (!ctx) return;
+        
+        let chart = null;
+        let stats = null;
+        
+        //accuracy history comes from its own cached endpoint, refetched only when a version is added
+        const render = () => {
+            fetch('/api/accuracy/timeline')
+                .then(response => response.json())
+                .then(timeline => {
+                    if (chart) chart.destroy();
+                    chart = buildAccuracyChart(ctx, timeline);
+                })
+                .catch(error => {
+                    console.error('Error fetching chart data:', error);
+                });
+        };
+        
+        //no SSE support: draw once like before
+        if (!window.EventSource) {
+            render();
+            return;
+        }
+        
+        //server pushes a snapshot on (re)connect, then only the values that changed
+        const source = new EventSource('/api/stats/stream');
+        
+        source.addEventListener('snapshot', e => {
+            const first = stats === null;
+            stats = JSON.parse(e.data);
+            updateStatCards(stats);
+            if (first) render();
+        });
+        
+        source.addEventListener('delta', e => {
+            if (!stats) return;
+            const delta = JSON.parse(e.data);
+            const newVersions = delta.new_model_versions || [];
+            delete delta.new_model_versions;
+            
+            Object.assign(stats, delta);
+            if (newVersions.length > 0) {
+                prependVersionRows(newVersions);
+                render();
+            }
+            updateStatCards(stats);
+        });
+        
+        source.onerror = (error) => {
+            console.error('Stats stream error, reconnecting:', error);
+        };
     };
     
     //init charts if on dashboard page
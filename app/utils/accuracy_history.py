@@ -0,0 +1,96 @@
+import threading
+from datetime import datetime
+
+def lttb(points, threshold):
+    #Largest-Triangle-Three-Buckets downsampling
+    #keeps first and last point, then per bucket the point forming the largest triangle
+    #with the previously kept point and the average of the next bucket
+    #[inputs] points: list of (x, y, payload) sorted by x, threshold: max points to keep
+    n = len(points)
+    if threshold >= n or threshold < 3:
+        return list(points)
+
+    sampled = [points[0]]
+    bucket_size = (n - 2) / (threshold - 2)
+    a = 0
+
+    for i in range(threshold - 2):
+        #average point of the next bucket
+        next_start = int((i + 1) * bucket_size) + 1
+        next_end = min(int((i + 2) * bucket_size) + 1, n)
+        next_bucket = points[next_start:next_end]
+        avg_x = sum(p[0] for p in next_bucket) / len(next_bucket)
+        avg_y = sum(p[1] for p in next_bucket) / len(next_bucket)
+
+        #pick the point in this bucket with the largest triangle area
+        start = int(i * bucket_size) + 1
+        end = int((i + 1) * bucket_size) + 1
+        ax, ay = points[a][0], points[a][1]
+        best, best_area = start, -1.0
+        for j in range(start, end):
+            area = abs((ax - avg_x) * (points[j][1] - ay) - (ax - points[j][0]) * (avg_y - ay))
+            if area > best_area:
+                best, best_area = j, area
+
+        sampled.append(points[best])
+        a = best
+
+    sampled.append(points[-1])
+    return sampled
+
+def _timestamp(value, fallback):
+    #sqlite hands back created_date as text
+    try:
+        return datetime.fromisoformat(str(value)).timestamp()
+    except ValueError:
+        return fallback
+
+class AccuracyHistory:
+    #accuracy timeline for the dashboard, downsampled server side and cached
+    #the cache only changes when a model version is recorded, so it's dropped on that event only
+    def __init__(self, db_manager, default_points=200, max_page_size=500):
+        self.db = db_manager
+        self.default_points = default_points
+        self.max_page_size = max_page_size
+
+        self._cache = {}
+        #bumped on every invalidation so a timeline computed during one isn't cached
+        self._generation = 0
+        self._lock = threading.Lock()
+
+    def on_db_event(self, event, data):
+        #DBManager listener
+        if event == 'model_version':
+            with self._lock:
+                self._cache.clear()
+                self._generation += 1
+
+    def page(self, model_type=None, after_id=0, limit=100):
+        limit = max(1, min(int(limit), self.max_page_size))
+        rows, next_after = self.db.get_model_versions_page(model_type, after_id, limit)
+        return {'items': rows, 'next_after': next_after}
+
+    def timeline(self, points=None):
+        #{'text': [...], 'image': [...]} with at most `points` entries each, oldest first
+        points = max(3, min(int(points or self.default_points), 2000))
+        with self._lock:
+            cached = self._cache.get(points)
+            generation = self._generation
+        if cached is not None:
+            return cached
+
+        result = {}
+        for model_type in ('text', 'image'):
+            series = self.db.get_model_versions_series(model_type)
+            rows = [(_timestamp(v['created_date'], i), v['accuracy'] or 0, v) for i, v in enumerate(series)]
+            result[model_type] = [{
+                'date': v['created_date'],
+                'accuracy': accuracy,
+                'version': v['version']
+            } for _, accuracy, v in lttb(rows, points)]
+            result[model_type + '_total'] = len(series)
+
+        with self._lock:
+            if generation == self._generation:
+                self._cache[points] = result
+        return result
@@ -0,0 +1,27 @@
+import asyncio
+import functools
+from concurrent.futures import ThreadPoolExecutor
+
+class AsyncDBManager:
+    #asyncio front for DBManager: every call runs on a small dedicated thread pool,
+    #so coroutines never block the event loop on SQLite I/O
+    #usage: await adb.get_analysis(analysis_id), or await adb.run(fn, ...) for anything else that touches the db
+    def __init__(self, db_manager, max_workers=4):
+        self.db = db_manager
+        self.executor = ThreadPoolExecutor(max_workers=max_workers, thread_name_prefix='sqlite')
+
+    async def run(self, fn, *args, **kwargs):
+        loop = asyncio.get_running_loop()
+        return await loop.run_in_executor(self.executor, functools.partial(fn, *args, **kwargs))
+
+    def __getattr__(self, name):
+        attr = getattr(self.db, name)
+        if not callable(attr):
+            return attr
+
+        async def call(*args, **kwargs):
+            return await self.run(attr, *args, **kwargs)
+        return call
+
+    def close(self):
+        self.executor.shutdown(wait=True)
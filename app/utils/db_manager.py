@@ -1,8 +1,43 @@
 import sqlite3
 import os
 import json
+import numpy as np
 from datetime import datetime
 
+from utils.face_utils import pair_faces
+
+#an analysis is in the validation queue (analysis.queued = 1) while it is the latest analysis of a media item
+#that is not a near-duplicate and has never been validated; SQL for an UPDATE of analysis, NULL for orphans
+QUEUED = """
+analysis.id = (SELECT MAX(newest.id) FROM analysis newest WHERE newest.media_id = analysis.media_id)
+AND (SELECT m.duplicate_of IS NULL FROM media m WHERE m.id = analysis.media_id)
+AND NOT EXISTS (SELECT 1 FROM validation v JOIN analysis va ON v.analysis_id = va.id WHERE va.media_id = analysis.media_id)
+"""
+
+def agreement_samples(media_type, model_emotions, validated_emotions):
+    #top-1 agreement (1/0) between model and validation, one sample per text or per validated face
+    samples = []
+    if media_type == 'text':
+        #text: directly compare emotion dictionaries
+        if isinstance(model_emotions, dict) and isinstance(validated_emotions, dict):
+            #calculate agreement score aka how similar are the top emotions
+            model_top = max(model_emotions.items(), key=lambda x: x[1])
+            validated_top = max(validated_emotions.items(), key=lambda x: x[1])
+            samples.append(1 if model_top[0] == validated_top[0] else 0)
+    
+    elif media_type == 'image':
+        #image: every validated face counts as one agreement sample
+        for face_emotions, validated_face in pair_faces(model_emotions, validated_emotions):
+            model_top = max(face_emotions.items(), key=lambda x: x[1])
+            validated_top = max(validated_face.items(), key=lambda x: x[1])
+            samples.append(1 if model_top[0] == validated_top[0] else 0)
+    
+    return samples
+
+class LeaseError(ValueError):
+    #a validation for an analysis the submitter holds no unexpired lease on
+    pass
+
 class DBManager:
     def __init__(self, db_path):
         #init database manager with path to SQLite database.
@@ -10,6 +45,19 @@ class DBManager:
         os.makedirs(os.path.dirname(db_path), exist_ok=True)
         self.db_path = db_path
         
+        #callbacks run after writes commit, listener(event, data)
+        self.listeners = []
+    
+    def add_listener(self, listener):
+        self.listeners.append(listener)
+    
+    def _notify(self, event, data):
+        for listener in self.listeners:
+            try:
+                listener(event, data)
+            except Exception as e:
+                print(f"Error notifying listener about {event}: {e}")
+        
     def get_connection(self):
         #Get a database connection
         conn = sqlite3.connect(self.db_path)
@@ -27,10 +75,20 @@ class DBManager:
             id INTEGER PRIMARY KEY AUTOINCREMENT,
             type TEXT NOT NULL,
             path TEXT NOT NULL,
-            upload_date TIMESTAMP NOT NULL
+            upload_date TIMESTAMP NOT NULL,
+            content_hash TEXT,
+            content TEXT
         )
         ''')
         
+        #older databases predate content_hash/content (small texts stored inline)
+        self._ensure_column(cursor, 'media', 'content_hash', 'TEXT')
+        self._ensure_column(cursor, 'media', 'content', 'TEXT')
+        cursor.execute("CREATE INDEX IF NOT EXISTS idx_media_content_hash ON media (content_hash)")
+        #near-duplicate uploads point at the media item whose analysis they reused
+        self._ensure_column(cursor, 'media', 'duplicate_of', 'INTEGER REFERENCES media (id)')
+        cursor.execute("CREATE INDEX IF NOT EXISTS idx_media_duplicate_of ON media (duplicate_of)")
+        
         # analysis table: stores emotion analysis results
         cursor.execute('''
         CREATE TABLE IF NOT EXISTS analysis (
@@ -39,10 +97,21 @@ class DBManager:
             model_version TEXT NOT NULL,
             emotion_data TEXT NOT NULL,
             analysis_date TIMESTAMP NOT NULL,
+            top_margin REAL,
+            queued INTEGER NOT NULL DEFAULT 0,
             FOREIGN KEY (media_id) REFERENCES media (id)
         )
         ''')
         
+        #top_margin: gap between the two strongest emotions, small = uncertain, used to order the validation queue
+        self._ensure_column(cursor, 'analysis', 'top_margin', 'REAL')
+        cursor.execute("CREATE INDEX IF NOT EXISTS idx_analysis_media ON analysis (media_id)")
+        #queued: 1 while the analysis is waiting in the validation queue (see QUEUED), filled in once for older databases
+        if self._ensure_column(cursor, 'analysis', 'queued', 'INTEGER NOT NULL DEFAULT 0'):
+            cursor.execute(f"UPDATE analysis SET queued = COALESCE({QUEUED}, 0)")
+        #only queued rows, in hand-out order: claiming a batch reads the first few entries instead of every analysis
+        cursor.execute("CREATE INDEX IF NOT EXISTS idx_analysis_queue ON analysis (top_margin IS NULL, top_margin, id) WHERE queued = 1")
+        
         # validation table: stores user validation of analysis results
         cursor.execute('''
         CREATE TABLE IF NOT EXISTS validation (
@@ -53,6 +122,19 @@ class DBManager:
             FOREIGN KEY (analysis_id) REFERENCES analysis (id)
         )
         ''')
+        cursor.execute("CREATE INDEX IF NOT EXISTS idx_validation_analysis ON validation (analysis_id)")
+        
+        # validation leases: analyses currently handed out to an annotator by the work queue
+        cursor.execute('''
+        CREATE TABLE IF NOT EXISTS validation_leases (
+            analysis_id INTEGER PRIMARY KEY,
+            lease_token TEXT NOT NULL,
+            annotator TEXT,
+            expires_at REAL NOT NULL,
+            FOREIGN KEY (analysis_id) REFERENCES analysis (id)
+        )
+        ''')
+        cursor.execute("CREATE INDEX IF NOT EXISTS idx_validation_leases_expiry ON validation_leases (expires_at)")
         
         # model version history: tracks model version changes
         cursor.execute('''
@@ -64,42 +146,503 @@ class DBManager:
             accuracy REAL
         )
         ''')
+        #ids grow with created_date, so (model_type, id) serves keyset paging of the history
+        cursor.execute("CREATE INDEX IF NOT EXISTS idx_model_versions_type ON model_versions (model_type, id)")
+        
+        # shadow analysis: results from a candidate correction layer scored next to the live one
+        cursor.execute('''
+        CREATE TABLE IF NOT EXISTS shadow_analysis (
+            id INTEGER PRIMARY KEY AUTOINCREMENT,
+            analysis_id INTEGER NOT NULL,
+            model_version TEXT NOT NULL,
+            emotion_data TEXT NOT NULL,
+            analysis_date TIMESTAMP NOT NULL,
+            FOREIGN KEY (analysis_id) REFERENCES analysis (id)
+        )
+        ''')
+        cursor.execute("CREATE INDEX IF NOT EXISTS idx_shadow_analysis_version ON shadow_analysis (model_version, analysis_id)")
+        
+        # face vectors: raw (pre-correction) per-face emotion scores and regions
+        # so images can be re-scored without decode/detection/CNN
+        cursor.execute('''
+        CREATE TABLE IF NOT EXISTS face_vectors (
+            id INTEGER PRIMARY KEY AUTOINCREMENT,
+            media_id INTEGER NOT NULL,
+            face_index INTEGER NOT NULL,
+            x INTEGER,
+            y INTEGER,
+            w INTEGER,
+            h INTEGER,
+            raw_vector BLOB NOT NULL,
+            FOREIGN KEY (media_id) REFERENCES media (id)
+        )
+        ''')
+        cursor.execute("CREATE INDEX IF NOT EXISTS idx_face_vectors_media ON face_vectors (media_id, face_index)")
+        
+        # dedup hashes: perceptual hashes of images / MinHash signatures of texts, for near-duplicate lookups
+        cursor.execute('''
+        CREATE TABLE IF NOT EXISTS dedup_hashes (
+            media_id INTEGER PRIMARY KEY,
+            phash INTEGER,
+            dhash INTEGER,
+            minhash BLOB,
+            FOREIGN KEY (media_id) REFERENCES media (id)
+        )
+        ''')
+        
+        # archived objects: uploads moved out of the upload store into compressed packs
+        cursor.execute('''
+        CREATE TABLE IF NOT EXISTS archived_objects (
+            media_id INTEGER PRIMARY KEY,
+            key TEXT NOT NULL,
+            pack TEXT NOT NULL,
+            size INTEGER,
+            archived_at TIMESTAMP NOT NULL,
+            FOREIGN KEY (media_id) REFERENCES media (id)
+        )
+        ''')
+        #uploads are content-addressed, several media rows can share one archived key
+        cursor.execute("CREATE INDEX IF NOT EXISTS idx_archived_objects_key ON archived_objects (key)")
+        
+        # sentences: per-sentence spans of text uploads, for search
+        cursor.execute('''
+        CREATE TABLE IF NOT EXISTS sentences (
+            id INTEGER PRIMARY KEY AUTOINCREMENT,
+            media_id INTEGER NOT NULL,
+            analysis_id INTEGER,
+            sentence_index INTEGER NOT NULL,
+            start INTEGER NOT NULL,
+            end INTEGER NOT NULL,
+            text TEXT NOT NULL,
+            FOREIGN KEY (media_id) REFERENCES media (id),
+            FOREIGN KEY (analysis_id) REFERENCES analysis (id)
+        )
+        ''')
+        cursor.execute("CREATE INDEX IF NOT EXISTS idx_sentences_media ON sentences (media_id, sentence_index)")
+        
+        # sentence vectors: float32 emotion scores per sentence, dominant emotion indexed for threshold queries
+        cursor.execute('''
+        CREATE TABLE IF NOT EXISTS sentence_vectors (
+            sentence_id INTEGER PRIMARY KEY,
+            dominant TEXT NOT NULL,
+            dominant_score REAL NOT NULL,
+            vector BLOB NOT NULL,
+            FOREIGN KEY (sentence_id) REFERENCES sentences (id)
+        )
+        ''')
+        cursor.execute("CREATE INDEX IF NOT EXISTS idx_sentence_vectors_dominant ON sentence_vectors (dominant, dominant_score)")
+        
+        # full-text index over sentence text, reads the text from sentences (external content, not stored twice)
+        try:
+            cursor.execute("CREATE VIRTUAL TABLE IF NOT EXISTS sentence_fts USING fts5(text, content='sentences', content_rowid='id')")
+        except sqlite3.OperationalError as e:
+            #sqlite built without FTS5, keyword search falls back to LIKE
+            print(f"FTS5 unavailable, keyword search will scan sentences: {e}")
         
         conn.commit()
         conn.close()
     
-    def add_media(self, media_type, file_path):
+    def _has_fts(self, cursor):
+        cursor.execute("SELECT 1 FROM sqlite_master WHERE type = 'table' AND name = 'sentence_fts'")
+        return cursor.fetchone() is not None
+    
+    def _ensure_column(self, cursor, table, column, declaration):
+        #add a column to an existing table if it's missing
+        cursor.execute(f"PRAGMA table_info({table})")
+        #returns True if it was added
+        if column not in [row['name'] for row in cursor.fetchall()]:
+            cursor.execute(f"ALTER TABLE {table} ADD COLUMN {column} {declaration}")
+            return True
+        return False
+    
+    def _requeue(self, cursor, media_ids):
+        #recompute analysis.queued for every analysis of these media items, in the caller's transaction
+        cursor.executemany(f"UPDATE analysis SET queued = COALESCE({QUEUED}, 0) WHERE media_id = ?",
+                           [(media_id,) for media_id in set(media_ids)])
+    
+    def add_media(self, media_type, file_path, content_hash=None, content=None, duplicate_of=None):
         #add a new media entry and return its ID
+        #content holds small texts inline instead of a file
         conn = self.get_connection()
         cursor = conn.cursor()
         
         cursor.execute(
-            "INSERT INTO media (type, path, upload_date) VALUES (?, ?, ?)",
-            (media_type, file_path, datetime.now())
+            "INSERT INTO media (type, path, upload_date, content_hash, content, duplicate_of) VALUES (?, ?, ?, ?, ?, ?)",
+            (media_type, file_path, datetime.now(), content_hash, content, duplicate_of)
         )
         
         media_id = cursor.lastrowid
         conn.commit()
         conn.close()
         
+        self._notify('media', {'media_id': media_id, 'type': media_type})
         return media_id
     
-    def add_analysis(self, media_id, model_version, emotion_data):
+    def add_analysis(self, media_id, model_version, emotion_data, top_margin=None):
         #add a new analysis entry and return its ID.
         conn = self.get_connection()
         cursor = conn.cursor()
         
         cursor.execute(
-            "INSERT INTO analysis (media_id, model_version, emotion_data, analysis_date) VALUES (?, ?, ?, ?)",
-            (media_id, model_version, emotion_data, datetime.now())
+            "INSERT INTO analysis (media_id, model_version, emotion_data, analysis_date, top_margin) VALUES (?, ?, ?, ?, ?)",
+            (media_id, model_version, emotion_data, datetime.now(), top_margin)
         )
         
         analysis_id = cursor.lastrowid
+        #the new analysis takes the place of the older ones in the queue
+        self._requeue(cursor, [media_id])
         conn.commit()
         conn.close()
         
         return analysis_id
     
+    def add_analyses(self, rows):
+        #add many analysis entries in one transaction
+        #rows: list of (media_id, model_version, emotion_data, top_margin)
+        conn = self.get_connection()
+        cursor = conn.cursor()
+        
+        now = datetime.now()
+        cursor.executemany(
+            "INSERT INTO analysis (media_id, model_version, emotion_data, analysis_date, top_margin) VALUES (?, ?, ?, ?, ?)",
+            [(media_id, model_version, emotion_data, now, top_margin) for media_id, model_version, emotion_data, top_margin in rows]
+        )
+        self._requeue(cursor, [row[0] for row in rows])
+        
+        conn.commit()
+        conn.close()
+    
+    def add_face_vectors(self, media_id, regions, raw_vectors):
+        #store raw per-face emotion vectors (float32) and face regions for a media item
+        conn = self.get_connection()
+        cursor = conn.cursor()
+        
+        rows = []
+        for face_index, (region, vector) in enumerate(zip(regions, raw_vectors)):
+            region = region or {}
+            #regions can come straight from DeepFace as numpy ints
+            x, y, w, h = [int(region[k]) if region.get(k) is not None else None for k in ('x', 'y', 'w', 'h')]
+            rows.append((
+                media_id, face_index, x, y, w, h,
+                np.asarray(vector, dtype=np.float32).tobytes()
+            ))
+        
+        cursor.executemany(
+            "INSERT INTO face_vectors (media_id, face_index, x, y, w, h, raw_vector) VALUES (?, ?, ?, ?, ?, ?, ?)",
+            rows
+        )
+        
+        conn.commit()
+        conn.close()
+    
+    def copy_face_vectors(self, from_media_id, to_media_id):
+        #a near-duplicate that reuses another upload's analysis gets its raw vectors too, so rescore covers it
+        conn = self.get_connection()
+        cursor = conn.cursor()
+        
+        cursor.execute("""
+        INSERT INTO face_vectors (media_id, face_index, x, y, w, h, raw_vector)
+        SELECT ?, face_index, x, y, w, h, raw_vector FROM face_vectors WHERE media_id = ? ORDER BY face_index
+        """, (to_media_id, from_media_id))
+        
+        conn.commit()
+        conn.close()
+    
+    def get_face_vectors(self, after_media_id=0, limit=None):
+        #get stored face vectors ordered by media, starting after after_media_id
+        #returns (rows without the blob, (n_faces, n_emotions) float32 matrix)
+        conn = self.get_connection()
+        cursor = conn.cursor()
+        
+        query = """
+        SELECT media_id, face_index, x, y, w, h, raw_vector
+        FROM face_vectors
+        WHERE media_id IN (
+            SELECT DISTINCT media_id FROM face_vectors
+            WHERE media_id > ?
+            ORDER BY media_id
+            LIMIT ?
+        )
+        ORDER BY media_id, face_index
+        """
+        cursor.execute(query, (after_media_id, limit if limit is not None else -1))
+        fetched = cursor.fetchall()
+        conn.close()
+        
+        rows = []
+        blobs = []
+        for r in fetched:
+            rows.append({
+                'media_id': r['media_id'],
+                'face_index': r['face_index'],
+                'region': {'x': r['x'], 'y': r['y'], 'w': r['w'], 'h': r['h']} if r['w'] is not None else None
+            })
+            blobs.append(r['raw_vector'])
+        
+        if not blobs:
+            return rows, np.zeros((0, 0), dtype=np.float32)
+        
+        matrix = np.frombuffer(b''.join(blobs), dtype=np.float32).reshape(len(blobs), -1)
+        return rows, matrix
+    
+    def add_dedup_hash(self, media_id, phash=None, dhash=None, minhash=None):
+        #64-bit hashes are stored as signed ints, that's what SQLite INTEGER holds
+        to_signed = lambda value: value - (1 << 64) if value is not None and value >= (1 << 63) else value
+        conn = self.get_connection()
+        cursor = conn.cursor()
+        
+        cursor.execute(
+            "INSERT OR REPLACE INTO dedup_hashes (media_id, phash, dhash, minhash) VALUES (?, ?, ?, ?)",
+            (media_id, to_signed(phash), to_signed(dhash), minhash)
+        )
+        
+        conn.commit()
+        conn.close()
+    
+    def get_dedup_hashes(self):
+        #every stored signature as (media_id, phash, dhash, minhash blob), hashes back to unsigned
+        to_unsigned = lambda value: value & ((1 << 64) - 1) if value is not None else None
+        conn = self.get_connection()
+        cursor = conn.cursor()
+        
+        cursor.execute("SELECT media_id, phash, dhash, minhash FROM dedup_hashes")
+        rows = [(r['media_id'], to_unsigned(r['phash']), to_unsigned(r['dhash']), r['minhash']) for r in cursor.fetchall()]
+        
+        conn.close()
+        return rows
+    
+    def get_latest_analysis(self, media_id):
+        #newest analysis of a media item
+        conn = self.get_connection()
+        cursor = conn.cursor()
+        
+        cursor.execute("SELECT * FROM analysis WHERE media_id = ? ORDER BY id DESC LIMIT 1", (media_id,))
+        analysis = cursor.fetchone()
+        
+        conn.close()
+        return dict(analysis) if analysis else None
+    
+    def add_sentences(self, media_id, analysis_id, sentences, vectors, emotions):
+        #index the sentences of a text upload with their emotion vectors, in one transaction
+        #sentences: list of (start, end, text), vectors: (n_sentences, n_emotions) in emotions order
+        vectors = np.asarray(vectors, dtype=np.float32).reshape(len(sentences), -1)
+        if not sentences:
+            return 0
+        
+        conn = self.get_connection()
+        cursor = conn.cursor()
+        has_fts = self._has_fts(cursor)
+        
+        dominant = np.argmax(vectors, axis=1)
+        for sentence_index, ((start, end, text), vector, top) in enumerate(zip(sentences, vectors, dominant.tolist())):
+            cursor.execute(
+                "INSERT INTO sentences (media_id, analysis_id, sentence_index, start, end, text) VALUES (?, ?, ?, ?, ?, ?)",
+                (media_id, analysis_id, sentence_index, start, end, text)
+            )
+            sentence_id = cursor.lastrowid
+            cursor.execute(
+                "INSERT INTO sentence_vectors (sentence_id, dominant, dominant_score, vector) VALUES (?, ?, ?, ?)",
+                (sentence_id, emotions[top], float(vector[top]), vector.tobytes())
+            )
+            if has_fts:
+                cursor.execute("INSERT INTO sentence_fts (rowid, text) VALUES (?, ?)", (sentence_id, text))
+        
+        conn.commit()
+        conn.close()
+        return len(sentences)
+    
+    def get_unindexed_text_media(self, after_id=0, limit=100):
+        #text uploads after after_id with no sentences indexed yet, with their latest analysis, for backfilling
+        conn = self.get_connection()
+        cursor = conn.cursor()
+        
+        cursor.execute('''
+        SELECT m.*, (SELECT MAX(a.id) FROM analysis a WHERE a.media_id = m.id) AS analysis_id
+        FROM media m
+        WHERE m.type = 'text' AND m.id > ?
+        AND NOT EXISTS (SELECT 1 FROM sentences s WHERE s.media_id = m.id)
+        ORDER BY m.id
+        LIMIT ?
+        ''', (after_id, limit))
+        rows = [dict(row) for row in cursor.fetchall()]
+        
+        conn.close()
+        return rows
+    
+    def search_sentences(self, emotions, keywords=None, dominant=None, min_dominant_score=0.0,
+                         thresholds=None, before_id=None, limit=50):
+        #sentences matching a keyword query and emotion filters, newest first, keyset paged on sentence id
+        #keywords go through the FTS5 index, dominant/min_dominant_score through idx_sentence_vectors_dominant;
+        #per-emotion thresholds ({'fear': 0.4}) are checked on the float32 vectors of the rows those narrow down to
+        #returns (results, next before_id or None)
+        from utils.sentence_index import fts_query
+        
+        thresholds = {emotions.index(emotion): value for emotion, value in (thresholds or {}).items()}
+        
+        conn = self.get_connection()
+        cursor = conn.cursor()
+        
+        joins = ["JOIN sentence_vectors v ON v.sentence_id = s.id"]
+        where = []
+        params = []
+        #keywords that sanitize to nothing (q=*, punctuation only) don't filter, an empty MATCH is a syntax error
+        match = fts_query(keywords) if keywords else ''
+        if match:
+            if self._has_fts(cursor):
+                joins.append("JOIN sentence_fts f ON f.rowid = s.id")
+                where.append("sentence_fts MATCH ?")
+                params.append(match)
+            else:
+                for word in keywords.split():
+                    where.append("s.text LIKE ?")
+                    params.append(f"%{word.rstrip('*')}%")
+        if dominant:
+            where.append("v.dominant = ?")
+            params.append(dominant)
+            if min_dominant_score:
+                where.append("v.dominant_score >= ?")
+                params.append(min_dominant_score)
+        elif min_dominant_score:
+            where.append("v.dominant_score >= ?")
+            params.append(min_dominant_score)
+        
+        query = f'''
+        SELECT s.id, s.media_id, s.analysis_id, s.sentence_index, s.start, s.end, s.text,
+               v.dominant, v.dominant_score, v.vector
+        FROM sentences s {' '.join(joins)}
+        WHERE s.id < ? {''.join(' AND ' + clause for clause in where)}
+        ORDER BY s.id DESC
+        LIMIT ?
+        '''
+        
+        #thresholds filter after the query, so read in chunks until the page is full
+        chunk = limit if not thresholds else max(limit * 4, 200)
+        cursor_id = before_id if before_id is not None else 2 ** 63 - 1
+        results = []
+        exhausted = False
+        while len(results) < limit:
+            cursor.execute(query, [cursor_id] + params + [chunk])
+            rows = cursor.fetchall()
+            if not rows:
+                exhausted = True
+                break
+            vectors = np.frombuffer(b''.join(row['vector'] for row in rows), dtype=np.float32).reshape(len(rows), -1)
+            keep = np.ones(len(rows), dtype=bool)
+            for column, value in thresholds.items():
+                keep &= vectors[:, column] >= value
+            for row, vector, matched in zip(rows, vectors, keep):
+                cursor_id = row['id']
+                if not matched:
+                    continue
+                results.append({
+                    'sentence_id': row['id'],
+                    'media_id': row['media_id'],
+                    'analysis_id': row['analysis_id'],
+                    'sentence_index': row['sentence_index'],
+                    'start': row['start'],
+                    'end': row['end'],
+                    'text': row['text'],
+                    'dominant': row['dominant'],
+                    'dominant_score': row['dominant_score'],
+                    'emotions': dict(zip(emotions, vector.tolist()))
+                })
+                if len(results) == limit:
+                    break
+            if len(rows) < chunk and len(results) < limit:
+                exhausted = True
+                break
+        
+        conn.close()
+        next_before = results[-1]['sentence_id'] if results and not (exhausted and len(results) < limit) else None
+        return results, next_before
+    
+    def add_shadow_analysis(self, analysis_id, model_version, emotion_data):
+        #store what a shadow candidate layer predicted for an analysis
+        conn = self.get_connection()
+        cursor = conn.cursor()
+        
+        cursor.execute(
+            "INSERT INTO shadow_analysis (analysis_id, model_version, emotion_data, analysis_date) VALUES (?, ?, ?, ?)",
+            (analysis_id, model_version, emotion_data, datetime.now())
+        )
+        
+        conn.commit()
+        conn.close()
+    
+    def get_shadow_comparison(self, shadow_version):
+        #paired agreement with validations: live result vs shadow candidate on the same analyses
+        conn = self.get_connection()
+        cursor = conn.cursor()
+        
+        cursor.execute("""
+        SELECT a.id, a.emotion_data AS live_data, s.emotion_data AS shadow_data, v.validated_emotions, m.type
+        FROM shadow_analysis s
+        JOIN analysis a ON s.analysis_id = a.id
+        JOIN validation v ON v.analysis_id = a.id
+        JOIN media m ON a.media_id = m.id
+        WHERE s.model_version = ?
+        """, (shadow_version,))
+        rows = cursor.fetchall()
+        conn.close()
+        
+        live_samples = []
+        shadow_samples = []
+        for row in rows:
+            try:
+                validated_emotions = json.loads(row['validated_emotions'])
+                live = agreement_samples(row['type'], json.loads(row['live_data']), validated_emotions)
+                shadow = agreement_samples(row['type'], json.loads(row['shadow_data']), validated_emotions)
+            except Exception as e:
+                print(f"Error calculating shadow agreement for analysis {row['id']}: {e}")
+                continue
+            #only count samples both sides could be scored on
+            if len(live) == len(shadow):
+                live_samples.extend(live)
+                shadow_samples.extend(shadow)
+        
+        return {
+            'samples': len(live_samples),
+            'live_hits': sum(live_samples),
+            'shadow_hits': sum(shadow_samples)
+        }
+    
+    def get_version_agreement(self, model_type):
+        #agreement with validations per model version, live and shadow results alike
+        conn = self.get_connection()
+        cursor = conn.cursor()
+        
+        cursor.execute("""
+        SELECT a.id, a.model_version, a.emotion_data, v.validated_emotions, 'live' AS mode
+        FROM analysis a
+        JOIN validation v ON v.analysis_id = a.id
+        JOIN media m ON a.media_id = m.id
+        WHERE m.type = ?
+        UNION ALL
+        SELECT a.id, s.model_version, s.emotion_data, v.validated_emotions, 'shadow' AS mode
+        FROM shadow_analysis s
+        JOIN analysis a ON s.analysis_id = a.id
+        JOIN validation v ON v.analysis_id = a.id
+        JOIN media m ON a.media_id = m.id
+        WHERE m.type = ?
+        """, (model_type, model_type))
+        rows = cursor.fetchall()
+        conn.close()
+        
+        versions = {}
+        for row in rows:
+            try:
+                samples = agreement_samples(model_type, json.loads(row['emotion_data']), json.loads(row['validated_emotions']))
+            except Exception as e:
+                print(f"Error calculating agreement for analysis {row['id']}: {e}")
+                continue
+            entry = versions.setdefault(row['model_version'], {'mode': row['mode'], 'hits': 0, 'samples': 0})
+            entry['hits'] += sum(samples)
+            entry['samples'] += len(samples)
+        
+        for entry in versions.values():
+            entry['accuracy'] = entry['hits'] / entry['samples'] if entry['samples'] else None
+        return versions
+    
     def add_validation(self, analysis_id, validated_emotions):
         #add a new validation entry and return its ID
         conn = self.get_connection()
@@ -111,11 +654,154 @@ class DBManager:
         )
         
         validation_id = cursor.lastrowid
+        #a validated media item leaves the queue
+        cursor.execute("SELECT media_id FROM analysis WHERE id = ?", (analysis_id,))
+        self._requeue(cursor, [row['media_id'] for row in cursor.fetchall()])
         conn.commit()
         conn.close()
         
+        self._notify_validations([(analysis_id, validated_emotions)])
         return validation_id
     
+    def _notify_validations(self, rows):
+        #tell listeners about new validations with their agreement samples
+        if not self.listeners or not rows:
+            return
+        
+        conn = self.get_connection()
+        cursor = conn.cursor()
+        
+        analysis_ids = [int(analysis_id) for analysis_id, _ in rows]
+        placeholders = ','.join('?' * len(analysis_ids))
+        cursor.execute(f"""
+        SELECT a.id, a.emotion_data, m.type
+        FROM analysis a
+        JOIN media m ON a.media_id = m.id
+        WHERE a.id IN ({placeholders})
+        """, analysis_ids)
+        analyses = {row['id']: row for row in cursor.fetchall()}
+        conn.close()
+        
+        samples = []
+        for analysis_id, validated_emotions in rows:
+            row = analyses.get(int(analysis_id))
+            if row is None:
+                continue
+            try:
+                samples.extend(agreement_samples(row['type'], json.loads(row['emotion_data']), json.loads(validated_emotions)))
+            except Exception as e:
+                print(f"Error calculating agreement for analysis {analysis_id}: {e}")
+        
+        self._notify('validation', {
+            'count': len(rows),
+            'agreement_hits': sum(samples),
+            'agreement_samples': len(samples)
+        })
+    
+    def add_validations(self, rows, annotator, now):
+        #add many validations in one transaction and release their leases
+        #rows: list of (analysis_id, validated_emotions)
+        #every analysis has to be leased to annotator and the lease unexpired at now, otherwise nothing is written
+        conn = self.get_connection()
+        cursor = conn.cursor()
+        
+        try:
+            cursor.execute("BEGIN IMMEDIATE")
+            for analysis_id, _ in rows:
+                cursor.execute(
+                    "DELETE FROM validation_leases WHERE analysis_id = ? AND annotator IS ? AND expires_at > ?",
+                    (analysis_id, annotator, now)
+                )
+                if cursor.rowcount == 0:
+                    raise LeaseError(f"No unexpired lease on analysis {analysis_id} for this annotator")
+            
+            validation_date = datetime.now()
+            cursor.executemany(
+                "INSERT INTO validation (analysis_id, validated_emotions, validation_date) VALUES (?, ?, ?)",
+                [(analysis_id, validated_emotions, validation_date) for analysis_id, validated_emotions in rows]
+            )
+            placeholders = ','.join('?' * len(rows))
+            cursor.execute(f"SELECT media_id FROM analysis WHERE id IN ({placeholders})", [analysis_id for analysis_id, _ in rows])
+            self._requeue(cursor, [row['media_id'] for row in cursor.fetchall()])
+            conn.commit()
+        except Exception:
+            conn.rollback()
+            raise
+        finally:
+            conn.close()
+        
+        self._notify_validations(rows)
+        return len(rows)
+    
+    def get_analysis_types(self, analysis_ids):
+        #{analysis id: media type} for the analyses that exist
+        if not analysis_ids:
+            return {}
+        conn = self.get_connection()
+        cursor = conn.cursor()
+        
+        placeholders = ','.join('?' * len(analysis_ids))
+        cursor.execute(f"""
+        SELECT a.id, m.type FROM analysis a JOIN media m ON a.media_id = m.id
+        WHERE a.id IN ({placeholders})
+        """, list(analysis_ids))
+        types = {row['id']: row['type'] for row in cursor.fetchall()}
+        
+        conn.close()
+        return types
+    
+    def claim_validation_batch(self, lease_token, annotator, batch_size, lease_seconds, now):
+        #lease up to batch_size unvalidated analyses, most uncertain first
+        #only the latest analysis of a media item that has never been validated is handed out
+        #near-duplicates are left out, validating the original covers them
+        conn = self.get_connection()
+        cursor = conn.cursor()
+        
+        try:
+            #IMMEDIATE takes the write lock up front so two annotators can't claim the same rows
+            cursor.execute("BEGIN IMMEDIATE")
+            cursor.execute("DELETE FROM validation_leases WHERE expires_at <= ?", (now,))
+            
+            cursor.execute("""
+            SELECT a.id AS analysis_id, a.media_id, a.model_version, a.emotion_data, a.top_margin,
+                   m.type, m.path, m.content
+            FROM analysis a
+            JOIN media m ON a.media_id = m.id
+            WHERE a.queued = 1
+              AND NOT EXISTS (SELECT 1 FROM validation_leases l WHERE l.analysis_id = a.id)
+            ORDER BY a.top_margin IS NULL, a.top_margin ASC, a.id ASC
+            LIMIT ?
+            """, (batch_size,))
+            rows = [dict(r) for r in cursor.fetchall()]
+            
+            expires_at = now + lease_seconds
+            cursor.executemany(
+                "INSERT INTO validation_leases (analysis_id, lease_token, annotator, expires_at) VALUES (?, ?, ?, ?)",
+                [(r['analysis_id'], lease_token, annotator, expires_at) for r in rows]
+            )
+            conn.commit()
+        except Exception:
+            conn.rollback()
+            raise
+        finally:
+            conn.close()
+        
+        for r in rows:
+            r['lease_expires_at'] = expires_at
+        return rows
+    
+    def release_validation_leases(self, lease_token):
+        #give back every analysis still leased under a token
+        conn = self.get_connection()
+        cursor = conn.cursor()
+        
+        cursor.execute("DELETE FROM validation_leases WHERE lease_token = ?", (lease_token,))
+        released = cursor.rowcount
+        
+        conn.commit()
+        conn.close()
+        return released
+    
     def get_media(self, media_id):
         #Get media information by ID
         conn = self.get_connection()
@@ -143,34 +829,110 @@ class DBManager:
         conn = self.get_connection()
         cursor = conn.cursor()
         
+        created_date = datetime.now()
         cursor.execute(
             "INSERT INTO model_versions (model_type, version, created_date, accuracy) VALUES (?, ?, ?, ?)",
-            (model_type, version, datetime.now(), accuracy)
+            (model_type, version, created_date, accuracy)
         )
         
         conn.commit()
         conn.close()
+        
+        self._notify('model_version', {
+            'model_type': model_type,
+            'version': version,
+            'created_date': str(created_date),
+            'accuracy': float(accuracy) if accuracy is not None else None
+        })
     
-    def get_pending_validations(self, model_type):
-        #get validations that haven't been used for model improvement yet.
+    def get_latest_model_version(self, model_type):
+        #get the most recently recorded version name for a model type
         conn = self.get_connection()
         cursor = conn.cursor()
         
-        query = """
-        SELECT v.id, a.emotion_data, v.validated_emotions, m.type, m.path
-        FROM validation v
-        JOIN analysis a ON v.analysis_id = a.id
-        JOIN media m ON a.media_id = m.id
-        WHERE m.type = ? 
-        """
+        cursor.execute(
+            "SELECT version FROM model_versions WHERE model_type = ? ORDER BY created_date DESC, id DESC LIMIT 1",
+            (model_type,)
+        )
+        row = cursor.fetchone()
+        
+        conn.close()
+        return row['version'] if row else None
+    
+    def get_model_versions_page(self, model_type=None, after_id=0, limit=100):
+        #keyset page of model version history in creation order
+        #returns (rows, id to pass as after_id for the next page or None at the end)
+        conn = self.get_connection()
+        cursor = conn.cursor()
+        
+        if model_type:
+            cursor.execute("""
+            SELECT id, model_type, version, created_date, accuracy
+            FROM model_versions
+            WHERE model_type = ? AND id > ?
+            ORDER BY id
+            LIMIT ?
+            """, (model_type, after_id, limit + 1))
+        else:
+            cursor.execute("""
+            SELECT id, model_type, version, created_date, accuracy
+            FROM model_versions
+            WHERE id > ?
+            ORDER BY id
+            LIMIT ?
+            """, (after_id, limit + 1))
+        
+        rows = [dict(v) for v in cursor.fetchall()]
+        conn.close()
+        
+        #one extra row tells us whether there's another page
+        next_after = rows[limit - 1]['id'] if len(rows) > limit else None
+        return rows[:limit], next_after
+    
+    def get_model_versions_series(self, model_type):
+        #full accuracy history of one model type in creation order
+        conn = self.get_connection()
+        cursor = conn.cursor()
         
-        cursor.execute(query, (model_type,))
-        validations = cursor.fetchall()
+        cursor.execute("""
+        SELECT id, version, created_date, accuracy
+        FROM model_versions
+        WHERE model_type = ?
+        ORDER BY id
+        """, (model_type,))
         
+        rows = [dict(v) for v in cursor.fetchall()]
         conn.close()
-        return [dict(v) for v in validations]
+        return rows
     
-    def get_statistics(self):
+    def get_validations_after(self, model_type, after_id, limit=1000):
+        #next page of validations of one media type by id (keyset), for incremental training samples
+        conn = self.get_connection()
+        cursor = conn.cursor()
+
+        cursor.execute("""
+        SELECT v.id, a.emotion_data, v.validated_emotions
+        FROM validation v
+        JOIN analysis a ON v.analysis_id = a.id
+        JOIN media m ON a.media_id = m.id
+        WHERE m.type = ? AND v.id > ?
+        ORDER BY v.id
+        LIMIT ?
+        """, (model_type, after_id, limit))
+
+        validations = [dict(v) for v in cursor.fetchall()]
+        conn.close()
+        return validations
+
+    def get_last_validation_id(self):
+        conn = self.get_connection()
+        cursor = conn.cursor()
+        cursor.execute("SELECT COALESCE(MAX(id), 0) FROM validation")
+        last_id = cursor.fetchone()[0]
+        conn.close()
+        return last_id
+
+    def get_statistics(self, recent_versions=20):
         #get statistics for the dashboard
         conn = self.get_connection()
         cursor = conn.cursor()
@@ -204,40 +966,7 @@ class DBManager:
                 media_type = row['type']
                 
                 #calculate agreement score based on media type
-                if media_type == 'text':
-                    #text: directly compare emotion dictionaries
-                    if isinstance(model_emotions, dict) and isinstance(validated_emotions, dict):
-                        #calculate agreement score aka how similar are the top emotions
-                        model_top = max(model_emotions.items(), key=lambda x: x[1])
-                        validated_top = max(validated_emotions.items(), key=lambda x: x[1])
-                        
-                        agreement = 1 if model_top[0] == validated_top[0] else 0
-                        agreements.append(agreement)
-                
-                elif media_type == 'image':
-                    #image: handle list of faces structure from DeepFace
-                    if isinstance(model_emotions, list) and len(model_emotions) > 0:
-                        #extract emotions from first face
-                        face_emotions = None
-                        if 'emotion' in model_emotions[0]:
-                            face_emotions = model_emotions[0]['emotion']
-                        else:
-                            face_emotions = model_emotions[0]  # Direct emotion mapping
-                            
-                        if isinstance(face_emotions, dict):
-                            #calculate agreement score
-                            model_top = max(face_emotions.items(), key=lambda x: x[1])
-                            validated_top = max(validated_emotions.items(), key=lambda x: x[1])
-                            
-                            agreement = 1 if model_top[0] == validated_top[0] else 0
-                            agreements.append(agreement)
-                    elif isinstance(model_emotions, dict):
-                        #sometimes image emotions might be stored directly as a dictionary (?)
-                        model_top = max(model_emotions.items(), key=lambda x: x[1])
-                        validated_top = max(validated_emotions.items(), key=lambda x: x[1])
-                        
-                        agreement = 1 if model_top[0] == validated_top[0] else 0
-                        agreements.append(agreement)
+                agreements.extend(agreement_samples(media_type, model_emotions, validated_emotions))
             
             except Exception as e:
                 print(f"Error calculating agreement for analysis {row['id']}: {e}")
@@ -245,12 +974,16 @@ class DBManager:
         
         avg_accuracy = sum(agreements) / len(agreements) if agreements else 0
         
-        #model vers history
+        #model vers history, only the most recent ones (full history is paged via get_model_versions_page)
+        cursor.execute("SELECT COUNT(*) as total FROM model_versions")
+        total_model_versions = cursor.fetchone()['total']
+        
         cursor.execute("""
         SELECT model_type, version, created_date, accuracy 
         FROM model_versions 
-        ORDER BY created_date DESC
-        """)
+        ORDER BY id DESC
+        LIMIT ?
+        """, (recent_versions,))
         
         model_versions = [dict(v) for v in cursor.fetchall()]
         
@@ -262,11 +995,219 @@ class DBManager:
             'total_image': total_image,
             'total_validations': total_validations,
             'avg_accuracy': avg_accuracy,
+            'agreement_hits': sum(agreements),
+            'agreement_samples': len(agreements),
+            'total_model_versions': total_model_versions,
             'model_versions': model_versions
         }
         
-    def mark_validations_used(self, validation_ids):
-        #Mark validations as used for model improvement.
-        #this imp doesn't actually delete validations
-        #need to add a 'used' flag instead maybe idk
-        pass
\ No newline at end of file
+    def get_stored_media(self):
+        #(id, type, path) of every upload kept as a file rather than inline, for orphan file checks
+        conn = self.get_connection()
+        cursor = conn.cursor()
+        
+        cursor.execute("SELECT id, type, path FROM media WHERE content IS NULL")
+        rows = [dict(row) for row in cursor.fetchall()]
+        
+        conn.close()
+        return rows
+    
+    def get_unvalidated_text_media(self):
+        #text uploads nobody has validated, with inline content when there is any (empty-upload cleanup)
+        conn = self.get_connection()
+        cursor = conn.cursor()
+        
+        cursor.execute("""
+        SELECT m.id, m.path, m.content
+        FROM media m
+        WHERE m.type = 'text'
+          AND NOT EXISTS (SELECT 1 FROM analysis a JOIN validation v ON v.analysis_id = a.id WHERE a.media_id = m.id)
+        """)
+        rows = [dict(row) for row in cursor.fetchall()]
+        
+        conn.close()
+        return rows
+    
+    def delete_media(self, media_ids):
+        #remove media items and everything hanging off them, in one transaction
+        #only meant for items without validations, validations are training data and are never deleted here
+        if not media_ids:
+            return 0
+        conn = self.get_connection()
+        cursor = conn.cursor()
+        has_fts = self._has_fts(cursor)
+        
+        cursor.execute("CREATE TEMP TABLE IF NOT EXISTS gc_media (id INTEGER PRIMARY KEY)")
+        cursor.execute("DELETE FROM gc_media")
+        cursor.executemany("INSERT OR IGNORE INTO gc_media (id) VALUES (?)", [(media_id,) for media_id in media_ids])
+        
+        #what actually goes, for listeners (dashboard counters, dedup index)
+        cursor.execute("SELECT m.id, m.type FROM media m JOIN gc_media g ON m.id = g.id")
+        removed = cursor.fetchall()
+        
+        if has_fts:
+            cursor.execute("""
+            INSERT INTO sentence_fts (sentence_fts, rowid, text)
+            SELECT 'delete', id, text FROM sentences WHERE media_id IN (SELECT id FROM gc_media)
+            """)
+        cursor.execute("DELETE FROM sentence_vectors WHERE sentence_id IN (SELECT id FROM sentences WHERE media_id IN (SELECT id FROM gc_media))")
+        cursor.execute("DELETE FROM sentences WHERE media_id IN (SELECT id FROM gc_media)")
+        cursor.execute("DELETE FROM shadow_analysis WHERE analysis_id IN (SELECT id FROM analysis WHERE media_id IN (SELECT id FROM gc_media))")
+        cursor.execute("DELETE FROM validation_leases WHERE analysis_id IN (SELECT id FROM analysis WHERE media_id IN (SELECT id FROM gc_media))")
+        cursor.execute("DELETE FROM analysis WHERE media_id IN (SELECT id FROM gc_media)")
+        cursor.execute("DELETE FROM face_vectors WHERE media_id IN (SELECT id FROM gc_media)")
+        cursor.execute("DELETE FROM dedup_hashes WHERE media_id IN (SELECT id FROM gc_media)")
+        #near-duplicates of a removed item become originals again, and join the validation queue if unvalidated
+        cursor.execute("SELECT id FROM media WHERE duplicate_of IN (SELECT id FROM gc_media)")
+        promoted = [row['id'] for row in cursor.fetchall()]
+        cursor.execute("UPDATE media SET duplicate_of = NULL WHERE duplicate_of IN (SELECT id FROM gc_media)")
+        self._requeue(cursor, promoted)
+        cursor.execute("DELETE FROM media WHERE id IN (SELECT id FROM gc_media)")
+        deleted = cursor.rowcount
+        
+        conn.commit()
+        conn.close()
+        
+        if removed:
+            self._notify('media_deleted', {
+                'media_ids': [row['id'] for row in removed],
+                'text': sum(1 for row in removed if row['type'] == 'text'),
+                'image': sum(1 for row in removed if row['type'] == 'image')
+            })
+        return deleted
+    
+    def delete_superseded_analyses(self):
+        #drop analyses replaced by a newer one for the same media (rescoring, relearning) that were never validated
+        #sentences are moved to the newest analysis first, the search index links to it
+        conn = self.get_connection()
+        cursor = conn.cursor()
+        
+        superseded = """
+        SELECT a.id FROM analysis a
+        WHERE EXISTS (SELECT 1 FROM analysis newer WHERE newer.media_id = a.media_id AND newer.id > a.id)
+          AND NOT EXISTS (SELECT 1 FROM validation v WHERE v.analysis_id = a.id)
+          AND NOT EXISTS (SELECT 1 FROM validation_leases l WHERE l.analysis_id = a.id)
+        """
+        cursor.execute(f"""
+        UPDATE sentences
+        SET analysis_id = (SELECT MAX(a.id) FROM analysis a WHERE a.media_id = sentences.media_id)
+        WHERE analysis_id IN ({superseded})
+        """)
+        cursor.execute(f"DELETE FROM shadow_analysis WHERE analysis_id IN ({superseded})")
+        cursor.execute(f"DELETE FROM analysis WHERE id IN ({superseded})")
+        deleted = cursor.rowcount
+        
+        conn.commit()
+        conn.close()
+        return deleted
+    
+    def delete_orphan_rows(self, now):
+        #rows whose parent is gone and expired leases
+        #shadow results of retired candidates stay, they are the per-version history behind get_version_agreement
+        #returns {table: rows deleted}
+        conn = self.get_connection()
+        cursor = conn.cursor()
+        has_fts = self._has_fts(cursor)
+        deleted = {}
+        
+        def run(table, query, params=()):
+            cursor.execute(query, params)
+            deleted[table] = deleted.get(table, 0) + cursor.rowcount
+        
+        run('validation_leases', "DELETE FROM validation_leases WHERE expires_at <= ? OR analysis_id NOT IN (SELECT id FROM analysis)", (now,))
+        run('analysis', """
+        DELETE FROM analysis WHERE media_id NOT IN (SELECT id FROM media)
+        AND NOT EXISTS (SELECT 1 FROM validation v WHERE v.analysis_id = analysis.id)
+        """)
+        run('shadow_analysis', "DELETE FROM shadow_analysis WHERE analysis_id NOT IN (SELECT id FROM analysis)")
+        run('face_vectors', "DELETE FROM face_vectors WHERE media_id NOT IN (SELECT id FROM media)")
+        run('dedup_hashes', "DELETE FROM dedup_hashes WHERE media_id NOT IN (SELECT id FROM media)")
+        if has_fts:
+            cursor.execute("""
+            INSERT INTO sentence_fts (sentence_fts, rowid, text)
+            SELECT 'delete', id, text FROM sentences WHERE media_id NOT IN (SELECT id FROM media)
+            """)
+        run('sentences', "DELETE FROM sentences WHERE media_id NOT IN (SELECT id FROM media)")
+        run('sentence_vectors', "DELETE FROM sentence_vectors WHERE sentence_id NOT IN (SELECT id FROM sentences)")
+        
+        conn.commit()
+        conn.close()
+        return {table: count for table, count in deleted.items() if count}
+    
+    def get_archivable_media(self, before, limit=500):
+        #file-backed uploads older than before whose (latest) analysis has been validated, not yet archived
+        conn = self.get_connection()
+        cursor = conn.cursor()
+        
+        cursor.execute("""
+        SELECT m.id, m.type, m.path
+        FROM media m
+        WHERE m.content IS NULL
+          AND m.upload_date < ?
+          AND EXISTS (SELECT 1 FROM analysis a JOIN validation v ON v.analysis_id = a.id WHERE a.media_id = m.id)
+          AND NOT EXISTS (SELECT 1 FROM archived_objects o WHERE o.media_id = m.id)
+        ORDER BY m.id
+        LIMIT ?
+        """, (before, limit))
+        rows = [dict(row) for row in cursor.fetchall()]
+        
+        conn.close()
+        return rows
+    
+    def add_archived_objects(self, pack, rows):
+        #record which pack now holds each archived upload, rows: list of (media_id, key, size)
+        conn = self.get_connection()
+        cursor = conn.cursor()
+        
+        now = datetime.now()
+        cursor.executemany(
+            "INSERT OR REPLACE INTO archived_objects (media_id, key, pack, size, archived_at) VALUES (?, ?, ?, ?, ?)",
+            [(media_id, key, pack, size, now) for media_id, key, size in rows]
+        )
+        
+        conn.commit()
+        conn.close()
+    
+    def get_archive_pack(self, key):
+        #pack file holding an archived upload, or None
+        conn = self.get_connection()
+        cursor = conn.cursor()
+        
+        cursor.execute("SELECT pack FROM archived_objects WHERE key = ? LIMIT 1", (key,))
+        row = cursor.fetchone()
+        
+        conn.close()
+        return row['pack'] if row else None
+    
+    def compact(self, pages=None):
+        #return free pages to the filesystem and refresh planner statistics
+        #the first run switches the database to incremental auto-vacuum, which needs one full VACUUM
+        #returns {'freed_bytes', 'full_vacuum', 'size_before', 'size_after'}
+        conn = sqlite3.connect(self.db_path, isolation_level=None)
+        cursor = conn.cursor()
+        
+        page_size = cursor.execute("PRAGMA page_size").fetchone()[0]
+        size_before = cursor.execute("PRAGMA page_count").fetchone()[0] * page_size
+        free_before = cursor.execute("PRAGMA freelist_count").fetchone()[0]
+        
+        full_vacuum = cursor.execute("PRAGMA auto_vacuum").fetchone()[0] != 2
+        if full_vacuum:
+            cursor.execute("PRAGMA auto_vacuum = INCREMENTAL")
+            cursor.execute("VACUUM")
+        elif pages:
+            cursor.execute(f"PRAGMA incremental_vacuum({int(pages)})")
+        else:
+            cursor.execute("PRAGMA incremental_vacuum")
+        
+        cursor.execute("ANALYZE")
+        cursor.execute("PRAGMA optimize")
+        
+        size_after = cursor.execute("PRAGMA page_count").fetchone()[0] * page_size
+        conn.close()
+        return {
+            'freed_bytes': max(0, size_before - size_after),
+            'free_pages_before': free_before,
+            'full_vacuum': full_vacuum,
+            'size_before': size_before,
+            'size_after': size_after
+        }
\ No newline at end of file
@@ -0,0 +1,218 @@
+import io
+import re
+import zlib
+import threading
+import numpy as np
+from collections import defaultdict
+
+#near-duplicate index for uploads
+#images: 64-bit pHash (+ dHash as a second opinion) in a multi-index hash table
+#texts: MinHash signatures of word shingles, bucketed with LSH
+#lookups only touch the few candidates sharing a bucket, so they stay sub-millisecond as the archive grows
+
+HASH_BITS = 64
+PHASH_SIZE = 32
+
+#DCT-II basis for pHash, 32x32
+_DCT = np.cos(np.pi * (2 * np.arange(PHASH_SIZE)[None, :] + 1) * np.arange(PHASH_SIZE)[:, None] / (2 * PHASH_SIZE))
+
+#MinHash permutations h(x) = (a*x + b) mod p over 32-bit shingle hashes, drawn from a fresh generator with a fixed
+#seed in every index, so signatures stored by any process (or before a restart) stay comparable
+MINHASH_PRIME = np.uint64(4294967311)
+MINHASH_SEED = 20240601
+
+WORD = re.compile(r'\w+')
+
+def _bits_to_int(bits):
+    value = 0
+    for bit in bits.ravel():
+        value = (value << 1) | int(bit)
+    return value
+
+def _grayscale(image_bytes):
+    from PIL import Image
+    img = Image.open(io.BytesIO(image_bytes))
+    #JPEG: let libjpeg decode at 1/8 scale, the hashes only look at 32x32
+    img.draft('L', (PHASH_SIZE * 2, PHASH_SIZE * 2))
+    return img.convert('L')
+
+def image_hashes(image_bytes):
+    #(pHash, dHash) as unsigned 64-bit ints
+    img = _grayscale(image_bytes)
+    from PIL import Image
+
+    #pHash: low frequencies of the DCT compared to their median, robust to resizing, recompression and small edits
+    pixels = np.asarray(img.resize((PHASH_SIZE, PHASH_SIZE), Image.LANCZOS), dtype=np.float64)
+    low = (_DCT @ pixels @ _DCT.T)[:8, :8]
+    phash = _bits_to_int(low > np.median(low.ravel()[1:]))
+
+    #dHash: brightness gradient between neighbouring pixels
+    pixels = np.asarray(img.resize((9, 8), Image.LANCZOS), dtype=np.int16)
+    dhash = _bits_to_int(pixels[:, 1:] > pixels[:, :-1])
+    return phash, dhash
+
+def hamming(a, b):
+    return bin(a ^ b).count('1')
+
+def shingles(text, size=3):
+    #word n-grams, case and punctuation insensitive, hashed to stable 32-bit ints
+    #empty for text without words ("?", "!!!"), such texts are never compared
+    words = WORD.findall(text.lower())
+    if not words:
+        return np.zeros(0, dtype=np.uint64)
+    grams = {' '.join(words[i:i + size]) for i in range(len(words) - size + 1)} or {' '.join(words)}
+    return np.fromiter((zlib.crc32(gram.encode('utf-8')) for gram in grams), dtype=np.uint64)
+
+class DedupIndex:
+    #in-memory index over every stored signature, loaded from the dedup_hashes table and kept current on insert
+    def __init__(self, db_manager, image_threshold=6, text_threshold=0.7, num_perm=128, bands=16):
+        self.db = db_manager
+        #max pHash Hamming distance (and dHash distance) for two images to count as the same photo
+        self.image_threshold = image_threshold
+        #min estimated Jaccard similarity of shingles for two texts to count as the same text
+        self.text_threshold = text_threshold
+
+        #pigeonhole: hashes within distance t agree exactly on at least one of t + 1 chunks
+        bounds = np.linspace(0, HASH_BITS, image_threshold + 2).astype(int).tolist()
+        self.chunks = list(zip(bounds[:-1], bounds[1:]))
+        self.image_tables = [defaultdict(list) for _ in self.chunks]
+        self.images = {}
+
+        #LSH with bands x rows = num_perm, candidates share all rows of at least one band
+        self.num_perm = num_perm
+        self.bands = bands
+        self.rows = num_perm // bands
+        rng = np.random.default_rng(MINHASH_SEED)
+        self.perm_a = rng.integers(1, 2 ** 32, size=num_perm, dtype=np.uint64)
+        self.perm_b = rng.integers(0, 2 ** 32, size=num_perm, dtype=np.uint64)
+        self.text_tables = [defaultdict(list) for _ in range(bands)]
+        self.texts = {}
+
+        self.lock = threading.Lock()
+        self.loaded = False
+
+    def load(self):
+        #build the in-memory tables from the database once
+        with self.lock:
+            if self.loaded:
+                return
+            for media_id, phash, dhash, minhash in self.db.get_dedup_hashes():
+                if phash is not None:
+                    self._add_image(media_id, (phash, dhash))
+                if minhash is not None:
+                    self._add_text(media_id, np.frombuffer(minhash, dtype=np.uint64))
+            self.loaded = True
+
+    def _chunk_keys(self, phash):
+        return [(phash >> start) & ((1 << (end - start)) - 1) for start, end in self.chunks]
+
+    def _band_keys(self, signature):
+        return [signature[band * self.rows:(band + 1) * self.rows].tobytes() for band in range(self.bands)]
+
+    def on_db_event(self, event, data):
+        #DBManager listener: deleted media must not be matched (and their analysis reused) any more
+        if event == 'media_deleted':
+            self.remove(data['media_ids'])
+
+    def remove(self, media_ids):
+        with self.lock:
+            for media_id in media_ids:
+                signature = self.images.pop(media_id, None)
+                if signature is not None:
+                    for table, key in zip(self.image_tables, self._chunk_keys(signature[0])):
+                        self._discard(table, key, media_id)
+                signature = self.texts.pop(media_id, None)
+                if signature is not None:
+                    for table, key in zip(self.text_tables, self._band_keys(signature)):
+                        self._discard(table, key, media_id)
+
+    @staticmethod
+    def _discard(table, key, media_id):
+        bucket = table.get(key)
+        if bucket and media_id in bucket:
+            bucket.remove(media_id)
+            if not bucket:
+                del table[key]
+
+    #images
+
+    def image_signature(self, image_bytes):
+        try:
+            return image_hashes(image_bytes)
+        except Exception as e:
+            print(f"Error hashing image: {e}")
+            return None
+
+    def find_image(self, signature):
+        #closest stored image within the threshold, (media_id, pHash distance) or None
+        if signature is None:
+            return None
+        self.load()
+        phash, dhash = signature
+        best = None
+        with self.lock:
+            candidates = set()
+            for table, key in zip(self.image_tables, self._chunk_keys(phash)):
+                candidates.update(table.get(key, ()))
+            for media_id in candidates:
+                other_phash, other_dhash = self.images[media_id]
+                distance = hamming(phash, other_phash)
+                if distance > self.image_threshold or hamming(dhash, other_dhash) > self.image_threshold:
+                    continue
+                if best is None or (distance, media_id) < (best[1], best[0]):
+                    best = (media_id, distance)
+        return best
+
+    def _add_image(self, media_id, signature):
+        self.images[media_id] = signature
+        for table, key in zip(self.image_tables, self._chunk_keys(signature[0])):
+            table[key].append(media_id)
+
+    def add_image(self, media_id, signature):
+        if signature is None:
+            return
+        self.load()
+        self.db.add_dedup_hash(media_id, phash=signature[0], dhash=signature[1])
+        with self.lock:
+            self._add_image(media_id, signature)
+
+    #texts
+
+    def text_signature(self, text):
+        #MinHash signature, (num_perm,) uint64, None for text without words
+        values = shingles(text)
+        if len(values) == 0:
+            return None
+        hashed = (values[:, None] * self.perm_a[None, :] + self.perm_b[None, :]) % MINHASH_PRIME
+        return hashed.min(axis=0)
+
+    def find_text(self, signature):
+        #most similar stored text above the threshold, (media_id, estimated Jaccard similarity) or None
+        if signature is None:
+            return None
+        self.load()
+        best = None
+        with self.lock:
+            candidates = set()
+            for table, key in zip(self.text_tables, self._band_keys(signature)):
+                candidates.update(table.get(key, ()))
+            for media_id in candidates:
+                similarity = float(np.mean(self.texts[media_id] == signature))
+                if similarity < self.text_threshold:
+                    continue
+                if best is None or (-similarity, media_id) < (-best[1], best[0]):
+                    best = (media_id, similarity)
+        return best
+
+    def _add_text(self, media_id, signature):
+        self.texts[media_id] = signature
+        for table, key in zip(self.text_tables, self._band_keys(signature)):
+            table[key].append(media_id)
+
+    def add_text(self, media_id, signature):
+        if signature is None:
+            return
+        self.load()
+        self.db.add_dedup_hash(media_id, minhash=signature.tobytes())
+        with self.lock:
+            self._add_text(media_id, signature)
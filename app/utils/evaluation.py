@@ -0,0 +1,153 @@
+import os
+import numpy as np
+from concurrent.futures import ThreadPoolExecutor
+from scipy.optimize import minimize_scalar
+from sklearn.isotonic import IsotonicRegression
+from sklearn.linear_model import LinearRegression, Ridge
+from sklearn.model_selection import KFold
+
+EPS = 1e-8
+
+class PerClassIsotonic:
+    #one monotone isotonic mapping per emotion, model score k -> validated score k
+    def fit(self, X, y, sample_weight=None):
+        self.models_ = []
+        for k in range(y.shape[1]):
+            model = IsotonicRegression(y_min=0.0, y_max=1.0, out_of_bounds='clip')
+            model.fit(X[:, k], y[:, k], sample_weight=sample_weight)
+            self.models_.append(model)
+        return self
+
+    def predict(self, X):
+        return np.column_stack([model.predict(X[:, k]) for k, model in enumerate(self.models_)])
+
+class TemperatureScaling:
+    #softmax(log(p) / T) with one temperature fit to minimize KL to the validated distributions
+    #only sharpens or flattens, never changes which emotion is on top
+    def fit(self, X, y, sample_weight=None):
+        target = _normalize(y)
+        logits = np.log(np.clip(X, EPS, None))
+
+        def loss(log_t):
+            return np.average(kl_divergence(target, _softmax(logits / np.exp(log_t))), weights=sample_weight)
+
+        self.temperature_ = float(np.exp(minimize_scalar(loss, bounds=(-3, 3), method='bounded').x))
+        return self
+
+    def predict(self, X):
+        return _softmax(np.log(np.clip(X, EPS, None)) / self.temperature_)
+
+#name -> factory
+CANDIDATES = {
+    'linear': LinearRegression,
+    'ridge': lambda: Ridge(alpha=1.0),
+    'isotonic': PerClassIsotonic,
+    'temperature': TemperatureScaling
+}
+
+def _softmax(z):
+    z = z - z.max(axis=1, keepdims=True)
+    e = np.exp(z)
+    return e / e.sum(axis=1, keepdims=True)
+
+def _normalize(p):
+    p = np.clip(p, 0, None) + EPS
+    return p / p.sum(axis=1, keepdims=True)
+
+def top1_agreement(pred, true):
+    #% of samples where the top emotion matches
+    return float(np.mean(np.argmax(pred, axis=1) == np.argmax(true, axis=1)))
+
+def kl_divergence(true, pred):
+    #per-sample KL(true || pred), both normalized to distributions
+    p = _normalize(true)
+    q = _normalize(pred)
+    return np.sum(p * np.log(p / q), axis=1)
+
+def expected_calibration_error(pred, true, bins=10):
+    #gap between confidence in the top emotion and how often it's right, averaged over confidence bins
+    q = _normalize(pred)
+    confidence = q.max(axis=1)
+    correct = np.argmax(q, axis=1) == np.argmax(true, axis=1)
+    edges = np.linspace(0, 1, bins + 1)
+    ece = 0.0
+    for lo, hi in zip(edges[:-1], edges[1:]):
+        in_bin = (confidence > lo) & (confidence <= hi)
+        if in_bin.any():
+            ece += in_bin.mean() * abs(confidence[in_bin].mean() - correct[in_bin].mean())
+    return float(ece)
+
+def score(pred, true):
+    return {
+        'top1': top1_agreement(pred, true),
+        'kl': float(np.mean(kl_divergence(true, pred))),
+        'ece': expected_calibration_error(pred, true)
+    }
+
+def _evaluate_fold(task):
+    #worker: fit one candidate on one fold, X/y/weights are the shared arrays, only the indices differ
+    name, X, y, weights, train_idx, test_idx = task
+    X_test, y_test = X[test_idx], y[test_idx]
+    if name == 'baseline':
+        pred = X_test
+    else:
+        model = CANDIDATES[name]()
+        model.fit(X[train_idx], y[train_idx], sample_weight=None if weights is None else weights[train_idx])
+        pred = np.clip(model.predict(X_test), 0, 1)
+
+    return name, len(test_idx), score(pred, y_test)
+
+class CorrectionEvaluator:
+    #k-fold cross-validation of candidate correction layers, run in parallel on a thread pool
+    #threads, not processes: the fits are numpy/scipy/sklearn work that releases the GIL, the arrays are shared
+    #instead of copied, and nothing is forked from or re-imported into the web process (models, scheduler, threads)
+    def __init__(self, folds=5, candidates=None, max_workers=None, parallel_threshold=200, seed=0):
+        self.folds = folds
+        self.candidates = list(candidates or CANDIDATES)
+        self.max_workers = max_workers or os.cpu_count() or 1
+        #below this many samples a pool costs more than it saves
+        self.parallel_threshold = parallel_threshold
+        self.seed = seed
+
+    def evaluate(self, X, y, sample_weight=None):
+        #returns {name: {'top1', 'kl', 'ece'}} averaged over folds (weighted by fold size),
+        #'baseline' is the uncorrected model output; sample_weight (per row) is used to fit, not to score
+        X = np.asarray(X, dtype=np.float64)
+        y = np.asarray(y, dtype=np.float64)
+        weights = None if sample_weight is None else np.asarray(sample_weight, dtype=np.float64)
+        folds = max(2, min(self.folds, len(X)))
+        splits = list(KFold(n_splits=folds, shuffle=True, random_state=self.seed).split(X))
+        names = ['baseline'] + self.candidates
+
+        tasks = [(name, X, y, weights, train_idx, test_idx) for name in names for train_idx, test_idx in splits]
+        if len(X) >= self.parallel_threshold and self.max_workers > 1:
+            with ThreadPoolExecutor(max_workers=self.max_workers) as pool:
+                outcomes = list(pool.map(_evaluate_fold, tasks))
+        else:
+            outcomes = [_evaluate_fold(task) for task in tasks]
+
+        results = {}
+        for name in names:
+            fold_results = [(n, s) for outcome_name, n, s in outcomes if outcome_name == name]
+            total = sum(n for n, _ in fold_results)
+            results[name] = {
+                metric: sum(n * s[metric] for n, s in fold_results) / total
+                for metric in ('top1', 'kl', 'ece')
+            }
+        return results
+
+    @staticmethod
+    def pick_winner(results):
+        #best cross-validated top-1, ties broken by lower KL then lower calibration error
+        return min(results, key=lambda name: (-results[name]['top1'], results[name]['kl'], results[name]['ece']))
+
+    def select(self, X, y, sample_weight=None):
+        #evaluate, pick the winner and fit it on all data
+        #returns (fitted model or None if the uncorrected model wins, winner name, results)
+        results = self.evaluate(X, y, sample_weight)
+        winner = self.pick_winner(results)
+        if winner == 'baseline':
+            return None, winner, results
+        model = CANDIDATES[winner]()
+        model.fit(np.asarray(X, dtype=np.float64), np.asarray(y, dtype=np.float64), sample_weight=sample_weight)
+        return model, winner, results
@@ -0,0 +1,59 @@
+#helpers for the multi-face image emotion format
+#model output: DeepFace-style list of {'region': ..., 'emotion': {...}} (percentages)
+#validation: list of per-face emotion dicts in [0,1] (older rows store a single dict for the first face)
+
+def extract_faces(model_emotions):
+    #normalize stored image emotion data into a list of per-face emotion dicts
+    if isinstance(model_emotions, list):
+        faces = []
+        for face in model_emotions:
+            if isinstance(face, dict):
+                faces.append(face['emotion'] if 'emotion' in face else face)  # direct emotion mapping
+        return faces
+    elif isinstance(model_emotions, dict):
+        #sometimes image emotions might be stored directly as a dictionary (?)
+        return [model_emotions]
+    return []
+
+def extract_validated_faces(validated_emotions):
+    #normalize a stored image validation into a list of per-face emotion dicts
+    if isinstance(validated_emotions, list):
+        return [face for face in validated_emotions if isinstance(face, dict)]
+    elif isinstance(validated_emotions, dict):
+        #legacy single-face validation, belongs to the first face
+        return [validated_emotions]
+    return []
+
+def pair_faces(model_emotions, validated_emotions):
+    #(model face emotions, validated face emotions) for every face that was validated
+    pairs = []
+    for model_face, validated_face in zip(extract_faces(model_emotions), extract_validated_faces(validated_emotions)):
+        if model_face and validated_face:
+            pairs.append((model_face, validated_face))
+    return pairs
+
+def build_face_payloads(model_emotions):
+    #per-face payloads for the validation UI
+    payloads = []
+    if not isinstance(model_emotions, list):
+        model_emotions = [model_emotions] if isinstance(model_emotions, dict) else []
+    for index, face in enumerate(model_emotions):
+        if not isinstance(face, dict):
+            continue
+        payloads.append({
+            'index': index,
+            'region': face.get('region'),
+            'emotion': face['emotion'] if 'emotion' in face else face
+        })
+    return payloads
+
+def parse_face_form(form):
+    #collect per-face slider values (face<i>_emotion_<name>) from a submitted form
+    #returns a list of emotion dicts ordered by face index, empty if no face fields
+    faces = {}
+    for key, value in form.items():
+        if key.startswith('face') and '_emotion_' in key:
+            face_index, emotion = key[len('face'):].split('_emotion_', 1)
+            if face_index.isdigit():
+                faces.setdefault(int(face_index), {})[emotion] = float(value) / 100
+    return [faces[i] for i in sorted(faces)]
@@ -0,0 +1,67 @@
+from PIL import Image
+
+#decode-side shortcuts for face analysis on large photos
+#libjpeg can decode straight to 1/2, 1/4 or 1/8 scale (IMREAD_REDUCED_*), which skips most of the IDCT
+#work and memory of a full decode; detection and the 48x48 emotion crops don't need the full resolution
+
+#the long side of the decoded image never goes below this, so small faces in group photos are still found
+MIN_DETECTION_SIDE = 1600
+
+def image_dimensions(image_path):
+    #(width, height) from the file header, no pixel data decoded
+    with Image.open(image_path) as img:
+        return img.size
+
+def reduction_factor(width, height, min_side=MIN_DETECTION_SIDE):
+    #largest libjpeg scale that keeps the long side >= min_side
+    long_side = max(width, height)
+    for factor in (8, 4, 2):
+        if long_side // factor >= min_side:
+            return factor
+    return 1
+
+def load_for_detection(image_path, min_side=MIN_DETECTION_SIDE):
+    #[outputs] (BGR image or None, factor to multiply coordinates by to get back to full resolution)
+    #stays BGR: DeepFace treats numpy input as BGR like the rest of OpenCV, so no colour conversion copy is needed
+    #cv2 imported here so the header helpers work without OpenCV (fallback analysis)
+    import cv2
+    reduced_flags = {
+        1: cv2.IMREAD_COLOR,
+        2: cv2.IMREAD_REDUCED_COLOR_2,
+        4: cv2.IMREAD_REDUCED_COLOR_4,
+        8: cv2.IMREAD_REDUCED_COLOR_8
+    }
+
+    try:
+        width, height = image_dimensions(image_path)
+        factor = reduction_factor(width, height, min_side)
+    except Exception:
+        #header unreadable by PIL, let OpenCV try a plain full decode
+        factor = 1
+
+    img = cv2.imread(image_path, reduced_flags[factor])
+    if img is None and factor != 1:
+        img = cv2.imread(image_path, cv2.IMREAD_COLOR)
+        factor = 1
+    return img, factor
+
+def _scale_point(point, factor):
+    if point is None:
+        return None
+    return tuple(int(round(value * factor)) for value in point)
+
+def scale_regions(analysis_results, factor):
+    #map face regions found on a reduced image back to full-resolution coordinates, in place
+    if factor == 1:
+        return analysis_results
+    for face in analysis_results:
+        region = face.get('region') if isinstance(face, dict) else None
+        if not region:
+            continue
+        for key in ('x', 'y', 'w', 'h'):
+            if key in region:
+                region[key] = int(round(region[key] * factor))
+        for key in ('left_eye', 'right_eye'):
+            if key in region:
+                region[key] = _scale_point(region[key], factor)
+    return analysis_results
@@ -0,0 +1,164 @@
+import math
+import heapq
+import asyncio
+import functools
+import itertools
+import threading
+import time
+
+#lower runs first
+INTERACTIVE = 0
+BULK = 1
+
+class InferenceOverloaded(Exception):
+    #raised instead of queueing when a modality is saturated, callers answer 503 + Retry-After
+    def __init__(self, modality, retry_after):
+        super().__init__(f"{modality} inference is overloaded, retry in {retry_after}s")
+        self.modality = modality
+        self.retry_after = retry_after
+
+class _Lane:
+    #concurrency slots, priority wait queue and metrics for one modality
+    #a finishing inference hands its slot straight to the first waiter, so threads and
+    #asyncio tasks can wait in the same queue
+    def __init__(self, limit, max_queue):
+        self.limit = limit
+        self.max_queue = max_queue
+        self.active = 0
+        self.waiting = []
+        self.lock = threading.Lock()
+
+        self.completed = 0
+        self.shed = 0
+        self.timed_out = 0
+        self.total_wait = 0.0
+        self.max_wait = 0.0
+        #moving average of how long one inference takes, used for Retry-After
+        self.avg_service = 1.0
+
+class InferenceScheduler:
+    #bounds how many inferences of each modality run at once; extra requests wait in a bounded
+    #priority queue (interactive before bulk) and are shed when the queue is full
+    def __init__(self, limits=None, max_queue=None, queue_timeout=30.0, bulk_queue_share=0.5):
+        limits = limits or {'text': 2, 'image': 1}
+        max_queue = max_queue or {'text': 32, 'image': 16}
+        self.lanes = {modality: _Lane(limits[modality], max_queue[modality]) for modality in limits}
+        self.queue_timeout = queue_timeout
+        #bulk work may only fill this share of a queue so interactive requests always find room
+        self.bulk_queue_share = bulk_queue_share
+        self._seq = itertools.count()
+
+    def _retry_after(self, lane):
+        return max(1, math.ceil((len(lane.waiting) + 1) * lane.avg_service / lane.limit))
+
+    def _admit(self, modality, lane, priority, wake):
+        #take a free slot (returns None) or join the queue (returns the queue entry); call with lane.lock held
+        if lane.active < lane.limit and not lane.waiting:
+            lane.active += 1
+            return None
+
+        capacity = lane.max_queue if priority == INTERACTIVE else int(lane.max_queue * self.bulk_queue_share)
+        if len(lane.waiting) >= capacity:
+            lane.shed += 1
+            raise InferenceOverloaded(modality, self._retry_after(lane))
+
+        entry = (priority, next(self._seq), wake)
+        heapq.heappush(lane.waiting, entry)
+        return entry
+
+    def _cancel(self, lane, entry):
+        #leave the queue after a timeout; False means the slot was handed over in the meantime
+        with lane.lock:
+            if entry not in lane.waiting:
+                return False
+            lane.waiting.remove(entry)
+            heapq.heapify(lane.waiting)
+            lane.timed_out += 1
+            return True
+
+    def _started(self, lane, enqueued_at):
+        wait = time.monotonic() - enqueued_at
+        with lane.lock:
+            lane.total_wait += wait
+            lane.max_wait = max(lane.max_wait, wait)
+
+    def _release(self, lane, service):
+        with lane.lock:
+            lane.completed += 1
+            lane.avg_service = 0.8 * lane.avg_service + 0.2 * service
+            if lane.waiting:
+                #slot goes to the next waiter, active count stays the same
+                _, _, wake = heapq.heappop(lane.waiting)
+                wake()
+            else:
+                lane.active -= 1
+
+    def run(self, modality, fn, *args, priority=INTERACTIVE, **kwargs):
+        #run fn(*args, **kwargs) on this thread once a slot for the modality is free
+        lane = self.lanes[modality]
+        enqueued_at = time.monotonic()
+        granted = threading.Event()
+
+        with lane.lock:
+            entry = self._admit(modality, lane, priority, granted.set)
+        if entry is not None and not granted.wait(self.queue_timeout):
+            if self._cancel(lane, entry):
+                raise InferenceOverloaded(modality, self._retry_after(lane))
+
+        self._started(lane, enqueued_at)
+        started_at = time.monotonic()
+        try:
+            return fn(*args, **kwargs)
+        finally:
+            self._release(lane, time.monotonic() - started_at)
+
+    async def run_async(self, modality, fn, *args, priority=INTERACTIVE, executor=None, **kwargs):
+        #asyncio version: waiting costs no thread, fn itself runs on an executor
+        lane = self.lanes[modality]
+        loop = asyncio.get_running_loop()
+        enqueued_at = time.monotonic()
+        granted = loop.create_future()
+
+        def wake():
+            loop.call_soon_threadsafe(lambda: granted.done() or granted.set_result(True))
+
+        with lane.lock:
+            entry = self._admit(modality, lane, priority, wake)
+        if entry is not None:
+            try:
+                await asyncio.wait_for(asyncio.shield(granted), self.queue_timeout)
+            except asyncio.TimeoutError:
+                if self._cancel(lane, entry):
+                    raise InferenceOverloaded(modality, self._retry_after(lane))
+            except asyncio.CancelledError:
+                #client went away: leave the queue, or give back a slot we were just handed
+                if not self._cancel(lane, entry):
+                    self._release(lane, 0.0)
+                raise
+
+        self._started(lane, enqueued_at)
+        started_at = time.monotonic()
+        try:
+            return await loop.run_in_executor(executor, functools.partial(fn, *args, **kwargs))
+        finally:
+            self._release(lane, time.monotonic() - started_at)
+
+    def metrics(self):
+        #queue depth, wait times and shed counts per modality
+        result = {}
+        for modality, lane in self.lanes.items():
+            with lane.lock:
+                admitted = lane.completed + lane.active
+                result[modality] = {
+                    'limit': lane.limit,
+                    'active': lane.active,
+                    'queued': len(lane.waiting),
+                    'max_queue': lane.max_queue,
+                    'completed': lane.completed,
+                    'shed': lane.shed,
+                    'timed_out': lane.timed_out,
+                    'avg_queue_wait': lane.total_wait / admitted if admitted else 0.0,
+                    'max_queue_wait': lane.max_wait,
+                    'avg_service_time': lane.avg_service
+                }
+        return result
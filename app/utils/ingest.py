@@ -0,0 +1,126 @@
+from utils.json_utils import json_serialize
+from utils.validation_queue import top_margin
+from utils.sentence_index import split_sentences
+
+class IngestService:
+    #upload pipeline shared by the Flask UI and the async API:
+    #store content -> run inference (caller decides how, sync or awaited) -> record results
+    def __init__(self, db_manager, storage, thumbnails, text_model, image_model, dedup=None):
+        self.db = db_manager
+        self.storage = storage
+        self.thumbnails = thumbnails
+        self.text_model = text_model
+        self.image_model = image_model
+        #near-duplicate index, None turns dedup off
+        self.dedup = dedup
+
+    def store_text(self, text_content):
+        #small texts stay in SQLite, larger ones are written in the background
+        stored = self.storage.save(text_content.encode('utf-8'), 'txt', allow_inline=True)
+        if self.dedup:
+            stored['signature'] = self.dedup.text_signature(text_content)
+            match = self.dedup.find_text(stored['signature'])
+            stored['duplicate_of'] = match[0] if match else None
+        return stored
+
+    def reuse_analysis(self, stored, media_type):
+        #near-duplicate of an earlier upload: copy its analysis instead of running the model again
+        #only when it was made by the current model version, otherwise the caller runs inference as usual
+        #returns the new analysis id or None
+        duplicate_of = stored.get('duplicate_of')
+        if duplicate_of is None:
+            return None
+
+        model = self.text_model if media_type == 'text' else self.image_model
+        prior = self.db.get_latest_analysis(duplicate_of)
+        if not prior or prior['model_version'] != model.snapshot.version:
+            return None
+
+        media_id = self.db.add_media(media_type, stored['path'], stored['hash'], stored.get('content'), duplicate_of)
+        if media_type == 'image':
+            self.db.copy_face_vectors(duplicate_of, media_id)
+        print(f"Upload is a near-duplicate of media {duplicate_of}, reusing analysis {prior['id']}")
+        return self.db.add_analysis(media_id, prior['model_version'], prior['emotion_data'], prior['top_margin'])
+
+    def _fresh_analysis(self, stored):
+        #record_* run after inference, so the upload did not reuse an analysis even if it has a near-duplicate:
+        #it isn't marked as a duplicate (that would keep its unvalidated analysis out of the validation queue)
+        #returns whether the upload has a near-duplicate, such uploads stay out of the dedup index
+        near_duplicate = stored.get('duplicate_of') is not None
+        stored['duplicate_of'] = None
+        return near_duplicate
+
+    def analyze_text(self, text_content):
+        #live and shadow candidate (if any) scored together, plus every sentence in one batch for the search index
+        #the model snapshot is read once, everything is scored and later recorded with that one version
+        #returns (emotions, shadow emotions, model snapshot, (sentences, sentence vectors) or None)
+        snapshot = self.text_model.snapshot
+        emotions, shadow_emotions = self.text_model.analyze_with_shadow(text_content, snapshot=snapshot)
+        return emotions, shadow_emotions, snapshot, self.analyze_sentences(text_content, snapshot)
+
+    def analyze_sentences(self, text_content, snapshot=None):
+        #a failure here only costs the upload its search entries, never the upload itself
+        try:
+            sentences = split_sentences(text_content)
+            return sentences, self.text_model.analyze_sentences([sentence for _, _, sentence in sentences], snapshot)
+        except Exception as e:
+            print(f"Error analyzing sentences: {e}")
+            return None
+
+    def record_text(self, stored, analyzed):
+        emotions, shadow_emotions, snapshot, sentence_index = analyzed
+        near_duplicate = self._fresh_analysis(stored)
+
+        media_id = self.db.add_media('text', stored['path'], stored['hash'], stored['content'])
+        analysis_id = self.db.add_analysis(media_id, snapshot.version, json_serialize(emotions), top_margin(emotions))
+        if shadow_emotions is not None:
+            self.db.add_shadow_analysis(analysis_id, snapshot.candidate_version, json_serialize(shadow_emotions))
+        if sentence_index is not None:
+            self.db.add_sentences(media_id, analysis_id, *sentence_index, snapshot.emotions)
+        #only originals go in the index, later copies match them
+        if self.dedup and not near_duplicate:
+            self.dedup.add_text(media_id, stored['signature'])
+
+        return analysis_id
+
+    def store_image(self, image_bytes, extension):
+        stored = self.storage.save(image_bytes, extension)
+        if self.dedup:
+            stored['signature'] = self.dedup.image_signature(image_bytes)
+            match = self.dedup.find_image(stored['signature'])
+            stored['duplicate_of'] = match[0] if match else None
+
+        #preview from the bytes already in memory, no re-read from disk
+        try:
+            self.thumbnails.create(stored['key'], image_bytes)
+        except Exception as e:
+            print(f"Error creating thumbnail: {e}")
+
+        #DeepFace reads from disk, so this write has to land before analysis
+        self.storage.wait(stored['key'])
+
+        print(f"Saved image to {stored['path']}")
+        return stored
+
+    def analyze_image(self, stored):
+        #base inference only, correction happens in record_image
+        return self.image_model.analyze_raw(stored['path'])
+
+    def record_image(self, stored, raw_results):
+        #one snapshot for the correction and the versions recorded with it
+        snapshot = self.image_model.snapshot
+        emotions, shadow_emotions = self.image_model.apply_correction_with_shadow(raw_results, snapshot=snapshot)
+        near_duplicate = self._fresh_analysis(stored)
+
+        print(f"Image analysis complete, results: {type(emotions)}")
+
+        media_id = self.db.add_media('image', stored['path'], stored['hash'])
+        #keep raw per-face vectors so later correction versions can re-score without inference
+        self.db.add_face_vectors(media_id, [face.get('region') for face in raw_results], self.image_model.raw_vectors(raw_results, snapshot.emotions))
+        analysis_id = self.db.add_analysis(media_id, snapshot.version, json_serialize(emotions), top_margin(emotions))
+        if shadow_emotions is not None:
+            self.db.add_shadow_analysis(analysis_id, snapshot.candidate_version, json_serialize(shadow_emotions))
+        if self.dedup and not near_duplicate:
+            self.dedup.add_image(media_id, stored['signature'])
+
+        return analysis_id
@@ -1,9 +1,16 @@
 import json
 import numpy as np
 
+#orjson serializes numpy natively in C, the stdlib encoder with a default hook is the fallback
+try:
+    import orjson
+except ImportError:
+    orjson = None
+
 def convert_numpy_types(obj):
     #convert numpy types to normal python types for JSON serialization
     #recursively processes dictionaries, lists, and numpy types
+    #(rebuilds the whole structure, json_serialize doesn't need this anymore)
 
     if isinstance(obj, np.integer):
         return int(obj)
@@ -18,6 +25,66 @@ def convert_numpy_types(obj):
     else:
         return obj
 
+def _numpy_default(obj):
+    #only called by the encoder for objects it can't handle itself, so plain python values cost nothing
+    if isinstance(obj, np.integer):
+        return int(obj)
+    elif isinstance(obj, np.floating):
+        return float(obj)
+    elif isinstance(obj, np.bool_):
+        return bool(obj)
+    elif isinstance(obj, np.ndarray):
+        return obj.tolist()
+    raise TypeError(f"Object of type {type(obj).__name__} is not JSON serializable")
+
+_encoder = json.JSONEncoder(default=_numpy_default)
+
 def json_serialize(obj):
-    #serialize an object to JSON string, converting numpy types along the way
-    return json.dumps(convert_numpy_types(obj))
\ No newline at end of file
+    #serialize an object to JSON string in a single pass, numpy types handled on the way
+    if orjson is not None:
+        return orjson.dumps(obj, default=_numpy_default, option=orjson.OPT_SERIALIZE_NUMPY).decode('utf-8')
+    return _encoder.encode(obj)
+
+#compact binary emotion payloads: little-endian float32 scores in a fixed label order
+#faces add a region as 4 little-endian int32 (x, y, w, h), -1 when there is no region
+_FACE_HEADER = np.dtype('<u2')
+
+def pack_emotions(emotions, labels):
+    #emotion dict -> bytes (4 bytes per label)
+    return np.asarray([emotions.get(label, 0) for label in labels], dtype='<f4').tobytes()
+
+def unpack_emotions(data, labels):
+    #bytes from pack_emotions -> emotion dict
+    return dict(zip(labels, np.frombuffer(data, dtype='<f4').tolist()))
+
+def pack_faces(faces, labels):
+    #DeepFace-style list of faces -> bytes: face count, then per face region + scores
+    regions = []
+    scores = []
+    for face in faces:
+        region = face.get('region') or {}
+        regions.append([region[k] if region.get(k) is not None else -1 for k in ('x', 'y', 'w', 'h')])
+        emotions = face.get('emotion', {})
+        scores.append([emotions.get(label, 0) for label in labels])
+
+    return (
+        np.asarray([len(faces)], dtype=_FACE_HEADER).tobytes()
+        + np.asarray(regions, dtype='<i4').reshape(-1, 4).tobytes()
+        + np.asarray(scores, dtype='<f4').reshape(-1, len(labels)).tobytes()
+    )
+
+def unpack_faces(data, labels):
+    #bytes from pack_faces -> DeepFace-style list of faces
+    n_faces = int(np.frombuffer(data[:_FACE_HEADER.itemsize], dtype=_FACE_HEADER)[0])
+    offset = _FACE_HEADER.itemsize
+    regions = np.frombuffer(data[offset:offset + n_faces * 16], dtype='<i4').reshape(n_faces, 4).tolist()
+    offset += n_faces * 16
+    scores = np.frombuffer(data[offset:], dtype='<f4').reshape(n_faces, len(labels)).tolist()
+
+    faces = []
+    for region, face_scores in zip(regions, scores):
+        face = {'emotion': dict(zip(labels, face_scores))}
+        if region[2] >= 0:
+            face['region'] = dict(zip(('x', 'y', 'w', 'h'), region))
+        faces.append(face)
+    return faces
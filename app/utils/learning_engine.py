@@ -1,13 +1,15 @@
 import json
-import numpy as np
 import os
 import time
 import datetime
+import threading
 from joblib import dump, load
-from sklearn.linear_model import LinearRegression
+from utils.face_utils import pair_faces
+from utils.evaluation import CorrectionEvaluator
+from utils.training_sampler import StratifiedReservoir
 
 class LearningEngine:
-    def __init__(self, db_manager, text_model, image_model):
+    def __init__(self, db_manager, text_model, image_model, models_dir=os.path.join('data', 'models')):
         #learning engine that improves emotion models over time
         self.db = db_manager
         self.text_model = text_model
@@ -16,224 +18,349 @@ class LearningEngine:
         #MIN VALIDATIONS NEEDED BEFORE TRIGGERING LEARNING - CHANGE HERE IF DESIRED
         self.min_validations = 5
         
-        self.models_dir = os.path.join('data', 'models')
+        #cross-validated choice between candidate correction layers
+        self.evaluator = CorrectionEvaluator(folds=5)
+        
+        #new layers are scored in shadow next to the live one until this many validated samples compare them
+        self.shadow_mode = True
+        self.min_shadow_samples = 20
+        
+        #saved layers, candidates and training samples; loaded back from here below
+        self.models_dir = models_dir
         os.makedirs(self.models_dir, exist_ok=True)
         
+        #correction layers are fit on a bounded sample, at most this many rows per validated top emotion
+        #samples load lazily (from models_dir) and take new validations in incrementally
+        self.sample_capacity = 500
+        self.samples = {}
+        self.sample_lock = threading.Lock()
+        self.learn_lock = threading.Lock()
+        
         self._load_correction_layers()
     
     def _load_correction_layers(self):
-        #Load existing correction layers for both models
-        #image correction layer (regression model)
-        image_corr_path = os.path.join(self.models_dir, 'image_correction.joblib')
-        if os.path.exists(image_corr_path):
-            try:
-                self.image_correction = load(image_corr_path)
-                print("loaded image correction layer")
-            except:
-                print("Failed to load image correction layer, creating new one")
-                self.image_correction = None
-        else:
-            self.image_correction = None
-        
-        #text correction weights
-        text_corr_path = os.path.join(self.models_dir, 'text_correction.joblib')
-        if os.path.exists(text_corr_path):
-            try:
-                self.text_correction = load(text_corr_path)
-                print("loaded text correction weights")
-            except:
-                print("Failed to load text correction weights, creating new ones")
-                self.text_correction = None
-        else:
-            self.text_correction = None
+        #Load the live layers and shadow candidates saved by an earlier run back into the models
+        #files hold {'layer', 'version'(, 'accuracy')}, a bare layer is a live file from before versions were saved
+        self.candidate_accuracy = {}
+        for model_type in ('text', 'image'):
+            model = self._model_for(model_type)
+            
+            live = self._load_saved(f'{model_type}_correction.joblib')
+            if live is not None:
+                if not isinstance(live, dict):
+                    live = {'layer': live, 'version': self._latest_version(model_type) or model.version}
+                model.set_live(live['layer'], live['version'])
+                print(f"loaded {model_type} correction layer {live['version']}")
+            
+            candidate = self._load_saved(f'{model_type}_candidate.joblib')
+            if isinstance(candidate, dict):
+                model.set_candidate(candidate['layer'], candidate['version'])
+                self.candidate_accuracy[model_type] = candidate.get('accuracy')
+                print(f"loaded {model_type} shadow candidate {candidate['version']}")
+            elif candidate is not None:
+                #no version saved with it, its shadow results can't be told apart, start over
+                print(f"Discarding {model_type} candidate saved without a version")
+                os.remove(os.path.join(self.models_dir, f'{model_type}_candidate.joblib'))
+    
+    def _load_saved(self, filename):
+        path = os.path.join(self.models_dir, filename)
+        if not os.path.exists(path):
+            return None
+        try:
+            return load(path)
+        except Exception as e:
+            print(f"Failed to load {filename}, starting without it: {e}")
+            return None
+    
+    def _latest_version(self, model_type):
+        #tables may not exist yet on the very first start
+        try:
+            return self.db.get_latest_model_version(model_type)
+        except Exception:
+            return None
     
     def should_learn(self):
         #check if we have enough validations to trigger learning
-        #get pending validations for both models
-        text_validations = self.db.get_pending_validations('text')
-        image_validations = self.db.get_pending_validations('image')
+        #a candidate in shadow needs checking for promotion as validations come in
+        if self.text_model.candidate_version or self.image_model.candidate_version:
+            return True
         
-        #check if we have enough validations
-        return (len(text_validations) >= self.min_validations or 
-                len(image_validations) >= self.min_validations)
+        #fold new validations into the samples and check if enough arrived since the last fit
+        return any(self.refresh_sample(model_type).pending >= self.min_validations
+                   for model_type in ('text', 'image'))
     
     def learn(self):
         #Improve models based on collected validations.
-        #learning for text emotion model
-        text_validations = self.db.get_pending_validations('text')
-        if len(text_validations) >= self.min_validations:
-            self._learn_text_model(text_validations)
+        #returns True if a live model changed or a new candidate went into shadow
+        #one learner at a time: a call that finds learning already running returns False right away,
+        #the running one folds in the same validations
+        if not self.learn_lock.acquire(blocking=False):
+            return False
+        try:
+            return self._learn()
+        finally:
+            self.learn_lock.release()
+    
+    def _learn(self):
+        changed = self.check_promotions()
+        
+        #learning for text emotion model (not while a text candidate is still being compared)
+        text_sample = self.refresh_sample('text')
+        if self.text_model.candidate_version is None and text_sample.pending >= self.min_validations:
+            changed = self._learn_text_model(text_sample) or changed
         
         #learning for image emotion model
-        image_validations = self.db.get_pending_validations('image')
-        if len(image_validations) >= self.min_validations:
-            self._learn_image_model(image_validations)
-    
-    def _learn_text_model(self, validations):
-        #Learn from text validations to improve text emotion model
-        print(f"Learning from {len(validations)} text validations")
+        image_sample = self.refresh_sample('image')
+        if self.image_model.candidate_version is None and image_sample.pending >= self.min_validations:
+            changed = self._learn_image_model(image_sample) or changed
         
-        #process validations to create training data
-        X = []  #model predictions
-        y = []  #user validations
+        return changed
+    
+    def _sample_path(self, model_type):
+        return os.path.join(self.models_dir, f'{model_type}_sample.joblib')
+    
+    def _load_sample(self, model_type):
+        emotions = self._model_for(model_type).emotions
+        path = self._sample_path(model_type)
+        if os.path.exists(path):
+            try:
+                sample = load(path)
+                if sample.emotions == list(emotions) and sample.capacity == self.sample_capacity:
+                    return sample
+            except Exception:
+                print(f"Failed to load {model_type} training sample, rebuilding it")
+        return StratifiedReservoir(emotions, self.sample_capacity)
+    
+    def refresh_sample(self, model_type):
+        #the training sample of one model with every validation up to now folded in
+        #only validations newer than the last one seen are read, so this costs O(new validations)
+        with self.sample_lock:
+            sample = self.samples.get(model_type)
+            if sample is None:
+                sample = self.samples[model_type] = self._load_sample(model_type)
+            
+            if sample.last_validation_id > self.db.get_last_validation_id():
+                #sample belongs to another (e.g. reset) database, start over
+                sample = self.samples[model_type] = StratifiedReservoir(sample.emotions, self.sample_capacity)
+            
+            to_rows = self._text_rows if model_type == 'text' else self._image_rows
+            added = 0
+            while True:
+                validations = self.db.get_validations_after(model_type, sample.last_validation_id)
+                if not validations:
+                    break
+                for validation in validations:
+                    #a bad row is logged and skipped, the position always moves past it so it isn't re-read forever
+                    try:
+                        for x_vec, y_vec in to_rows(validation):
+                            sample.add(x_vec, y_vec)
+                    except Exception as e:
+                        print(f"Error processing validation {validation['id']}: {e}")
+                    sample.last_validation_id = validation['id']
+                added += len(validations)
+            
+            if added:
+                sample.pending += added
+                dump(sample, self._sample_path(model_type))
+            return sample
+    
+    def get_sample_status(self):
+        #per-emotion rows seen / kept in each training sample
+        return {model_type: {'rows': len(sample), 'pending_validations': sample.pending, 'emotions': sample.stats()}
+                for model_type, sample in ((t, self.refresh_sample(t)) for t in ('text', 'image'))}
+    
+    def _fitted(self, model_type, sample):
+        #the validations in the sample are used up, the next fit waits for min_validations new ones
+        with self.sample_lock:
+            sample.pending = 0
+            dump(sample, self._sample_path(model_type))
+    
+    def _text_rows(self, validation):
+        #one training row per text validation
+        emotions = self.text_model.emotions
         
-        for validation in validations:
+        try:
             model_emotions = json.loads(validation['emotion_data'])
             user_emotions = json.loads(validation['validated_emotions'])
             
-            #convert to feature vectors
-            #gna extract all emotion values in a fixed order
-            emotions = list(model_emotions.keys())
-            
-            x_vec = [model_emotions.get(emotion, 0) for emotion in emotions]
-            y_vec = [user_emotions.get(emotion, 0) for emotion in emotions]
+            #skip anything that isn't one emotion dict on each side
+            if not isinstance(model_emotions, dict) or not isinstance(user_emotions, dict):
+                print(f"Skipping validation {validation['id']} - couldn't extract emotions")
+                return []
             
-            X.append(x_vec)
-            y.append(y_vec)
-        
-        X = np.array(X)
-        y = np.array(y)
+            #convert to feature vectors
+            #gna extract all emotion values in a fixed order (base predictions come sorted by score,
+            #so the model's label order is used, same as TextEmotionModel.analyze)
+            x_vec = [float(model_emotions.get(emotion, 0)) for emotion in emotions]
+            y_vec = [float(user_emotions.get(emotion, 0)) for emotion in emotions]
+            return [(x_vec, y_vec)]
         
-        #create correction layer (linear regression for simplicity)
-        correction = LinearRegression()
-        correction.fit(X, y)
+        except Exception as e:
+            print(f"Error processing validation {validation['id']}: {e}")
+            return []
+    
+    def _image_rows(self, validation):
+        #one training row per validated face
+        emotions = self.image_model.emotions
         
-        # save
-        dump(correction, os.path.join(self.models_dir, 'text_correction.joblib'))
-        self.text_correction = correction
+        try:
+            model_emotions = json.loads(validation['emotion_data'])
+            user_emotions = json.loads(validation['validated_emotions'])
+            
+            face_pairs = pair_faces(model_emotions, user_emotions)
+            
+            #skip if we couldn't extract emotions properly
+            if not face_pairs:
+                print(f"Skipping validation {validation['id']} - couldn't extract emotions")
+                return []
+            
+            #convert to feature vectors using a fixed list of emotions
+            #model output is in percentages, correction layer works in [0,1]
+            return [([face_emotions.get(emotion, 0) / 100.0 for emotion in emotions],
+                     [user_face.get(emotion, 0) for emotion in emotions])
+                    for face_emotions, user_face in face_pairs]
         
-        #update text model to use correction
-        self.text_model.set_correction_layer(correction)
+        except Exception as e:
+            print(f"Error processing validation {validation['id']}: {e}")
+            return []
+    
+    def _learn_text_model(self, sample):
+        #Learn from text validations to improve text emotion model
+        #training data is the balanced sample: model predictions X, user validations y, per-emotion weights
+        X, y, weights = sample.sample()
+        print(f"Learning from {len(X)} sampled text validations ({sample.pending} new)")
         
-        #calc accuracy improvement
-        accuracy_before = self._calculate_agreement(X, y)
-        y_pred = correction.predict(X)
-        accuracy_after = self._calculate_agreement(y_pred, y)
+        #if not enough data after filtering, return
+        if len(X) < 2:
+            print("Not enough valid data points for training after processing")
+            return False
         
-        #save new model version
-        new_version = f"text_{datetime.datetime.now().strftime('%Y%m%d_%H%M%S')}"
-        self.text_model.update_version(new_version)
-        self.db.add_model_version('text', new_version, accuracy_after)
+        #pick the correction layer by cross-validation
+        correction, accuracy_before, accuracy_after = self._select_correction('text', X, y, weights)
+        self._fitted('text', sample)
+        if correction is None:
+            return False
         
-        print(f"Text model improved: Accuracy {accuracy_before:.2f} -> {accuracy_after:.2f}")
+        self._publish('text', correction, accuracy_before, accuracy_after)
+        return True
     
-    def _learn_image_model(self, validations):
+    def _learn_image_model(self, sample):
         #learn from image validations to improve image emotion model
-        print(f"Learning from {len(validations)} image validations")
-        
-        #process validations to create training data
-        X = []  #model predictions
-        y = []  #user validations
-        
-        for validation in validations:
-            try:
-                model_emotions = json.loads(validation['emotion_data'])
-                user_emotions = json.loads(validation['validated_emotions'])
-                
-                #extract emotions from model predictions based on structure
-                face_emotions = {}
-                if isinstance(model_emotions, list) and len(model_emotions) > 0:
-                    #for DeepFace results (list of faces)
-                    if 'emotion' in model_emotions[0]:
-                        face_emotions = model_emotions[0]['emotion']
-                    else:
-                        face_emotions = model_emotions[0]  # direct emotion mapping
-                elif isinstance(model_emotions, dict):
-                    #emotions already in dictionary format
-                    face_emotions = model_emotions
-                
-                #skip if we couldn't extract emotions properly
-                if not face_emotions:
-                    print(f"Skipping validation {validation['id']} - couldn't extract emotions")
-                    continue
-                    
-                #convert to feature vectors using a fixed list of emotions
-                emotions = self.image_model.emotions
-                
-                x_vec = [face_emotions.get(emotion, 0) for emotion in emotions]
-                y_vec = [user_emotions.get(emotion, 0) for emotion in emotions]
-                
-                X.append(x_vec)
-                y.append(y_vec)
-            
-            except Exception as e:
-                print(f"Error processing validation {validation['id']}: {e}")
-                continue
+        X, y, weights = sample.sample()
+        print(f"Learning from {len(X)} sampled image faces ({sample.pending} new validations)")
         
         #if not enough data after filtering, return
         if len(X) < 2:
             print("Not enough valid data points for training after processing")
-            return
-        
-        X = np.array(X)
-        y = np.array(y)
+            return False
         
-        # create correction layer (linear regression for simplicity)
-        correction = LinearRegression()
-        correction.fit(X, y)
+        #pick the correction layer by cross-validation
+        correction, accuracy_before, accuracy_after = self._select_correction('image', X, y, weights)
+        self._fitted('image', sample)
+        if correction is None:
+            return False
         
-        dump(correction, os.path.join(self.models_dir, 'image_correction.joblib'))
-        self.image_correction = correction
+        self._publish('image', correction, accuracy_before, accuracy_after)
+        return True
+    
+    def _model_for(self, model_type):
+        return self.text_model if model_type == 'text' else self.image_model
+    
+    def _publish(self, model_type, correction, accuracy_before, accuracy_after):
+        #new layer; in shadow mode it's scored next to the live layer until validations decide
+        #a version row is only recorded once a layer goes live, dropped candidates never show up as versions
+        model = self._model_for(model_type)
+        new_version = f"{model_type}_{datetime.datetime.now().strftime('%Y%m%d_%H%M%S')}"
         
-        #update image model to use correction
-        self.image_model.set_correction_layer(correction)
+        if self.shadow_mode:
+            dump({'layer': correction, 'version': new_version, 'accuracy': accuracy_after},
+                 os.path.join(self.models_dir, f'{model_type}_candidate.joblib'))
+            self.candidate_accuracy[model_type] = accuracy_after
+            model.set_candidate(correction, new_version)
+            print(f"{model_type.capitalize()} candidate {new_version} in shadow: CV accuracy {accuracy_before:.2f} -> {accuracy_after:.2f}")
+        else:
+            self._save_live(model_type, correction, new_version)
+            model.set_live(correction, new_version)
+            self.db.add_model_version(model_type, new_version, accuracy_after)
+            print(f"{model_type.capitalize()} model improved: Accuracy {accuracy_before:.2f} -> {accuracy_after:.2f}")
+    
+    def _save_live(self, model_type, correction, version):
+        # save
+        dump({'layer': correction, 'version': version}, os.path.join(self.models_dir, f'{model_type}_correction.joblib'))
+    
+    def check_promotions(self):
+        #promote or drop shadow candidates once enough of their traffic has been validated
+        #a candidate goes live if it agrees with annotators at least as often as the live layer did on the same items
+        changed = False
+        for model_type in ('text', 'image'):
+            model = self._model_for(model_type)
+            snapshot = model.snapshot
+            if snapshot.candidate_version is None:
+                continue
+            
+            comparison = self.db.get_shadow_comparison(snapshot.candidate_version)
+            if comparison['samples'] < self.min_shadow_samples:
+                continue
+            
+            candidate_version = snapshot.candidate_version
+            accuracy = self.candidate_accuracy.pop(model_type, None)
+            if comparison['shadow_hits'] >= comparison['live_hits']:
+                self._save_live(model_type, snapshot.candidate_layer, candidate_version)
+                model.promote_candidate()
+                self.db.add_model_version(model_type, candidate_version, accuracy)
+                changed = True
+                print(f"Promoted {candidate_version}: {comparison['shadow_hits']} vs {comparison['live_hits']} "
+                      f"agreements on {comparison['samples']} shadow samples")
+            else:
+                model.clear_candidate()
+                print(f"Dropped {candidate_version}: {comparison['shadow_hits']} vs {comparison['live_hits']} "
+                      f"agreements on {comparison['samples']} shadow samples")
+            
+            candidate_path = os.path.join(self.models_dir, f'{model_type}_candidate.joblib')
+            if os.path.exists(candidate_path):
+                os.remove(candidate_path)
         
-        #calc accuracy improvement
-        accuracy_before = self._calculate_agreement(X, y)
-        y_pred = correction.predict(X)
-        accuracy_after = self._calculate_agreement(y_pred, y)
+        return changed
+    
+    def get_shadow_status(self):
+        #live/candidate versions and the running comparison for each model
+        status = {}
+        for model_type in ('text', 'image'):
+            snapshot = self._model_for(model_type).snapshot
+            status[model_type] = {
+                'live_version': snapshot.version,
+                'candidate_version': snapshot.candidate_version,
+                'comparison': self.db.get_shadow_comparison(snapshot.candidate_version) if snapshot.candidate_version else None,
+                'min_shadow_samples': self.min_shadow_samples,
+                'versions': self.db.get_version_agreement(model_type)
+            }
+        return status
+    
+    def _select_correction(self, model_type, X, y, weights=None):
+        #k-fold cross-validate the candidate correctors and fit the winner on all data
+        #accuracies are out-of-sample top-1 agreement: (uncorrected model, chosen correction)
+        correction, winner, results = self.evaluator.select(X, y, weights)
         
-        #save new model version
-        new_version = f"image_{datetime.datetime.now().strftime('%Y%m%d_%H%M%S')}"
-        self.image_model.update_version(new_version)
-        self.db.add_model_version('image', new_version, accuracy_after)
+        for name, metrics in results.items():
+            print(f"  {model_type} {name}: top1 {metrics['top1']:.2f}, KL {metrics['kl']:.3f}, ECE {metrics['ece']:.3f}")
         
-        print(f"Image model improved: Accuracy {accuracy_before:.2f} -> {accuracy_after:.2f}")
-    
-    def _calculate_agreement(self, pred, true):
-        #Calculate agreement between predictions and ground truth
-        #get top emotion for each sample
-        pred_top = np.argmax(pred, axis=1)
-        true_top = np.argmax(true, axis=1)
+        accuracy_before = results['baseline']['top1']
+        if correction is None:
+            print(f"No correction beats the uncorrected {model_type} model in cross-validation, keeping current layer")
+            return None, accuracy_before, accuracy_before
         
-        #calc accuracy (% of matching top emotions)
-        accuracy = np.mean(pred_top == true_top)
-        return accuracy
+        print(f"Selected {winner} correction for {model_type} model")
+        return correction, accuracy_before, results[winner]['top1']
     
     def get_accuracy_data(self):
         #Get accuracy data for visualization dashboard
-        conn = self.db.get_connection()
-        cursor = conn.cursor()
-        
-        #get model version history with accuracy
-        cursor.execute("""
-        SELECT model_type, version, created_date, accuracy 
-        FROM model_versions 
-        ORDER BY created_date ASC
-        """)
-        
-        versions = cursor.fetchall()
-        conn.close()
-        
         #organize data for visualization
-        text_versions = []
-        image_versions = []
-        
-        for v in versions:
-            if v['model_type'] == 'text':
-                text_versions.append({
-                    'date': v['created_date'],
-                    'accuracy': v['accuracy'] or 0,
-                    'version': v['version']
-                })
-            elif v['model_type'] == 'image':
-                image_versions.append({
-                    'date': v['created_date'],
-                    'accuracy': v['accuracy'] or 0,
-                    'version': v['version']
-                })
-        
-        return {
-            'text': text_versions,
-            'image': image_versions
-        }
\ No newline at end of file
+        data = {}
+        for model_type in ('text', 'image'):
+            data[model_type] = [{
+                'date': v['created_date'],
+                'accuracy': v['accuracy'] or 0,
+                'version': v['version']
+            } for v in self.db.get_model_versions_series(model_type)]
+        
+        return data
\ No newline at end of file
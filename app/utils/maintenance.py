@@ -0,0 +1,238 @@
+import os
+import time
+import zipfile
+import tempfile
+import threading
+from datetime import datetime, timedelta
+
+#file types that are already compressed, stored as is inside packs
+PRECOMPRESSED = ('.jpg', '.jpeg', '.png', '.webp')
+
+class PackArchive:
+    #old uploads live in zip packs under archive_dir once archived; the database maps key -> pack
+    def __init__(self, db_manager, archive_dir):
+        self.db = db_manager
+        self.archive_dir = archive_dir
+        os.makedirs(archive_dir, exist_ok=True)
+
+    def read(self, key):
+        #bytes of an archived upload, None if it was never archived
+        pack = self.db.get_archive_pack(key)
+        if pack is None:
+            return None
+        with zipfile.ZipFile(os.path.join(self.archive_dir, pack)) as zf:
+            return zf.read(key)
+
+    def write_pack(self, objects):
+        #objects: list of (key, path of the file on disk), each file is streamed into the zip in chunks
+        #so memory use doesn't depend on pack or file size
+        #written to a temp file and renamed so a crash never leaves half a pack
+        #returns (pack name, pack size)
+        name = f"pack-{datetime.now().strftime('%Y%m%d-%H%M%S')}-{os.getpid()}.zip"
+        fd, tmp_path = tempfile.mkstemp(dir=self.archive_dir, prefix='.tmp-')
+        try:
+            with os.fdopen(fd, 'wb') as f:
+                with zipfile.ZipFile(f, 'w') as zf:
+                    for key, path in objects:
+                        compression = zipfile.ZIP_STORED if key.lower().endswith(PRECOMPRESSED) else zipfile.ZIP_DEFLATED
+                        zf.write(path, key, compress_type=compression, compresslevel=9 if compression == zipfile.ZIP_DEFLATED else None)
+                f.flush()
+                os.fsync(f.fileno())
+            os.replace(tmp_path, os.path.join(self.archive_dir, name))
+        except Exception:
+            if os.path.exists(tmp_path):
+                os.remove(tmp_path)
+            raise
+        return name, os.path.getsize(os.path.join(self.archive_dir, name))
+
+class MaintenanceRunner:
+    #retention and compaction for the upload store and the database:
+    #  - deletes orphaned upload files / thumbnails and rows whose parent is gone
+    #  - removes empty, never-validated text uploads and superseded unvalidated analyses
+    #  - moves files of old validated uploads into compressed packs
+    #  - incremental VACUUM + ANALYZE
+    #every step reports what it removed and how many bytes that freed
+    def __init__(self, db_manager, storage, thumbnails, archive,
+                 archive_after_days=90, orphan_grace_seconds=24 * 60 * 60, pack_size=500, vacuum_pages=None):
+        self.db = db_manager
+        self.storage = storage
+        self.thumbnails = thumbnails
+        self.archive = archive
+        #uploads validated and older than this are archived, None turns archiving off
+        self.archive_after_days = archive_after_days
+        #files newer than this are never treated as orphans, their database row may not be written yet
+        self.orphan_grace_seconds = orphan_grace_seconds
+        self.pack_size = pack_size
+        self.vacuum_pages = vacuum_pages
+
+        self.lock = threading.Lock()
+        self.last_report = None
+
+    def _referenced_keys(self):
+        return {self.storage.key_from_path(media['path']) for media in self.db.get_stored_media()}
+
+    def _delete_file(self, path):
+        try:
+            size = os.path.getsize(path)
+            os.remove(path)
+            return size
+        except FileNotFoundError:
+            return 0
+
+    def collect_orphan_files(self, dry_run=False):
+        #upload objects no media row points at, and thumbnails of uploads that are gone
+        referenced = self._referenced_keys()
+        cutoff = time.time() - self.orphan_grace_seconds
+        files = 0
+        freed = 0
+
+        listing = self.storage.store.list_objects_v2(Bucket=self.storage.bucket)
+        for obj in listing.get('Contents', []):
+            if obj['Key'] in referenced:
+                continue
+            path = self.storage.local_path(obj['Key'])
+            try:
+                if os.path.getmtime(path) > cutoff:
+                    continue
+            except FileNotFoundError:
+                continue
+            files += 1
+            freed += obj['Size'] if dry_run else self._delete_file(path)
+
+        thumbnail_files = 0
+        if self.thumbnails is not None and os.path.isdir(self.thumbnails.cache_dir):
+            #thumbnails are <upload key without extension>.<thumbnail format>
+            referenced_stems = {key.rsplit('.', 1)[0] for key in referenced}
+            for dirpath, _, filenames in os.walk(self.thumbnails.cache_dir):
+                for filename in filenames:
+                    path = os.path.join(dirpath, filename)
+                    stem = os.path.relpath(path, self.thumbnails.cache_dir).replace(os.sep, '/').rsplit('.', 1)[0]
+                    if stem in referenced_stems or os.path.getmtime(path) > cutoff:
+                        continue
+                    thumbnail_files += 1
+                    freed += os.path.getsize(path) if dry_run else self._delete_file(path)
+
+        return {'files': files, 'thumbnails': thumbnail_files, 'freed_bytes': freed}
+
+    def _is_empty_text(self, media):
+        if media['content'] is not None:
+            return not media['content'].strip()
+        try:
+            #goes through the archive too, a moved file is not an empty one
+            return not self.storage.read_text(media).strip()
+        except (OSError, ValueError, UnicodeDecodeError):
+            #unreadable is not the same as empty, leave it alone
+            return False
+
+    def collect_empty_uploads(self, dry_run=False):
+        #text uploads with no content that nobody validated, rows and files
+        empty = [media for media in self.db.get_unvalidated_text_media() if self._is_empty_text(media)]
+        freed = 0
+        if not dry_run:
+            self.db.delete_media([media['id'] for media in empty])
+            referenced = self._referenced_keys()
+            for media in empty:
+                if media['content'] is None and self.storage.key_from_path(media['path']) not in referenced:
+                    freed += self._delete_file(media['path'])
+        return {'media': len(empty), 'freed_bytes': freed}
+
+    def collect_rows(self, dry_run=False):
+        #superseded analyses, orphaned rows and expired leases
+        if dry_run:
+            return {}
+        deleted = {'analysis (superseded)': self.db.delete_superseded_analyses()}
+        deleted.update(self.db.delete_orphan_rows(time.time()))
+        return {table: count for table, count in deleted.items() if count}
+
+    def archive_validated(self, dry_run=False):
+        #move files of old, validated uploads into packs; reads fall back to the pack via UploadStorage.archive
+        if self.archive_after_days is None or self.archive is None:
+            return {'media': 0, 'packs': 0, 'freed_bytes': 0}
+
+        before = datetime.now() - timedelta(days=self.archive_after_days)
+        archived = 0
+        packs = 0
+        freed = 0
+        while True:
+            batch = self.db.get_archivable_media(before, limit=self.pack_size)
+            if not batch:
+                break
+            #key -> (file size, media ids), the same content uploaded twice goes in once
+            objects = {}
+            already = []
+            for media in batch:
+                key = self.storage.key_from_path(media['path'])
+                if key in objects:
+                    objects[key][1].append(media['id'])
+                    continue
+                pack = self.db.get_archive_pack(key)
+                if pack is not None:
+                    already.append((pack, media['id'], key))
+                    continue
+                try:
+                    objects[key] = (os.path.getsize(self.storage.local_path(key)), [media['id']])
+                except (OSError, ValueError) as e:
+                    print(f"Skipping archive of media {media['id']}: {e}")
+            handled = len(already) + sum(len(media_ids) for _, media_ids in objects.values())
+            if dry_run:
+                archived += handled
+                freed += sum(size for size, _ in objects.values())
+                break
+
+            for pack, media_id, key in already:
+                self.db.add_archived_objects(pack, [(media_id, key, None)])
+                #content uploaded again after it was archived: the pack already holds it, drop the fresh copy
+                freed += self._delete_file(self.storage.local_path(key))
+            if objects:
+                pack, pack_size = self.archive.write_pack([(key, self.storage.local_path(key)) for key in objects])
+                self.db.add_archived_objects(pack, [(media_id, key, size)
+                                                    for key, (size, media_ids) in objects.items() for media_id in media_ids])
+                #the pack and its rows are durable before any original goes away
+                originals = sum(self._delete_file(self.storage.local_path(key)) for key in objects)
+                packs += 1
+                freed += originals - pack_size
+            archived += handled
+            if handled < len(batch) or len(batch) < self.pack_size:
+                #unreadable uploads stay unarchived, stop instead of fetching them again
+                break
+
+        return {'media': archived, 'packs': packs, 'freed_bytes': max(0, freed)}
+
+    def run(self, dry_run=False):
+        #one full maintenance pass, returns the report (also kept as last_report)
+        if not self.lock.acquire(blocking=False):
+            return self.last_report
+        try:
+            started = time.perf_counter()
+            report = {
+                'started_at': datetime.now().isoformat(timespec='seconds'),
+                'dry_run': dry_run,
+                'orphan_files': self.collect_orphan_files(dry_run),
+                'empty_uploads': self.collect_empty_uploads(dry_run),
+                'rows_deleted': self.collect_rows(dry_run),
+                'archived': self.archive_validated(dry_run)
+            }
+            report['database'] = None if dry_run else self.db.compact(self.vacuum_pages)
+            report['freed_bytes'] = (report['orphan_files']['freed_bytes'] + report['empty_uploads']['freed_bytes']
+                                     + report['archived']['freed_bytes']
+                                     + (report['database']['freed_bytes'] if report['database'] else 0))
+            report['seconds'] = round(time.perf_counter() - started, 2)
+            self.last_report = report
+            return report
+        finally:
+            self.lock.release()
+
+    def start(self, interval_seconds):
+        #run every interval_seconds on a daemon thread
+        def loop():
+            while True:
+                time.sleep(interval_seconds)
+                try:
+                    report = self.run()
+                    print(f"Maintenance freed {report['freed_bytes']} bytes in {report['seconds']}s")
+                except Exception as e:
+                    print(f"Error during maintenance: {e}")
+
+        thread = threading.Thread(target=loop, name='maintenance', daemon=True)
+        thread.start()
+        return thread
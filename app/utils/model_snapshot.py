@@ -0,0 +1,65 @@
+import threading
+from collections import namedtuple
+
+#everything a request needs from a model's correction state, as one immutable value
+#the learning engine swaps in a new snapshot with a single reference assignment; a request reads
+#model.snapshot once and uses only that, so the layer that scored it and the version recorded next to
+#the results always belong together, and the read path never takes a lock
+ModelSnapshot = namedtuple('ModelSnapshot', ['version', 'emotions', 'correction_layer', 'candidate_layer', 'candidate_version'])
+
+class SnapshotModel:
+    #shared version / correction layer / shadow candidate handling of the text and image models
+    def __init__(self, version, emotions):
+        self.snapshot = ModelSnapshot(version, tuple(emotions), None, None, None)
+        #writers only: two swaps at once must not drop one of the changes
+        self._swap_lock = threading.Lock()
+
+    #current values, each a separate read: code that uses more than one of them should read self.snapshot once instead
+
+    @property
+    def version(self):
+        return self.snapshot.version
+
+    @property
+    def emotions(self):
+        return list(self.snapshot.emotions)
+
+    @property
+    def correction_layer(self):
+        return self.snapshot.correction_layer
+
+    @property
+    def candidate_layer(self):
+        return self.snapshot.candidate_layer
+
+    @property
+    def candidate_version(self):
+        return self.snapshot.candidate_version
+
+    def _swap(self, **changes):
+        with self._swap_lock:
+            self.snapshot = self.snapshot._replace(**changes)
+
+    def set_live(self, correction_layer, version):
+        #new live layer and its version in one swap
+        self._swap(correction_layer=correction_layer, version=version)
+
+    def set_correction_layer(self, correction_layer):
+        self._swap(correction_layer=correction_layer)
+
+    def update_version(self, new_version):
+        self._swap(version=new_version)
+
+    def set_candidate(self, correction_layer, version):
+        #score traffic with a candidate layer in shadow, results are stored but not shown
+        self._swap(candidate_layer=correction_layer, candidate_version=version)
+
+    def clear_candidate(self):
+        self._swap(candidate_layer=None, candidate_version=None)
+
+    def promote_candidate(self):
+        #make the shadow candidate the live correction layer
+        with self._swap_lock:
+            current = self.snapshot
+            self.snapshot = current._replace(version=current.candidate_version, correction_layer=current.candidate_layer,
+                                             candidate_layer=None, candidate_version=None)
@@ -0,0 +1,39 @@
+from utils.json_utils import json_serialize
+from utils.validation_queue import top_margin
+
+def rescore_images(db, image_model, correction_layer=None, version=None, batch_size=5000):
+    #re-score every stored image with a correction layer using only the cached raw face vectors
+    #no image decode, face detection or CNN inference, just one matrix op per batch
+    #[inputs] db (DBManager), image_model (ImageEmotionModel), correction_layer (defaults to the model's),
+    #         version (defaults to the model's), batch_size (media items per batch)
+    #[outputs] number of media items re-scored
+    version = version or image_model.version
+    total = 0
+    after_media_id = 0
+
+    while True:
+        rows, raw = db.get_face_vectors(after_media_id=after_media_id, limit=batch_size)
+        if not rows:
+            break
+
+        #every face of every media item in the batch corrected in one call
+        corrected = image_model.correct_vectors(raw, correction_layer)
+
+        #group faces back into DeepFace-style result lists per media item
+        results = {}
+        for row, scores in zip(rows, corrected.tolist()):
+            face = {'emotion': dict(zip(image_model.emotions, scores))}
+            if row['region'] is not None:
+                face['region'] = row['region']
+            results.setdefault(row['media_id'], []).append(face)
+
+        db.add_analyses([
+            (media_id, version, json_serialize(faces), top_margin(faces))
+            for media_id, faces in results.items()
+        ])
+
+        total += len(results)
+        after_media_id = rows[-1]['media_id']
+        print(f"Rescored {total} images so far")
+
+    return total
@@ -0,0 +1,50 @@
+import re
+
+#sentence end: . ! ? or … (possibly repeated, possibly followed by closing quotes/brackets) then whitespace
+SENTENCE_END = re.compile(r'[.!?…]+[\"\'”’)\]]*(?=\s|$)')
+
+#DistilBERT sees at most 512 tokens, very long "sentences" (no punctuation) are cut into pieces of about this size
+MAX_SENTENCE_CHARS = 1000
+
+def split_sentences(text, max_chars=MAX_SENTENCE_CHARS):
+    #[outputs] list of (start, end, sentence) with character offsets into text, empty pieces dropped
+    spans = []
+    start = 0
+    for match in SENTENCE_END.finditer(text):
+        spans.extend(_trimmed(text, start, match.end(), max_chars))
+        start = match.end()
+    spans.extend(_trimmed(text, start, len(text), max_chars))
+    return spans
+
+def _trimmed(text, start, end, max_chars):
+    #strip whitespace around a piece, keeping offsets right, and split overlong pieces on whitespace
+    while start < end and text[start].isspace():
+        start += 1
+    while end > start and text[end - 1].isspace():
+        end -= 1
+    if start >= end:
+        return []
+
+    pieces = []
+    while end - start > max_chars:
+        cut = text.rfind(' ', start, start + max_chars)
+        if cut <= start:
+            cut = start + max_chars
+        pieces.append((start, cut, text[start:cut]))
+        start = cut
+        while start < end and text[start].isspace():
+            start += 1
+    pieces.append((start, end, text[start:end]))
+    return pieces
+
+def fts_query(keywords):
+    #user keywords -> FTS5 MATCH expression, every word quoted (so operators/punctuation can't break the query)
+    #and all words required; a trailing * on a word keeps prefix search
+    #words without letters or digits are dropped, the tokenizer would make empty phrases of them
+    terms = []
+    for word in keywords.split():
+        prefix = word.endswith('*')
+        word = word.rstrip('*').replace('"', '""')
+        if re.search(r'\w', word):
+            terms.append(f'"{word}"' + ('*' if prefix else ''))
+    return ' '.join(terms)
@@ -0,0 +1,16 @@
+import numpy as np
+
+def predict_layers(layers, features):
+    #run several correction layers over the same feature matrix
+    #linear layers (LinearRegression/Ridge) are fused into one matmul, anything else falls back to predict()
+    #[outputs] list of (n_samples, n_emotions) predictions, one per layer
+    if all(hasattr(layer, 'coef_') and np.ndim(layer.coef_) == 2 for layer in layers):
+        weights = np.vstack([layer.coef_ for layer in layers])
+        intercepts = np.concatenate([
+            np.broadcast_to(np.asarray(layer.intercept_, dtype=np.float64), (layer.coef_.shape[0],))
+            for layer in layers
+        ])
+        fused = features @ weights.T + intercepts
+        splits = np.cumsum([layer.coef_.shape[0] for layer in layers])[:-1]
+        return np.split(fused, splits, axis=1)
+    return [layer.predict(features) for layer in layers]
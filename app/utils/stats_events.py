@@ -0,0 +1,146 @@
+import time
+import asyncio
+import threading
+
+from utils.json_utils import json_serialize
+
+class StatsEventBus:
+    #keeps dashboard stats up to date from DBManager write events and streams them as Server-Sent Events
+    #the full stats are loaded from the database once, after that every write just adjusts counters,
+    #so an open dashboard costs a sleeping thread instead of a get_statistics call per poll
+    def __init__(self, load_snapshot, coalesce_seconds=1.0, keepalive_seconds=15, resync_seconds=600, recent_versions=20):
+        self._load_snapshot = load_snapshot
+        #how many recent model versions the snapshot carries, like get_statistics
+        self.recent_versions = recent_versions
+        self.coalesce_seconds = coalesce_seconds
+        self.keepalive_seconds = keepalive_seconds
+        #reload from the database now and then so counters can't drift forever
+        self.resync_seconds = resync_seconds
+
+        self._state = None
+        self._loaded_at = 0
+        self._seq = 0
+        self._cond = threading.Condition()
+        #(event loop, asyncio.Event) of every open astream(), woken from whichever thread publishes
+        self._async_waiters = set()
+
+    def publish(self, event, data):
+        #DBManager listener, called after a write has committed
+        with self._cond:
+            if self._state is not None:
+                self._apply(event, data)
+            self._seq += 1
+            self._cond.notify_all()
+            waiters = list(self._async_waiters)
+        for loop, changed in waiters:
+            try:
+                loop.call_soon_threadsafe(changed.set)
+            except RuntimeError:
+                #loop already closed, its stream is gone
+                pass
+
+    def _apply(self, event, data):
+        state = self._state
+        if event == 'media':
+            state['total_media'] += 1
+            if data.get('type') == 'text':
+                state['total_text'] += 1
+            elif data.get('type') == 'image':
+                state['total_image'] += 1
+        elif event == 'media_deleted':
+            state['total_media'] -= len(data['media_ids'])
+            state['total_text'] -= data['text']
+            state['total_image'] -= data['image']
+        elif event == 'validation':
+            state['total_validations'] += data['count']
+            state['agreement_hits'] += data['agreement_hits']
+            state['agreement_samples'] += data['agreement_samples']
+            samples = state['agreement_samples']
+            state['avg_accuracy'] = state['agreement_hits'] / samples if samples else 0
+        elif event == 'model_version':
+            state['total_model_versions'] += 1
+            state['model_versions'] = ([data] + state['model_versions'])[:self.recent_versions]
+
+    def snapshot(self):
+        #current stats, loading them only if nothing is cached or the cache is stale
+        with self._cond:
+            if self._state is None or time.time() - self._loaded_at > self.resync_seconds:
+                self._state = self._load_snapshot()
+                self._loaded_at = time.time()
+            return self._copy_state(), self._seq
+
+    def _copy_state(self):
+        state = dict(self._state)
+        state['model_versions'] = list(self._state['model_versions'])
+        return state
+
+    @staticmethod
+    def diff(previous, current):
+        #only what changed: scalar values that differ plus model versions added since previous
+        delta = {}
+        for key, value in current.items():
+            if key != 'model_versions' and previous.get(key) != value:
+                delta[key] = value
+        added = min(current['total_model_versions'] - previous['total_model_versions'], len(current['model_versions']))
+        if added > 0:
+            delta['new_model_versions'] = current['model_versions'][:added]
+        return delta
+
+    @staticmethod
+    def format_event(event, data):
+        return f"event: {event}\ndata: {json_serialize(data)}\n\n"
+
+    def stream(self):
+        #generator for one SSE client: a snapshot, then coalesced deltas
+        last, seq = self.snapshot()
+        yield self.format_event('snapshot', last)
+
+        while True:
+            with self._cond:
+                changed = self._cond.wait_for(lambda: self._seq != seq, timeout=self.keepalive_seconds)
+            if not changed:
+                #comment line keeps proxies from closing an idle connection
+                yield ": keepalive\n\n"
+                continue
+
+            current, seq = self.snapshot()
+            delta = self.diff(last, current)
+            if delta:
+                yield self.format_event('delta', delta)
+            last = current
+
+            #writes that land while we sleep are merged into the next delta
+            time.sleep(self.coalesce_seconds)
+
+    async def astream(self):
+        #stream() for an asyncio server: an open dashboard waits as a coroutine instead of holding a thread
+        loop = asyncio.get_running_loop()
+        changed = asyncio.Event()
+        waiter = (loop, changed)
+        with self._cond:
+            self._async_waiters.add(waiter)
+        try:
+            #snapshot() can reload from the database, keep that off the event loop
+            last, seq = await loop.run_in_executor(None, self.snapshot)
+            yield self.format_event('snapshot', last)
+
+            while True:
+                changed.clear()
+                #checked after clear(), a publish in between has already set the event again
+                if self._seq == seq:
+                    try:
+                        await asyncio.wait_for(changed.wait(), self.keepalive_seconds)
+                    except asyncio.TimeoutError:
+                        yield ": keepalive\n\n"
+                        continue
+
+                current, seq = await loop.run_in_executor(None, self.snapshot)
+                delta = self.diff(last, current)
+                if delta:
+                    yield self.format_event('delta', delta)
+                last = current
+
+                await asyncio.sleep(self.coalesce_seconds)
+        finally:
+            with self._cond:
+                self._async_waiters.discard(waiter)
@@ -0,0 +1,190 @@
+import os
+import io
+import hashlib
+import tempfile
+import threading
+from concurrent.futures import ThreadPoolExecutor
+
+class LocalObjectStore:
+    #filesystem stand-in for an S3 client (same call shapes as boto3's put/get/head/delete/list)
+    #each bucket is a directory under root, keys are relative paths inside it
+    def __init__(self, root):
+        self.root = root
+        os.makedirs(root, exist_ok=True)
+
+    def _path(self, bucket, key):
+        path = os.path.normpath(os.path.join(self.root, bucket, key))
+        if not path.startswith(os.path.normpath(os.path.join(self.root, bucket)) + os.sep):
+            raise ValueError(f"Invalid object key: {key}")
+        return path
+
+    def local_path(self, bucket, key):
+        #where the object lives on disk (only the local stand-in can answer this)
+        return self._path(bucket, key)
+
+    def put_object(self, Bucket, Key, Body):
+        path = self._path(Bucket, Key)
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        data = Body.read() if hasattr(Body, 'read') else Body
+
+        #write to a temp file then rename so readers never see partial objects
+        fd, tmp_path = tempfile.mkstemp(dir=os.path.dirname(path), prefix='.tmp-')
+        try:
+            with os.fdopen(fd, 'wb') as f:
+                f.write(data)
+            os.replace(tmp_path, path)
+        except Exception:
+            if os.path.exists(tmp_path):
+                os.remove(tmp_path)
+            raise
+
+        return {'ETag': '"' + hashlib.md5(data).hexdigest() + '"'}
+
+    def get_object(self, Bucket, Key):
+        path = self._path(Bucket, Key)
+        with open(path, 'rb') as f:
+            data = f.read()
+        return {'Body': io.BytesIO(data), 'ContentLength': len(data)}
+
+    def head_object(self, Bucket, Key):
+        #raises FileNotFoundError for missing keys (boto3 raises ClientError 404)
+        st = os.stat(self._path(Bucket, Key))
+        return {'ContentLength': st.st_size, 'LastModified': st.st_mtime}
+
+    def delete_object(self, Bucket, Key):
+        path = self._path(Bucket, Key)
+        if os.path.exists(path):
+            os.remove(path)
+        return {}
+
+    def list_objects_v2(self, Bucket, Prefix=''):
+        base = os.path.join(self.root, Bucket)
+        contents = []
+        for dirpath, _, filenames in os.walk(base):
+            for filename in filenames:
+                if filename.startswith('.tmp-'):
+                    continue
+                path = os.path.join(dirpath, filename)
+                key = os.path.relpath(path, base).replace(os.sep, '/')
+                if key.startswith(Prefix):
+                    contents.append({'Key': key, 'Size': os.path.getsize(path)})
+        return {'Contents': contents, 'KeyCount': len(contents)}
+
+class UploadStorage:
+    #content-addressed upload storage on top of an S3-style object store
+    #layout: <bucket>/ab/cd/<sha256>.<ext>, identical content is only written once
+    #writes run on a background thread pool; small texts can live inline in SQLite instead
+    def __init__(self, object_store, bucket='uploads', inline_text_limit=64 * 1024, max_workers=4, archive=None):
+        self.store = object_store
+        self.bucket = bucket
+        self.inline_text_limit = inline_text_limit
+        #cold storage for old uploads moved out of the bucket (utils.maintenance.PackArchive), read on a miss
+        self.archive = archive
+        self.executor = ThreadPoolExecutor(max_workers=max_workers, thread_name_prefix='upload-writer')
+
+        #key -> (future, data) for writes still in flight, so reads never miss them
+        self._pending = {}
+        self._lock = threading.Lock()
+
+    @staticmethod
+    def hash_bytes(data):
+        return hashlib.sha256(data).hexdigest()
+
+    @staticmethod
+    def key_for(content_hash, extension):
+        return f"{content_hash[:2]}/{content_hash[2:4]}/{content_hash}.{extension}"
+
+    def local_path(self, key):
+        return self.store.local_path(self.bucket, key)
+
+    def exists(self, key):
+        with self._lock:
+            if key in self._pending:
+                return True
+        try:
+            self.store.head_object(Bucket=self.bucket, Key=key)
+            return True
+        except Exception:
+            return False
+
+    def save(self, data, extension, allow_inline=False):
+        #store bytes and return {'key', 'path', 'hash', 'inline', 'content'}
+        #inline results are not written anywhere, the caller keeps 'content' in the database
+        content_hash = self.hash_bytes(data)
+        key = self.key_for(content_hash, extension)
+        result = {
+            'key': key,
+            'path': self.local_path(key),
+            'hash': content_hash,
+            'inline': False,
+            'content': None
+        }
+
+        if allow_inline and len(data) <= self.inline_text_limit:
+            result['inline'] = True
+            result['content'] = data.decode('utf-8')
+            return result
+
+        #dedup: same content hash means same object, skip the write
+        if self.exists(key):
+            return result
+
+        with self._lock:
+            if key not in self._pending:
+                future = self.executor.submit(self._write, key, data)
+                self._pending[key] = (future, data)
+        return result
+
+    def _write(self, key, data):
+        try:
+            self.store.put_object(Bucket=self.bucket, Key=key, Body=data)
+        except Exception as e:
+            print(f"Error writing upload {key}: {e}")
+            raise
+        finally:
+            with self._lock:
+                self._pending.pop(key, None)
+
+    def wait(self, key):
+        #block until a background write for key is on disk (no-op if already written)
+        with self._lock:
+            pending = self._pending.get(key)
+        if pending is not None:
+            pending[0].result()
+
+    def read(self, key):
+        with self._lock:
+            pending = self._pending.get(key)
+        if pending is not None:
+            return pending[1]
+        try:
+            return self.store.get_object(Bucket=self.bucket, Key=key)['Body'].read()
+        except FileNotFoundError:
+            if self.archive is not None:
+                data = self.archive.read(key)
+                if data is not None:
+                    return data
+            raise
+
+    def key_from_path(self, path):
+        #storage key for a media path recorded in the database
+        base = os.path.dirname(self.local_path('x'))
+        return os.path.relpath(path, base).replace(os.sep, '/')
+
+    def read_text(self, media):
+        #text for a media row, inline content first, then the stored object
+        if media.get('content') is not None:
+            return media['content']
+        try:
+            return self.read(self.key_from_path(media['path'])).decode('utf-8')
+        except (ValueError, FileNotFoundError):
+            #legacy rows point at files outside the sharded layout
+            with open(media['path'], 'r', encoding='utf-8') as f:
+                return f.read()
+
+    def flush(self):
+        #wait for every in-flight write
+        with self._lock:
+            futures = [future for future, _ in self._pending.values()]
+        for future in futures:
+            future.result()
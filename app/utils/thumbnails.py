@@ -0,0 +1,68 @@
+import os
+import io
+import tempfile
+from PIL import Image, ImageOps, features
+
+class ThumbnailCache:
+    #size-bounded previews of uploaded images, cached on disk and keyed by upload storage key
+    #uploads are content-addressed, so a thumbnail never changes once written
+    def __init__(self, cache_dir, max_size=640, quality=80):
+        self.cache_dir = os.path.abspath(cache_dir)
+        self.max_size = max_size
+        self.quality = quality
+        os.makedirs(self.cache_dir, exist_ok=True)
+
+        #WebP when Pillow was built with it, JPEG otherwise
+        if features.check('webp'):
+            self.format, self.extension, self.mimetype = 'WEBP', 'webp', 'image/webp'
+        else:
+            self.format, self.extension, self.mimetype = 'JPEG', 'jpg', 'image/jpeg'
+
+    def relative_path(self, upload_key):
+        #path of the thumbnail inside cache_dir
+        stem = upload_key.rsplit('.', 1)[0]
+        relative = os.path.normpath(f"{stem}.{self.extension}")
+        if relative.startswith('..') or os.path.isabs(relative):
+            raise ValueError(f"Invalid upload key: {upload_key}")
+        return relative
+
+    def path_for(self, upload_key):
+        return os.path.join(self.cache_dir, self.relative_path(upload_key))
+
+    def create(self, upload_key, image):
+        #write the thumbnail for upload_key if it isn't cached yet
+        #image can be a PIL image, a BGR numpy array from cv2 or the raw upload bytes
+        path = self.path_for(upload_key)
+        if os.path.exists(path):
+            return path
+
+        img = self._to_pil(image)
+        img.thumbnail((self.max_size, self.max_size))
+        if img.mode not in ('RGB', 'L'):
+            img = img.convert('RGB')
+
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        fd, tmp_path = tempfile.mkstemp(dir=os.path.dirname(path), prefix='.tmp-')
+        try:
+            with os.fdopen(fd, 'wb') as f:
+                img.save(f, self.format, quality=self.quality)
+            os.replace(tmp_path, path)
+        except Exception:
+            if os.path.exists(tmp_path):
+                os.remove(tmp_path)
+            raise
+
+        return path
+
+    def _to_pil(self, image):
+        if isinstance(image, Image.Image):
+            return image
+        if isinstance(image, (bytes, bytearray)):
+            img = Image.open(io.BytesIO(image))
+            #JPEG can decode straight at a reduced scale, much cheaper than a full decode
+            img.draft('RGB', (self.max_size, self.max_size))
+            return ImageOps.exif_transpose(img)
+        #numpy array from cv2 is BGR (or single channel)
+        if image.ndim == 2:
+            return Image.fromarray(image)
+        return Image.fromarray(image[:, :, 2::-1])
@@ -0,0 +1,82 @@
+import io
+import os
+import json
+import time
+import threading
+import contextlib
+
+class TraceRecorder:
+    #appends one JSON line per /upload or /submit_validation request so slow traffic can be replayed offline
+    #sanitized: content hashes, sizes, image dimensions and per-stage timings, never the text or image itself
+    #disabled (every call a no-op) unless a trace path is given
+    def __init__(self, path=None):
+        self.path = path
+        self.enabled = bool(path)
+        self.started_at = time.time()
+        self.lock = threading.Lock()
+        self.local = threading.local()
+        if self.enabled:
+            os.makedirs(os.path.dirname(os.path.abspath(path)), exist_ok=True)
+
+    @contextlib.contextmanager
+    def request(self, kind, **fields):
+        #yields the event dict, callers add fields (hash, size, analysis_id...) as they learn them
+        event = {'kind': kind, 't': round(time.time() - self.started_at, 6), **fields}
+        if not self.enabled:
+            yield event
+            return
+
+        event['stages'] = {}
+        self.local.event = event
+        started = time.perf_counter()
+        try:
+            yield event
+            event['status'] = 'ok'
+        except Exception as e:
+            event['status'] = type(e).__name__
+            raise
+        finally:
+            self.local.event = None
+            event['duration'] = round(time.perf_counter() - started, 6)
+            line = json.dumps(event, separators=(',', ':'))
+            with self.lock:
+                with open(self.path, 'a', encoding='utf-8') as f:
+                    f.write(line + '\n')
+
+    @contextlib.contextmanager
+    def stage(self, name):
+        #time one stage (store/analyze/record/validate/learn) of the current request
+        event = getattr(self.local, 'event', None) if self.enabled else None
+        if event is None:
+            yield
+            return
+
+        started = time.perf_counter()
+        try:
+            yield
+        finally:
+            event['stages'][name] = round(event['stages'].get(name, 0.0) + time.perf_counter() - started, 6)
+
+def image_dimensions(image_bytes):
+    #width, height from the image header only, so replays can synthesize a same-sized image
+    try:
+        from PIL import Image
+        with Image.open(io.BytesIO(image_bytes)) as image:
+            return image.size
+    except Exception:
+        return None, None
+
+def read_trace(path):
+    #events in recorded order, malformed lines (e.g. a write cut off by a crash) are skipped
+    events = []
+    with open(path, 'r', encoding='utf-8') as f:
+        for line in f:
+            line = line.strip()
+            if not line:
+                continue
+            try:
+                events.append(json.loads(line))
+            except ValueError:
+                continue
+    events.sort(key=lambda event: event.get('t', 0))
+    return events
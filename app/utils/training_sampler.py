@@ -0,0 +1,55 @@
+import numpy as np
+
+#bounded, label-balanced training sample for the correction layers
+#one reservoir per emotion, a row goes to the reservoir of its validated top emotion; each reservoir is
+#a uniform sample (Algorithm R) of every row seen for that emotion, so rare emotions keep all their rows
+#while the common ones are capped at capacity. memory and fit time depend on capacity, not on the
+#number of validations
+#capping alone only bounds the sample, the balance comes from the row weights sample() returns: every
+#emotion that has rows carries the same total weight in the fit, however few rows it has
+
+class StratifiedReservoir:
+    def __init__(self, emotions, capacity=500, seed=0):
+        self.emotions = list(emotions)
+        self.capacity = capacity
+        strata = len(self.emotions)
+        self.X = np.zeros((strata, capacity, strata), dtype=np.float32)
+        self.y = np.zeros((strata, capacity, strata), dtype=np.float32)
+        #rows held / rows ever offered, per emotion
+        self.sizes = np.zeros(strata, dtype=np.int64)
+        self.seen = np.zeros(strata, dtype=np.int64)
+        self.rng = np.random.default_rng(seed)
+
+        #validations already folded in (keyset position in the validation table) and how many arrived since the last fit
+        self.last_validation_id = 0
+        self.pending = 0
+
+    def add(self, x_vec, y_vec):
+        stratum = int(np.argmax(y_vec))
+        self.seen[stratum] += 1
+        if self.sizes[stratum] < self.capacity:
+            slot = self.sizes[stratum]
+            self.sizes[stratum] += 1
+        else:
+            #keep the new row with probability capacity / seen, in place of a random one
+            slot = int(self.rng.integers(0, self.seen[stratum]))
+            if slot >= self.capacity:
+                return
+        self.X[stratum, slot] = x_vec
+        self.y[stratum, slot] = y_vec
+
+    def sample(self):
+        #(X, y, weights) of every row currently held, grouped by emotion
+        #a row's weight is inversely proportional to the size of its emotion's reservoir, scaled to a mean of 1
+        X = np.concatenate([self.X[s, :size] for s, size in enumerate(self.sizes)])
+        y = np.concatenate([self.y[s, :size] for s, size in enumerate(self.sizes)])
+        held = np.count_nonzero(self.sizes)
+        weights = np.concatenate([np.full(size, len(self) / (held * size)) for size in self.sizes if size] + [np.zeros(0)])
+        return X.astype(np.float64), y.astype(np.float64), weights
+
+    def __len__(self):
+        return int(self.sizes.sum())
+
+    def stats(self):
+        return {emotion: {'seen': int(self.seen[s]), 'kept': int(self.sizes[s])}
+                for s, emotion in enumerate(self.emotions)}
@@ -0,0 +1,105 @@
+import json
+import time
+import uuid
+import numbers
+
+from utils.face_utils import extract_faces, build_face_payloads
+from utils.json_utils import json_serialize
+from utils.db_manager import LeaseError
+
+def top_margin(emotion_data):
+    #gap between the strongest and second strongest emotion, scores normalized to sum to 1
+    #for images the smallest margin over all faces counts (one uncertain face makes the item uncertain)
+    faces = [emotion_data] if isinstance(emotion_data, dict) else extract_faces(emotion_data)
+    margins = []
+    for face in faces:
+        scores = sorted((float(v) for v in face.values() if isinstance(v, numbers.Real)), reverse=True)
+        total = sum(scores)
+        if not scores or total <= 0:
+            continue
+        second = scores[1] if len(scores) > 1 else 0.0
+        margins.append((scores[0] - second) / total)
+    return min(margins) if margins else None
+
+def _check_scores(scores, where):
+    if not isinstance(scores, dict) or not scores:
+        raise ValueError(f"{where}: expected a non-empty object of emotion scores")
+    for emotion, score in scores.items():
+        #NaN fails the range check too
+        if isinstance(score, bool) or not isinstance(score, numbers.Real) or not 0 <= score <= 1:
+            raise ValueError(f"{where}: score for '{emotion}' must be a number between 0 and 1")
+
+def check_validated_emotions(media_type, emotions, analysis_id):
+    #validated emotions have to fit the media type before they are stored (and later trained on)
+    #text: one {emotion: score} dict, image: a list with one such dict per face, scores in [0,1]
+    where = f"analysis {analysis_id}"
+    if media_type == 'text':
+        _check_scores(emotions, where)
+    elif media_type == 'image':
+        if not isinstance(emotions, list) or not emotions:
+            raise ValueError(f"{where}: expected a list of per-face emotion scores")
+        for index, face in enumerate(emotions):
+            _check_scores(face, f"{where}, face {index}")
+    else:
+        raise ValueError(f"{where}: unknown media type {media_type}")
+
+class ValidationQueue:
+    #hands out unvalidated analyses to annotators in batches, most uncertain first
+    #every claimed item is leased for lease_seconds so concurrent annotators don't get the same work
+    def __init__(self, db_manager, storage, lease_seconds=300, max_batch_size=50):
+        self.db = db_manager
+        self.storage = storage
+        self.lease_seconds = lease_seconds
+        self.max_batch_size = max_batch_size
+
+    def next_batch(self, batch_size=10, annotator=None):
+        #claim a batch, returns (lease_token, items)
+        batch_size = max(1, min(int(batch_size), self.max_batch_size))
+        lease_token = uuid.uuid4().hex
+        rows = self.db.claim_validation_batch(lease_token, annotator, batch_size, self.lease_seconds, time.time())
+        return lease_token, [self._build_item(row) for row in rows]
+
+    def _build_item(self, row):
+        emotions = json.loads(row['emotion_data'])
+        item = {
+            'analysis_id': row['analysis_id'],
+            'media_type': row['type'],
+            'model_version': row['model_version'],
+            'top_margin': row['top_margin'],
+            'lease_expires_at': row['lease_expires_at'],
+            'media_key': self.storage.key_from_path(row['path']),
+            'emotions': emotions
+        }
+
+        if row['type'] == 'text':
+            try:
+                item['text_content'] = self.storage.read_text(row)
+            except Exception as e:
+                print(f"Error reading text for analysis {row['analysis_id']}: {e}")
+                item['text_content'] = None
+        else:
+            item['faces'] = build_face_payloads(emotions)
+
+        return item
+
+    def submit(self, validations, annotator, now=None):
+        #write many validations in one transaction
+        #validations: list of {'analysis_id': int, 'emotions': dict (text) or list of per-face dicts (image)}
+        #raises ValueError for unknown analyses or emotions that don't fit the media type,
+        #LeaseError unless annotator holds an unexpired lease on every analysis (nothing is written then)
+        validations = [(int(validation['analysis_id']), validation['emotions']) for validation in validations]
+        if not validations:
+            return 0
+        
+        types = self.db.get_analysis_types({analysis_id for analysis_id, _ in validations})
+        rows = []
+        for analysis_id, emotions in validations:
+            if analysis_id not in types:
+                raise ValueError(f"Unknown analysis {analysis_id}")
+            check_validated_emotions(types[analysis_id], emotions, analysis_id)
+            rows.append((analysis_id, json_serialize(emotions)))
+        
+        return self.db.add_validations(rows, annotator, time.time() if now is None else now)
+    
+    def release(self, lease_token):
+        return self.db.release_validation_leases(lease_token)
@@ -0,0 +1,61 @@
+import os
+import sys
+import json
+import timeit
+import numpy as np
+
+sys.path.append(os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), 'app'))
+from utils.json_utils import convert_numpy_types, json_serialize, pack_faces, unpack_faces, orjson
+
+#micro-benchmark: old convert_numpy_types + json.dumps path vs single-pass json_serialize, and the packed
+#binary form the /api/v1/analyze endpoints send for Accept: application/octet-stream
+#run from the repo root: python benchmarks/bench_json.py
+
+EMOTIONS = ["angry", "disgust", "fear", "happy", "sad", "surprise", "neutral"]
+
+def deepface_result(n_faces):
+    #shaped like DeepFace.analyze(actions=['emotion']) output, numpy scalars included
+    rng = np.random.default_rng(0)
+    faces = []
+    for _ in range(n_faces):
+        scores = rng.random(len(EMOTIONS)).astype(np.float32)
+        scores = scores / scores.sum() * 100
+        faces.append({
+            'emotion': {emotion: scores[i] for i, emotion in enumerate(EMOTIONS)},
+            'dominant_emotion': EMOTIONS[int(np.argmax(scores))],
+            'region': {'x': np.int64(10), 'y': np.int64(20), 'w': np.int64(64), 'h': np.int64(64),
+                       'left_eye': None, 'right_eye': None},
+            'face_confidence': np.float64(0.92)
+        })
+    return faces
+
+def legacy_path(results):
+    #what an image upload used to do: convert in the model, convert again after correction, convert in json_serialize
+    results = convert_numpy_types(results)
+    results = convert_numpy_types(results)
+    return json.dumps(convert_numpy_types(results))
+
+def main():
+    number = 20000
+    print(f"orjson available: {orjson is not None}")
+    for n_faces in (1, 4, 16):
+        results = deepface_result(n_faces)
+        #orjson writes float32 at float32 precision, so compare scores approximately
+        expected, actual = json.loads(legacy_path(results)), json.loads(json_serialize(results))
+        for e, a in zip(expected, actual):
+            assert e['region'] == a['region']
+            assert np.allclose([e['emotion'][k] for k in EMOTIONS], [a['emotion'][k] for k in EMOTIONS], rtol=1e-6)
+        for e, a in zip(expected, unpack_faces(pack_faces(results, EMOTIONS), EMOTIONS)):
+            assert {k: e['region'][k] for k in ('x', 'y', 'w', 'h')} == a['region']
+            assert np.allclose([e['emotion'][k] for k in EMOTIONS], [a['emotion'][k] for k in EMOTIONS], rtol=1e-6)
+
+        legacy = min(timeit.repeat(lambda: legacy_path(results), number=number, repeat=3)) / number
+        fast = min(timeit.repeat(lambda: json_serialize(results), number=number, repeat=3)) / number
+        packed = min(timeit.repeat(lambda: pack_faces(results, EMOTIONS), number=number, repeat=3)) / number
+
+        print(f"{n_faces:>2} face(s): legacy {legacy * 1e6:8.2f} us | json_serialize {fast * 1e6:8.2f} us "
+              f"({legacy / fast:4.1f}x) | pack_faces {packed * 1e6:8.2f} us, "
+              f"{len(pack_faces(results, EMOTIONS))} bytes vs {len(json_serialize(results))} bytes JSON")
+
+if __name__ == '__main__':
+    main()
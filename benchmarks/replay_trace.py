@@ -0,0 +1,310 @@
+import os
+import sys
+import time
+import random
+import shutil
+import sqlite3
+import argparse
+import cProfile
+import tempfile
+import threading
+import contextlib
+from collections import defaultdict, Counter
+
+sys.path.append(os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), 'app'))
+from utils.db_manager import DBManager
+from utils.learning_engine import LearningEngine
+from utils.storage import LocalObjectStore, UploadStorage
+from utils.thumbnails import ThumbnailCache
+from utils.ingest import IngestService
+from utils.json_utils import json_serialize
+from utils.tracing import read_trace
+from models.text_emotion_model import TextEmotionModel
+from models.image_emotion_model import ImageEmotionModel
+
+#deterministic replay of a production trace (recorded with EMOTION_TRACE_FILE=trace.jsonl) against a scratch database
+#drives the same IngestService / DBManager / LearningEngine calls as the app, one request at a time, in recorded order
+#run from the repo root:
+#  python benchmarks/replay_trace.py trace.jsonl --speed 0 --profile cprofile,sample --out replay-out
+#  py-spy record --pid <printed pid> -o flame.svg   (start with --wait-for-attach 5 to attach before the first request)
+
+WORDS = ["the", "day", "felt", "long", "and", "quiet", "but", "then", "everything", "changed",
+         "when", "she", "laughed", "at", "nothing", "we", "were", "afraid", "of", "losing", "it"]
+
+class StageSampler:
+    #wall-clock sampling profiler for the replay thread, like py-spy but in-process
+    #writes folded stacks per stage (one "frame;frame;frame count" line per stack), which
+    #flamegraph.pl, speedscope and inferno all read
+    def __init__(self, interval=0.005):
+        self.interval = interval
+        self.stage = None
+        self.thread_id = threading.get_ident()
+        self.stacks = defaultdict(Counter)
+        self.running = False
+
+    def start(self):
+        self.running = True
+        self.worker = threading.Thread(target=self._sample, daemon=True)
+        self.worker.start()
+
+    def stop(self):
+        self.running = False
+        self.worker.join()
+
+    def _sample(self):
+        while self.running:
+            stage = self.stage
+            frame = sys._current_frames().get(self.thread_id)
+            if stage is not None and frame is not None:
+                stack = []
+                while frame is not None:
+                    code = frame.f_code
+                    stack.append(f"{code.co_name} ({os.path.basename(code.co_filename)}:{frame.f_lineno})")
+                    frame = frame.f_back
+                self.stacks[stage][';'.join(reversed(stack))] += 1
+            time.sleep(self.interval)
+
+    def write(self, out_dir):
+        for stage, stacks in self.stacks.items():
+            with open(os.path.join(out_dir, f"{stage}.folded"), 'w', encoding='utf-8') as f:
+                for stack, count in stacks.most_common():
+                    f.write(f"{stack} {count}\n")
+
+class Replayer:
+    def __init__(self, work_dir, source_uploads=None, source_db=None, profilers=(), seed=0):
+        self.work_dir = work_dir
+        self.db = DBManager(os.path.join(work_dir, 'replay.db'))
+        self.db.create_tables()
+        self.storage = UploadStorage(LocalObjectStore(work_dir), bucket='uploads')
+        self.thumbnails = ThumbnailCache(os.path.join(work_dir, 'thumbnails'))
+        self.text_model = TextEmotionModel()
+        self.image_model = ImageEmotionModel()
+        #learned layers are loaded from and saved to the scratch dir, the real data/models is never read or written
+        self.learning_engine = LearningEngine(self.db, self.text_model, self.image_model,
+                                              models_dir=os.path.join(work_dir, 'models'))
+        self.ingest = IngestService(self.db, self.storage, self.thumbnails, self.text_model, self.image_model)
+
+        #originals, looked up by content hash when replaying on a copy of production data
+        self.source_storage = UploadStorage(LocalObjectStore(os.path.dirname(source_uploads)),
+                                            bucket=os.path.basename(source_uploads)) if source_uploads else None
+        self.source_db = source_db
+        self.seed = seed
+
+        self.profilers = {} if 'cprofile' in profilers else None
+        self.sampler = StageSampler() if 'sample' in profilers else None
+        self.timings = defaultdict(list)
+        self.recorded = defaultdict(list)
+        #recorded analysis id -> replayed analysis id, so validations hit the right rows
+        self.analysis_ids = {}
+        self.synthesized = 0
+        self.skipped = Counter()
+
+    @contextlib.contextmanager
+    def stage(self, name):
+        if self.sampler:
+            self.sampler.stage = name
+        profiler = None
+        if self.profilers is not None:
+            profiler = self.profilers.setdefault(name, cProfile.Profile())
+            profiler.enable()
+        started = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.timings[name].append(time.perf_counter() - started)
+            if profiler:
+                profiler.disable()
+            if self.sampler:
+                self.sampler.stage = None
+
+    def _rng(self, event):
+        #same event -> same synthesized content on every run
+        return random.Random(f"{self.seed}:{event.get('content_hash')}:{event.get('t')}")
+
+    def _original(self, event, extension):
+        content_hash = event.get('content_hash')
+        if not content_hash:
+            return None
+        if self.source_storage:
+            try:
+                return self.source_storage.read(UploadStorage.key_for(content_hash, extension))
+            except Exception:
+                pass
+        if self.source_db:
+            conn = sqlite3.connect(self.source_db)
+            row = conn.execute("SELECT content FROM media WHERE content_hash = ? AND content IS NOT NULL LIMIT 1",
+                               (content_hash,)).fetchone()
+            conn.close()
+            if row:
+                return row[0].encode('utf-8') if isinstance(row[0], str) else row[0]
+        return None
+
+    def _text_for(self, event):
+        original = self._original(event, 'txt')
+        if original is not None:
+            return original.decode('utf-8')
+        #same byte length as the recorded text
+        self.synthesized += 1
+        rng = self._rng(event)
+        size = int(event.get('size') or 256)
+        words = []
+        length = 0
+        while length < size:
+            word = rng.choice(WORDS)
+            words.append(word)
+            length += len(word) + 1
+        return ' '.join(words)[:size]
+
+    def _image_for(self, event):
+        extension = event.get('extension', 'jpg')
+        original = self._original(event, extension)
+        if original is not None:
+            return original, extension
+        #noise image at the recorded dimensions, decode and detection cost scale with pixels
+        import io
+        import numpy as np
+        from PIL import Image
+        self.synthesized += 1
+        width = int(event.get('width') or 640)
+        height = int(event.get('height') or 480)
+        np_rng = np.random.default_rng(self._rng(event).getrandbits(32))
+        pixels = np_rng.integers(0, 256, size=(height, width, 3), dtype=np.uint8)
+        buffer = io.BytesIO()
+        Image.fromarray(pixels).save(buffer, format='PNG' if extension == 'png' else 'JPEG')
+        return buffer.getvalue(), extension
+
+    def _record_stages(self, event):
+        for name, seconds in (event.get('stages') or {}).items():
+            self.recorded[name].append(seconds)
+
+    def replay_event(self, event):
+        kind = event.get('kind')
+        if kind == 'upload_text':
+            text_content = self._text_for(event)
+            with self.stage('store'):
+                stored = self.ingest.store_text(text_content)
+            with self.stage('analyze_text'):
+                analyzed = self.ingest.analyze_text(text_content)
+            with self.stage('record'):
+                analysis_id = self.ingest.record_text(stored, analyzed)
+        elif kind == 'upload_image':
+            image_bytes, extension = self._image_for(event)
+            with self.stage('store'):
+                stored = self.ingest.store_image(image_bytes, extension)
+            with self.stage('analyze_image'):
+                raw_results = self.ingest.analyze_image(stored)
+            with self.stage('record'):
+                analysis_id = self.ingest.record_image(stored, raw_results)
+        elif kind == 'submit_validation':
+            analysis_id = self.analysis_ids.get(str(event.get('analysis_id')))
+            if analysis_id is None:
+                #the upload it validates is not in this trace
+                self.skipped[kind] += 1
+                return
+            with self.stage('validate'):
+                self.db.add_validation(analysis_id, json_serialize(event.get('emotions') or {}))
+            with self.stage('learn'):
+                if self.learning_engine.should_learn():
+                    self.learning_engine.learn()
+            self._record_stages(event)
+            return
+        else:
+            self.skipped[kind] += 1
+            return
+
+        if event.get('analysis_id') is not None:
+            self.analysis_ids[str(event['analysis_id'])] = analysis_id
+        #recorded 'analyze' is split per modality here so the two models are compared separately
+        stages = dict(event.get('stages') or {})
+        if 'analyze' in stages:
+            stages['analyze_' + kind.split('_', 1)[1]] = stages.pop('analyze')
+        self._record_stages({'stages': stages})
+
+    def run(self, events, speed=0.0):
+        #speed 0: back to back, 1: recorded pacing, 2: twice as fast...
+        if self.sampler:
+            self.sampler.start()
+        started = time.monotonic()
+        first_t = events[0].get('t', 0) if events else 0
+        try:
+            for event in events:
+                if speed > 0:
+                    due = started + (event.get('t', 0) - first_t) / speed
+                    delay = due - time.monotonic()
+                    if delay > 0:
+                        time.sleep(delay)
+                self.replay_event(event)
+            self.storage.flush()
+        finally:
+            if self.sampler:
+                self.sampler.stop()
+        return time.monotonic() - started
+
+    def write_profiles(self, out_dir):
+        os.makedirs(out_dir, exist_ok=True)
+        written = []
+        if self.profilers:
+            #pstats files, open with snakeviz / gprof2dot / flameprof
+            for name, profiler in self.profilers.items():
+                path = os.path.join(out_dir, f"{name}.prof")
+                profiler.dump_stats(path)
+                written.append(path)
+        if self.sampler:
+            self.sampler.write(out_dir)
+            written.extend(os.path.join(out_dir, f"{name}.folded") for name in self.sampler.stacks)
+        return written
+
+def _percentile(values, q):
+    values = sorted(values)
+    if not values:
+        return 0.0
+    return values[min(len(values) - 1, int(round(q * (len(values) - 1))))]
+
+def report(replayer, elapsed, n_events):
+    print(f"replayed {n_events} events in {elapsed:.2f}s ({replayer.synthesized} with synthesized content)")
+    if replayer.skipped:
+        print(f"skipped: {dict(replayer.skipped)}")
+    print(f"{'stage':<16}{'n':>6}{'mean ms':>10}{'p50 ms':>10}{'p95 ms':>10}{'max ms':>10}{'prod p95':>10}")
+    for name in sorted(replayer.timings):
+        values = replayer.timings[name]
+        recorded = replayer.recorded.get(name, [])
+        prod = f"{_percentile(recorded, 0.95) * 1000:10.1f}" if recorded else f"{'-':>10}"
+        print(f"{name:<16}{len(values):>6}{sum(values) / len(values) * 1000:10.1f}"
+              f"{_percentile(values, 0.5) * 1000:10.1f}{_percentile(values, 0.95) * 1000:10.1f}"
+              f"{max(values) * 1000:10.1f}{prod}")
+
+def main():
+    parser = argparse.ArgumentParser(description='Replay a recorded request trace and profile each stage')
+    parser.add_argument('trace', help='JSONL trace written by the app with EMOTION_TRACE_FILE set')
+    parser.add_argument('--speed', type=float, default=0.0, help='0 = back to back, 1 = recorded pacing, 2 = twice as fast')
+    parser.add_argument('--limit', type=int, default=None, help='replay only the first N events')
+    parser.add_argument('--profile', default='', help='comma separated: cprofile (per-stage .prof), sample (per-stage .folded)')
+    parser.add_argument('--out', default='replay-out', help='directory for profiles')
+    parser.add_argument('--source-uploads', default=None, help='uploads dir of the traced server, to replay real content by hash')
+    parser.add_argument('--source-db', default=None, help='database of the traced server, for texts kept inline')
+    parser.add_argument('--work-dir', default=None, help='scratch dir for the replay database and uploads (default: temp, removed)')
+    parser.add_argument('--seed', type=int, default=0)
+    parser.add_argument('--wait-for-attach', type=float, default=0.0, help='seconds to wait so an external profiler (py-spy) can attach')
+    args = parser.parse_args()
+
+    events = read_trace(args.trace)[:args.limit]
+    profilers = {p.strip() for p in args.profile.split(',') if p.strip()}
+
+    work_dir = args.work_dir or tempfile.mkdtemp(prefix='replay-')
+    try:
+        replayer = Replayer(work_dir, args.source_uploads, args.source_db, profilers, args.seed)
+
+        if args.wait_for_attach:
+            print(f"pid {os.getpid()}, starting in {args.wait_for_attach:g}s", file=sys.stderr)
+            time.sleep(args.wait_for_attach)
+
+        elapsed = replayer.run(events, args.speed)
+        report(replayer, elapsed, len(events))
+        for path in replayer.write_profiles(args.out) if profilers else []:
+            print(f"wrote {path}")
+    finally:
+        if not args.work_dir:
+            shutil.rmtree(work_dir, ignore_errors=True)
+
+if __name__ == '__main__':
+    main()
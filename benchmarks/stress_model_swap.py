@@ -0,0 +1,217 @@
+import os
+import sys
+import json
+import time
+import types
+import random
+import shutil
+import argparse
+import tempfile
+import threading
+import numpy as np
+from collections import Counter
+
+#consistency stress test for model hot-swaps: request threads run the real IngestService analyze/record path
+#while a writer thread keeps publishing, shadowing, promoting and dropping correction layers, then every stored
+#row is checked: the scores in it must come from the layer of the version recorded next to them
+#(analysis.model_version, shadow_analysis.model_version, and the sentence vectors of the same analysis)
+#run from the repo root:
+#  python benchmarks/stress_model_swap.py --seconds 10 --threads 8
+
+#only the correction / version path is under test, the base models are replaced by fixed outputs so
+#the run needs neither the transformer nor DeepFace and the database writes dominate its time
+TEXT_EMOTIONS = ["sadness", "joy", "love", "anger", "fear", "surprise"]
+text_to_emotions = types.ModuleType('text_to_emotions')
+text_to_emotions.analyze_emotions = lambda text: {emotion: 1.0 / len(TEXT_EMOTIONS) for emotion in TEXT_EMOTIONS}
+text_to_emotions.analyze_emotions_batch = lambda texts, batch_size=32: [text_to_emotions.analyze_emotions(text) for text in texts]
+sys.modules['text_to_emotions'] = text_to_emotions
+#makes the image model take its no-DeepFace branch, raw results are synthesized below
+sys.modules['image_to_emotions'] = None
+
+sys.path.append(os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), 'app'))
+from utils.db_manager import DBManager
+from utils.storage import LocalObjectStore, UploadStorage
+from utils.ingest import IngestService
+from models.text_emotion_model import TextEmotionModel
+from models.image_emotion_model import ImageEmotionModel
+
+#every layer writes a code into its output: the last emotion is a low reference score and the others are
+#high or low by the bits of the code, so the code survives clipping and renormalization
+CODES = 31
+
+class CodedLayer:
+    #linear layer (coef_/intercept_, fused by predict_layers) whose output ignores the input and spells a code
+    def __init__(self, code, n_emotions):
+        self.coef_ = np.zeros((n_emotions, n_emotions))
+        self.intercept_ = np.array([0.5 if code >> i & 1 else 0.01 for i in range(n_emotions - 1)] + [0.01])
+
+    def predict(self, features):
+        return features @ self.coef_.T + self.intercept_
+
+def decode(scores):
+    #code in a row of scores, 0 for an uncorrected (flat) row
+    scores = list(scores)
+    reference = scores[-1]
+    return sum(1 << i for i, score in enumerate(scores[:-1]) if score > reference * 10)
+
+def version_code(version):
+    #versions published here are <type>_swap<n> -> code n % CODES + 1, the initial versions have no layer
+    if '_swap' not in version:
+        return 0
+    return int(version.rsplit('_swap', 1)[1]) % CODES + 1
+
+class Writer:
+    #what the learning engine does, as fast as possible: publish live, put candidates in shadow, promote, drop
+    def __init__(self, models, pause):
+        self.models = models
+        self.pause = pause
+        self.counter = 0
+        self.swaps = Counter()
+        self.running = True
+
+    def _layer(self, model_type):
+        self.counter += 1
+        model = self.models[model_type]
+        return CodedLayer(self.counter % CODES + 1, len(model.emotions)), f"{model_type}_swap{self.counter}"
+
+    def run(self):
+        rng = random.Random(1)
+        while self.running:
+            model_type = rng.choice(('text', 'image'))
+            model = self.models[model_type]
+            action = rng.choice(('set_live', 'set_candidate', 'promote_candidate', 'clear_candidate'))
+            if action == 'set_live':
+                model.set_live(*self._layer(model_type))
+            elif action == 'set_candidate':
+                model.set_candidate(*self._layer(model_type))
+            elif action == 'promote_candidate':
+                if model.candidate_version is None:
+                    continue
+                model.promote_candidate()
+            else:
+                model.clear_candidate()
+            self.swaps[action] += 1
+            if self.pause:
+                time.sleep(self.pause)
+
+def fake_faces(rng, emotions):
+    #DeepFace-shaped raw results, flat scores so an uncorrected face decodes to 0
+    return [{'region': {'x': 10 * i, 'y': 0, 'w': 10, 'h': 10},
+             'emotion': {emotion: 100.0 / len(emotions) for emotion in emotions}}
+            for i in range(rng.randint(1, 3))]
+
+def request_loop(ingest, image_model, deadline, seed, counts):
+    rng = random.Random(seed)
+    while time.time() < deadline:
+        if rng.random() < 0.5:
+            text = f"Request {seed}-{counts['text']}. It went fine! Or did it?"
+            stored = ingest.store_text(text)
+            ingest.record_text(stored, ingest.analyze_text(text))
+            counts['text'] += 1
+        else:
+            key = f"stress/{seed}-{counts['image']}.jpg"
+            stored = {'key': key, 'path': os.path.join('uploads', key), 'hash': key}
+            ingest.record_image(stored, fake_faces(rng, image_model.emotions))
+            counts['image'] += 1
+
+def check(db):
+    #every stored result against the version stored with it, returns Counter of checked rows and of mismatches
+    checked = Counter()
+    mismatches = Counter()
+    conn = db.get_connection()
+    cursor = conn.cursor()
+
+    def rows_of(media_type, emotion_data):
+        data = json.loads(emotion_data)
+        if media_type == 'text':
+            return [[data[emotion] for emotion in TEXT_EMOTIONS]]
+        return [list(face['emotion'].values()) for face in data]
+
+    cursor.execute("""
+    SELECT m.type, a.model_version, a.emotion_data FROM analysis a JOIN media m ON a.media_id = m.id
+    """)
+    for media_type, version, emotion_data in cursor.fetchall():
+        for row in rows_of(media_type, emotion_data):
+            checked[f'{media_type} live'] += 1
+            if decode(row) != version_code(version):
+                mismatches[f'{media_type} live'] += 1
+
+    cursor.execute("""
+    SELECT m.type, s.model_version, s.emotion_data FROM shadow_analysis s
+    JOIN analysis a ON s.analysis_id = a.id JOIN media m ON a.media_id = m.id
+    """)
+    for media_type, version, emotion_data in cursor.fetchall():
+        for row in rows_of(media_type, emotion_data):
+            checked[f'{media_type} shadow'] += 1
+            if decode(row) != version_code(version):
+                mismatches[f'{media_type} shadow'] += 1
+
+    cursor.execute("""
+    SELECT a.model_version, v.vector FROM sentence_vectors v
+    JOIN sentences s ON v.sentence_id = s.id JOIN analysis a ON s.analysis_id = a.id
+    """)
+    for version, vector in cursor.fetchall():
+        checked['text sentences'] += 1
+        if decode(np.frombuffer(vector, dtype=np.float32)) != version_code(version):
+            mismatches['text sentences'] += 1
+
+    conn.close()
+    return checked, mismatches
+
+def main():
+    parser = argparse.ArgumentParser(description='Hammer concurrent analyze/record against model hot-swaps and check every stored row.')
+    parser.add_argument('--seconds', type=float, default=10.0)
+    parser.add_argument('--threads', type=int, default=8, help='concurrent request threads')
+    parser.add_argument('--swap-pause', type=float, default=0.0, help='seconds between swaps, 0 swaps back to back')
+    parser.add_argument('--keep', action='store_true', help='keep the scratch directory')
+    args = parser.parse_args()
+
+    #the interpreter switches threads every 5ms by default, switch far more often so races actually show up
+    sys.setswitchinterval(1e-6)
+
+    work_dir = tempfile.mkdtemp(prefix='stress-swap-')
+    try:
+        db = DBManager(os.path.join(work_dir, 'stress.db'))
+        db.create_tables()
+        storage = UploadStorage(LocalObjectStore(work_dir), bucket='uploads')
+        text_model = TextEmotionModel()
+        image_model = ImageEmotionModel()
+        ingest = IngestService(db, storage, None, text_model, image_model)
+
+        writer = Writer({'text': text_model, 'image': image_model}, args.swap_pause)
+        writer_thread = threading.Thread(target=writer.run, daemon=True)
+        counts = [Counter() for _ in range(args.threads)]
+        deadline = time.time() + args.seconds
+        threads = [threading.Thread(target=request_loop, args=(ingest, image_model, deadline, seed, counts[seed]))
+                   for seed in range(args.threads)]
+
+        started = time.perf_counter()
+        writer_thread.start()
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+        writer.running = False
+        writer_thread.join()
+        elapsed = time.perf_counter() - started
+
+        requests = sum(counts, Counter())
+        print(f"{sum(requests.values())} requests ({requests['text']} text, {requests['image']} image) in {elapsed:.1f}s "
+              f"across {args.threads} threads")
+        print(f"{sum(writer.swaps.values())} swaps: " + ', '.join(f"{action} {n}" for action, n in sorted(writer.swaps.items())))
+
+        checked, mismatches = check(db)
+        for kind in sorted(checked):
+            print(f"  {kind}: {checked[kind]} rows checked, {mismatches[kind]} inconsistent")
+        if sum(mismatches.values()):
+            print("FAIL: results recorded under a version whose layer did not produce them")
+            sys.exit(1)
+        print("OK: every result matches the version recorded with it")
+    finally:
+        if args.keep:
+            print(f"Scratch data in {work_dir}")
+        else:
+            shutil.rmtree(work_dir, ignore_errors=True)
+
+if __name__ == '__main__':
+    main()
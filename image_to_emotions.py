@@ -1,10 +1,18 @@
 import os
-import cv2
-import matplotlib.pyplot as plt
+import sys
+import glob
+import time
 from deepface import DeepFace
 from PIL import Image, ImageDraw, ImageFont
 import numpy as np
 import argparse
+import contextlib
+
+sys.path.append(os.path.join(os.path.dirname(os.path.abspath(__file__)), 'app'))
+from utils.image_preprocess import load_for_detection, scale_regions
+from utils.json_utils import json_serialize
+
+IMAGE_EXTENSIONS = ('.jpg', '.jpeg', '.png')
 
 #analyzes emotions in faces found in given image
 #[inputs] image_path (str): path to image file
@@ -15,16 +23,15 @@ def analyze_image_emotions(image_path):
             print(f"Error: file '{image_path}' not found.")
             return None
         
-        img = cv2.imread(image_path)
+        #large JPEGs are decoded at 1/2, 1/4 or 1/8 scale, regions are mapped back below
+        img, factor = load_for_detection(image_path)
         if img is None:
             print(f"Error: can't read image '{image_path}'.")
             return None
-            
-        #convert BGR to RGB since DeepFace works with RGB
-        rgb_img = cv2.cvtColor(img, cv2.COLOR_BGR2RGB)
         
+        #DeepFace expects OpenCV's BGR order for numpy input, so the decoded image goes in as is
         analysis_results = DeepFace.analyze(
-            img_path=rgb_img,
+            img_path=img,
             actions=['emotion'],
             enforce_detection=False, 
             detector_backend='opencv'
@@ -33,7 +40,7 @@ def analyze_image_emotions(image_path):
         if isinstance(analysis_results, dict):
             analysis_results = [analysis_results]
             
-        return analysis_results
+        return scale_regions(analysis_results, factor)
         
     except Exception as e:
         print(f"error occurred: {e}")
@@ -44,6 +51,9 @@ def analyze_image_emotions(image_path):
 #[outputs] none, saves & displays visualization
 def visualize_emotions(image_path, analysis_results):
 
+    #matplotlib only loads when a chart is asked for, batch runs stay headless
+    import matplotlib.pyplot as plt
+
     img = Image.open(image_path)
     draw = ImageDraw.Draw(img)
     
@@ -89,6 +99,8 @@ def visualize_emotions(image_path, analysis_results):
 #[inputs] anlaysis_results (list): list of analysis results from DeepFace
 #[outputs] none, displays charts
 def visualize_emotion_chart(analysis_results):
+    import matplotlib.pyplot as plt
+
     n_faces = len(analysis_results)
     
     if n_faces == 0:
@@ -121,17 +133,98 @@ def visualize_emotion_chart(analysis_results):
     print("Emotion charts saved as 'emotion_charts.png'")
     plt.show()
 
+#yield image paths lazily from glob patterns / directories and a file listing one path per line
+#[inputs] patterns (list of str), files_from (str, path or '-' for stdin)
+#[outputs] generator of image paths
+def iter_image_paths(patterns=(), files_from=None):
+
+    for pattern in patterns:
+        if os.path.isdir(pattern):
+            pattern = os.path.join(pattern, '**', '*')
+        paths = sorted(path for path in glob.glob(pattern, recursive=True) if path.lower().endswith(IMAGE_EXTENSIONS))
+        if not paths:
+            print(f"warning: no images match '{pattern}'", file=sys.stderr)
+        yield from paths
+    
+    if files_from:
+        f = sys.stdin if files_from == '-' else open(files_from, 'r', encoding='utf-8')
+        try:
+            for line in f:
+                path = line.strip()
+                if path:
+                    yield path
+        finally:
+            if f is not sys.stdin:
+                f.close()
+
+#analyze a stream of images one at a time and write one JSON line per image
+#memory stays at one decoded image, DeepFace keeps its models loaded between calls
+#[inputs] paths (iterable of str), out (file)
+#[outputs] (number of images, number of errors)
+def run_batch(paths, out=sys.stdout, progress_every=100):
+
+    started = time.perf_counter()
+    processed = 0
+    faces = 0
+    errors = 0
+    
+    for path in paths:
+        analysis_results = analyze_image_emotions(path)
+        if analysis_results is None:
+            errors += 1
+            record = {'path': path, 'error': 'analysis failed'}
+        else:
+            faces += len(analysis_results)
+            record = {'path': path, 'faces': [
+                {
+                    'region': result.get('region'),
+                    'dominant_emotion': max(result.get('emotion', {'neutral': 0}).items(), key=lambda x: x[1])[0],
+                    'emotion': result.get('emotion', {})
+                }
+                for result in analysis_results
+            ]}
+        out.write(json_serialize(record) + '\n')
+        out.flush()
+        
+        processed += 1
+        if progress_every and processed % progress_every == 0:
+            report_throughput(processed, faces, errors, time.perf_counter() - started)
+    
+    report_throughput(processed, faces, errors, time.perf_counter() - started)
+    return processed, errors
+
+#throughput summary on stderr so stdout stays pure JSONL
+def report_throughput(processed, faces, errors, elapsed):
+
+    rate = processed / elapsed if elapsed > 0 else 0.0
+    print(f"{processed} images, {faces} faces, {errors} errors in {elapsed:.1f}s ({rate:.2f} images/s)", file=sys.stderr)
+
 #main fn to analyze emotions in image
 def main():
 
-    parser = argparse.ArgumentParser(description='Analyze emotions in an image.')
-    parser.add_argument('image_path', type=str, help='Path to the image file')
+    parser = argparse.ArgumentParser(description='Analyze emotions in images. One image prints a readable report, several stream JSONL.')
+    parser.add_argument('image_paths', nargs='*', help='image files, directories or glob patterns (quote them, ** is recursive)')
+    parser.add_argument('--files-from', help="file listing one image path per line, '-' for stdin")
+    parser.add_argument('--jsonl', action='store_true', help='JSONL output even for a single image')
+    parser.add_argument('--plot', action='store_true', help='save and show the annotated image and charts (single image only)')
 
     args = parser.parse_args()
     
-    print(f"analyzing emotions in image: {args.image_path}")
+    single = len(args.image_paths) == 1 and os.path.isfile(args.image_paths[0]) and not args.files_from
+    if not single or args.jsonl:
+        if not args.image_paths and not args.files_from:
+            parser.error('give at least one image path or --files-from')
+        #batch mode: JSONL results on stdout, progress on stderr
+        #stray prints from the model libraries go to stderr, stdout only carries results
+        out = sys.stdout
+        with contextlib.redirect_stdout(sys.stderr):
+            _, errors = run_batch(iter_image_paths(args.image_paths, args.files_from), out=out)
+        sys.exit(1 if errors else 0)
+    
+    image_path = args.image_paths[0]
+    print(f"analyzing emotions in image: {image_path}")
     
-    analysis_results = analyze_image_emotions(args.image_path)
+    analysis_results = analyze_image_emotions(image_path)
     
     if analysis_results:
         print(f"\nFound {len(analysis_results)} face(s) in the image.")
@@ -146,8 +239,9 @@ def main():
             for emotion, score in sorted(emotions.items(), key=lambda x: x[1], reverse=True):
                 print(f"  {emotion}: {score:.2f}%")
         
-        visualize_emotions(args.image_path, analysis_results)
-        visualize_emotion_chart(analysis_results)
+        if args.plot:
+            visualize_emotions(image_path, analysis_results)
+            visualize_emotion_chart(analysis_results)
     else:
         print("No analysis results to display.")
 
@@ -1,16 +1,32 @@
 
+import os
+import sys
+import glob
+import json
+import time
+import argparse
+import contextlib
+import itertools
 import torch
 from transformers import pipeline
-import matplotlib.pyplot as plt
+
+_emotion_classifier = None
+
+#pretrained classifier, loaded once per process instead of on every call
+def get_emotion_classifier():
+    global _emotion_classifier
+    if _emotion_classifier is None:
+        _emotion_classifier = pipeline('text-classification', 
+                                       model='bhadresh-savani/distilbert-base-uncased-emotion', 
+                                       return_all_scores=True)
+    return _emotion_classifier
 
 #analyze emotions in given text using pretrained transformer model
 #[inputs] text (str): story prompt text to analyze
 #[ouputs] dict of emotions and their scores
 def analyze_emotions(text):
 
-    emotion_classifier = pipeline('text-classification', 
-                                 model='bhadresh-savani/distilbert-base-uncased-emotion', 
-                                 return_all_scores=True)
+    emotion_classifier = get_emotion_classifier()
     
     results = emotion_classifier(text)
     
@@ -20,10 +36,25 @@ def analyze_emotions(text):
     
     return sorted_emotions
 
+#analyze many short texts (e.g. the sentences of one story) in padded batches
+#[inputs] texts (list of str), batch_size (int): texts per forward pass
+#[outputs] list of dicts of emotions and their scores, same order as texts
+def analyze_emotions_batch(texts, batch_size=32):
+
+    if not texts:
+        return []
+    
+    results = get_emotion_classifier()(list(texts), batch_size=batch_size, truncation=True)
+    
+    return [{item['label']: item['score'] for item in result} for result in results]
+
 #visualize emotions as bar chart
 #[inputs] emotions (dict): dict of emotoins and their scores
 def visualize_emotions(emotions):
 
+    #matplotlib only loads when a chart is asked for, batch runs stay headless
+    import matplotlib.pyplot as plt
+    
     plt.figure(figsize=(10, 6))
     
     bars = plt.bar(emotions.keys(), emotions.values(), color='skyblue')
@@ -57,9 +88,113 @@ def read_multiline_input():
     text = "She stood frozen, her breath catching in her throat, each exhale forming fragile clouds in the cold morning air. Her outstretched hand trembled, fingers grasping at the empty space where moments ago, something—someone—had been. The sirens had faded, swallowed by the stillness of the street, leaving only the quiet creak of the wooden porch beneath her bare feet. The world felt too vast, too indifferent. The neighbors’ windows remained dark, their curtains drawn, as if the entire street had turned its back on her grief. The open door behind her yawned, a silent, hollow thing, whispering of absence. She could still hear the echoes of hurried voices, the rustling of stretcher wheels against the floor, the muffled plea of her own voice—“Please, wait. Just one more second.” But there were no more seconds. No more time. A gust of wind cut through the thin fabric of her nightshirt, but she barely felt it. Fear had rooted itself deep inside her chest, coiling like a living thing, tightening with every breath. It wasn’t just fear of what had happened. It was fear of what came next. Of walking back inside. Of facing the silence. Of realizing that the emptiness stretching out before her was not just in the house, not just in the street, but in her life itself."  
     return text
 
+#yield (id, text) pairs lazily from files matching glob patterns, a JSONL file and/or stdin lines
+#[inputs] patterns (list of str), jsonl (str, path or '-' for stdin), lines (bool): one text per stdin line
+#[outputs] generator of (id, text), only the current batch is ever held in memory
+def iter_inputs(patterns=(), jsonl=None, lines=False, text_field='text'):
+
+    for pattern in patterns:
+        paths = sorted(glob.glob(pattern, recursive=True))
+        if not paths:
+            print(f"warning: no files match '{pattern}'", file=sys.stderr)
+        for path in paths:
+            if os.path.isfile(path):
+                with open(path, 'r', encoding='utf-8', errors='replace') as f:
+                    yield path, f.read()
+    
+    if jsonl:
+        f = sys.stdin if jsonl == '-' else open(jsonl, 'r', encoding='utf-8')
+        try:
+            for line_number, line in enumerate(f, 1):
+                if not line.strip():
+                    continue
+                try:
+                    record = json.loads(line)
+                    text = record[text_field]
+                except (ValueError, KeyError, TypeError):
+                    print(f"warning: skipping line {line_number}, no '{text_field}' field", file=sys.stderr)
+                    continue
+                yield record.get('id', line_number), text
+        finally:
+            if f is not sys.stdin:
+                f.close()
+    
+    if lines:
+        for line_number, line in enumerate(sys.stdin, 1):
+            text = line.rstrip('\n')
+            if text.strip():
+                yield line_number, text
+
+#analyze a stream of texts in batches and write one JSON line per text
+#[inputs] inputs (iterable of (id, text)), batch_size (int), out (file)
+#[outputs] (number of texts, number of errors)
+def run_batch(inputs, batch_size=32, out=sys.stdout, progress_every=1000):
+
+    started = time.perf_counter()
+    processed = 0
+    errors = 0
+    inputs = iter(inputs)
+    
+    while True:
+        batch = list(itertools.islice(inputs, batch_size))
+        if not batch:
+            break
+        
+        try:
+            results = analyze_emotions_batch([text for _, text in batch], batch_size)
+        except Exception:
+            #find the bad input(s) instead of losing the whole batch
+            results = []
+            for _, text in batch:
+                try:
+                    results.append(analyze_emotions_batch([text], 1)[0])
+                except Exception as e:
+                    results.append(e)
+        
+        for (item_id, _), emotions in zip(batch, results):
+            if isinstance(emotions, Exception):
+                errors += 1
+                record = {'id': item_id, 'error': str(emotions)}
+            else:
+                record = {'id': item_id, 'dominant': max(emotions, key=emotions.get), 'emotions': emotions}
+            out.write(json.dumps(record) + '\n')
+        out.flush()
+        
+        previous = processed
+        processed += len(batch)
+        if progress_every and processed // progress_every > previous // progress_every:
+            report_throughput(processed, errors, time.perf_counter() - started)
+    
+    report_throughput(processed, errors, time.perf_counter() - started)
+    return processed, errors
+
+#throughput summary on stderr so stdout stays pure JSONL
+def report_throughput(processed, errors, elapsed):
+
+    rate = processed / elapsed if elapsed > 0 else 0.0
+    print(f"{processed} texts, {errors} errors in {elapsed:.1f}s ({rate:.1f} texts/s)", file=sys.stderr)
+
 #main fn to analyze story prompt for emotions
 def main():
 
+    parser = argparse.ArgumentParser(description='Analyze emotions in text. With no inputs, analyzes the built-in story prompt.')
+    parser.add_argument('patterns', nargs='*', help='text files or glob patterns (quote them, ** is recursive), one text per file')
+    parser.add_argument('--jsonl', help="JSONL file of records with a text field (and optional id), '-' for stdin")
+    parser.add_argument('--lines', action='store_true', help='read stdin, one text per line')
+    parser.add_argument('--text-field', default='text', help='field holding the text in --jsonl records')
+    parser.add_argument('--batch-size', type=int, default=32, help='texts per forward pass')
+    parser.add_argument('--plot', action='store_true', help='save and show a bar chart (built-in story only)')
+    args = parser.parse_args()
+    
+    if args.patterns or args.jsonl or args.lines:
+        #batch mode: JSONL results on stdout, progress on stderr
+        #stray prints from the model libraries go to stderr, stdout only carries results
+        out = sys.stdout
+        with contextlib.redirect_stdout(sys.stderr):
+            get_emotion_classifier()
+            _, errors = run_batch(iter_inputs(args.patterns, args.jsonl, args.lines, args.text_field), args.batch_size, out)
+        sys.exit(1 if errors else 0)
+
     print("Story Prompt Emotion Analyzer")
     print("-----------------------------")
     
@@ -77,8 +212,9 @@ def main():
         for emotion, score in emotions.items():
             print(f"{emotion}: {score:.4f}")
         
-        visualize_emotions(emotions)
-        print("\nA visualization has been saved as 'emotion_analysis.png'")
+        if args.plot:
+            visualize_emotions(emotions)
+            print("\nA visualization has been saved as 'emotion_analysis.png'")
         
     except Exception as e:
         print(f"An error occurred: {e}")